@@ -2,12 +2,14 @@ import os
 import uuid
 import logging
 import time
-import shutil
 from datetime import datetime
+
+# Medir o tempo de inicialização da aplicação
+_startup_start = time.time()
+
 from flask import Flask, request, render_template, send_file, redirect, url_for, flash, jsonify
 from werkzeug.utils import secure_filename
-from pydub import AudioSegment
-from models.database import get_db_connection
+from werkzeug.exceptions import HTTPException
 from pydub.utils import get_encoder_name
 
 # Configuração de logging
@@ -19,30 +21,72 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # Para mensagens flash
 app.config['UPLOAD_FOLDER'] = "uploads"
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # Limite de 50MB para upload
+app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # Limite de 50MB por requisição (formulário ou bloco de /uploads)
+
+# Transcrições por página no histórico
+TRANSCRIPTIONS_PAGE_SIZE = int(os.getenv("TRANSCRIPTIONS_PAGE_SIZE", "50"))
 
 # Criar pastas necessárias
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs("output", exist_ok=True)
 
 # Importar módulos
-from models.database import init_db, save_transcription, get_transcription, get_all_transcriptions, update_transcription
-from services.audio_processing import get_audio_info, cleanup_segments
-from services.transcribe import transcribe_audio_file
-from utils.formatters import create_docx, create_txt, create_transcript_folder, format_file_size, format_timestamp, format_duration
+from models.database import init_db, get_transcription, list_transcriptions_page, search_transcriptions, SORTABLE_COLUMNS, update_transcription, create_job, get_job, get_upload, complete_upload, get_recording, complete_recording, get_cache_stats, get_utterances, get_speakers, get_artifacts
+from models.utterance import Utterance
+from services.audio_processing import get_audio_info, FFPROBE_AVAILABLE
+from services.audio_serving import resolve_audio_file, send_audio_file, invalidate_audio_files, AUDIO_MIME_TYPES
+from services.backfill import BACKFILL_ON_STARTUP, start_backfill_thread
+from services.jobs import JobQueue
+from services.nlp_models import registry as nlp_registry, NLP_PREWARM
+from services.pipeline import process_transcription_job
+from services.transcript_cache import save_upload_with_hash
+from services.recordings import RECORDING_EXTENSIONS, RecordingConflictError, create_live_recording, append_recording_chunk, finish_live_recording, discard_recording
+from services.uploads import UPLOAD_MAX_SIZE, UploadConflictError, create_resumable_upload, write_upload_chunk, finish_upload, discard_upload
+from utils.metrics import span, render_metrics, PROMETHEUS_CONTENT_TYPE
+from utils.profiling import PROFILE_TOKEN, init_profiling, is_profile_admin, login_profile_admin, list_profiles, profile_path, profile_summary
+from utils.formatters import export_docx, export_meta_info, highlight_snippet, create_txt, create_transcript_folder, format_file_size, format_timestamp, format_duration, date_filter_epoch
 
 # Inicializar o banco de dados
 init_db()
 
+# Fila de jobs do pipeline de transcrição (workers configuráveis via TRANSCRIPTION_WORKERS)
+job_queue = JobQueue(process_transcription_job)
+
+# Profiling sob demanda (PROFILE_TOKEN) ou por amostragem (PROFILE_SAMPLE_RATE)
+init_profiling(app)
+
 # Adicione após as imports iniciais
 if "ffmpeg" not in get_encoder_name():
     raise RuntimeError("FFmpeg não está instalado corretamente. Execute: choco install ffmpeg")
+if not FFPROBE_AVAILABLE:
+    logger.warning("ffprobe não encontrado: os metadados do áudio serão lidos pela saída de 'ffmpeg -i'")
+
+logger.info(f"Aplicação inicializada em {time.time() - _startup_start:.2f} segundos")
+
+_prewarm_started = False
+_backfill_started = False
+
+@app.before_request
+def start_job_workers():
+    global _prewarm_started, _backfill_started
+    # Iniciar os workers no primeiro request, evitando que o processo
+    # monitor do reloader do Flask também processe jobs
+    job_queue.ensure_started()
+    
+    # Pré-carregar os modelos de NLP em segundo plano, se configurado
+    if NLP_PREWARM and not _prewarm_started:
+        _prewarm_started = True
+        nlp_registry.prewarm()
+    
+    # Preencher colunas derivadas das transcrições antigas, se configurado
+    if BACKFILL_ON_STARTUP and not _backfill_started:
+        _backfill_started = True
+        start_backfill_thread()
 
 # Rotas do Flask
 @app.route("/", methods=["GET", "POST"])
 def upload_file():
     if request.method == "POST":
-        start_time = time.time()
         logger.info("Iniciando processamento de upload")
         
         # Verificar se o arquivo foi enviado
@@ -56,192 +100,320 @@ def upload_file():
         split_audio = request.form.get("split_audio", "on") == "on"
         
         # Validar o nome do projeto e descrição
-        if not project_name or len(project_name) < 10:
-            flash("O nome do depoimento deve ter pelo menos 10 caracteres", "error")
-            return redirect(request.url)
-            
-        if not description or len(description) < 10:
-            flash("A descrição deve ter pelo menos 10 caracteres", "error")
+        error = validate_upload_metadata(project_name, description)
+        if error:
+            flash(error, "error")
             return redirect(request.url)
         
-        # Simplificar os parâmetros de tempo do áudio
-        audio_start = 0
-        audio_end = 0
-        
         # Verificar se o arquivo tem um nome
         if file.filename == "":
             flash("Nenhum arquivo selecionado", "error")
             return redirect(request.url)
         
-        # Salvar o arquivo - usar um nome temporário para reduzir colisões
-        filename = secure_filename(file.filename)
-        temp_filename = f"temp_{int(time.time())}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-        file.save(file_path)
-        
-        # Log após salvar arquivo
-        file_save_time = time.time() - start_time
-        logger.info(f"Arquivo salvo em {file_save_time:.2f} segundos")
-        
-        # Inicializar variáveis com valores padrão
-        audio_duration = 0
-        estimated_cost = 0.0
-        
-        # Obter informações do arquivo de forma simplificada
-        try:
-            file_size = os.path.getsize(file_path)
-            # Obter duração de forma simplificada
-            audio = AudioSegment.from_file(file_path)
-            audio_duration = len(audio) / 1000
-            if audio_duration == 0:
-                raise ValueError("Duração do áudio não pode ser zero")
-            # Calcular custo estimado inicial
-            estimated_cost = audio_duration * (0.37 / 3600)
-        except Exception as e:
-            logger.error(f"Falha crítica no processamento do áudio: {e}")
-            flash("Arquivo de áudio inválido ou corrompido", "error")
-            return redirect(request.url)
-        
-        # Gerar ID único para a transcrição
+        # Gerar IDs únicos para a transcrição e para o job
         trans_id = str(uuid.uuid4())
+        job_id = str(uuid.uuid4())
         
-        # Criar pasta para a transcrição
-        folder_path = create_transcript_folder(trans_id, project_name)
+        # Salvar o arquivo - usar o ID do job no nome para evitar colisões
+        filename = secure_filename(file.filename)
+        temp_filename = f"temp_{job_id[:8]}_{filename}"
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
+        # Calcular o SHA-256 durante a gravação, para o cache de transcrições
+        with span("save") as save_span:
+            audio_hash = save_upload_with_hash(file, file_path)
+        logger.info(f"Arquivo salvo em {save_span.duration:.2f} segundos")
+        
+        # Registrar o job e enfileirar; o processamento acontece nos workers
+        payload = {
+            'file_path': file_path,
+            'filename': filename,
+            'project_name': project_name,
+            'description': description,
+            'split_audio': split_audio,
+            'transcription_options': {},
+            'audio_hash': audio_hash
+        }
         
-        # Processar o áudio
-        try:
-            # Log antes da transcrição
-            pre_transcription_time = time.time() - start_time
-            logger.info(f"Pré-processamento completo em {pre_transcription_time:.2f} segundos")
-            
-            # Transcrever o áudio com parâmetros otimizados
-            transcription_options = {}
-            if audio_start > 0 or audio_end > 0:
-                transcription_options = {
-                    'audio_start_from': audio_start,
-                    'audio_end_at': audio_end
-                }
-            
-            # Chamar função de transcrição
-            transcribe_start = time.time()
-            result = transcribe_audio_file(file_path, split=split_audio, transcription_options=transcription_options)
-            transcription = result['text']
-            speakers_count = result['speakers_count']
-            
-            # Atualizar a duração e o custo se disponível na API
-            if 'audio_duration' in result:
-                audio_duration = result['audio_duration']
-                estimated_cost = audio_duration * (0.37 / 3600)
-                logger.info(f"Duração do áudio obtida da API: {audio_duration} segundos")
-            else:
-                # Se a API não retornar a duração, usar o valor calculado anteriormente
-                logger.info(f"Usando duração do áudio calculada localmente: {audio_duration} segundos")
-            
-            # Log após transcrição
-            transcribe_time = time.time() - transcribe_start
-            logger.info(f"Transcrição concluída em {transcribe_time:.2f} segundos")
-            
-            # Copiar o arquivo de áudio para a pasta da transcrição
-            audio_filename = copy_audio_to_transcript_folder(file_path, folder_path, filename)
-            
-            # Salvar transcrição no banco de dados
-            db_start = time.time()
-            if not transcription or len(transcription.strip()) == 0:
-                logger.error("Transcrição vazia ou inválida")
-                flash("Erro: A transcrição está vazia", "error")
-                return redirect(request.url)
-            
-            save_transcription(
-                trans_id=trans_id,
-                filename=filename,
-                project_name=project_name,
-                description=description,
-                transcription=transcription,
-                folder_path=folder_path,
-                file_size=file_size,
-                speakers_count=speakers_count,
-                audio_duration=audio_duration,
-                estimated_cost=estimated_cost
-            )
-            
-            # Atualizar o caminho do áudio no banco de dados
-            if audio_filename:
-                try:
-                    with get_db_connection() as conn:
-                        cursor = conn.cursor()
-                        cursor.execute("UPDATE transcriptions SET audio_path = ? WHERE id = ?", 
-                                     (audio_filename, trans_id))
-                        conn.commit()
-                except Exception as e:
-                    logger.warning(f"Não foi possível atualizar o caminho do áudio no banco: {e}")
-            
-            # Log após salvar no banco
-            db_time = time.time() - db_start
-            logger.info(f"Salvo no banco em {db_time:.2f} segundos")
-            
-            # Gerar arquivos para download
-            dialogue = transcription.split("\n\n")
-            
-            # Preparar meta_info
-            meta_info = {
-                'created_at': format_timestamp(datetime.now()),
-                'project': project_name,
-                'filename': filename,
-                'audio_duration': format_duration(audio_duration),
-                'speakers_count': speakers_count
-            }
-            
-            # DOCX
-            docx_start = time.time()
-            docx_path = os.path.join(folder_path, "transcricao.docx")
-            create_docx(dialogue, docx_path, project_name, description, meta_info)
-            docx_time = time.time() - docx_start
-            logger.info(f"DOCX gerado em {docx_time:.2f} segundos")
-            
-            # TXT - simplificado e mais rápido
-            txt_start = time.time()
-            txt_path = os.path.join(folder_path, "transcricao.txt")
-            with open(txt_path, 'w', encoding='utf-8') as f:
-                f.write(transcription)
-            txt_time = time.time() - txt_start
-            logger.info(f"TXT gerado em {txt_time:.2f} segundos")
-            
-            # Limpar arquivos temporários
+        if not submit_transcription_job(job_id, trans_id, payload):
             try:
-                # Remover arquivo de áudio temporário
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                # Limpar segmentos se houver
-                cleanup_segments(app.config['UPLOAD_FOLDER'])
-            except Exception as cleanup_error:
-                logger.warning(f"Erro na limpeza de arquivos temporários: {cleanup_error}")
-            
-            # Tempo total de processamento
-            total_time = time.time() - start_time
-            logger.info(f"Processamento completo em {total_time:.2f} segundos")
-            
-            flash("Transcrição concluída com sucesso!", "success")
-            return redirect(url_for("view_transcription", trans_id=trans_id))
-        
-        except Exception as e:
-            logger.error(f"Erro ao processar arquivo: {e}")
-            # Tentar limpar arquivos temporários em caso de erro
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
+                os.remove(file_path)
+            except OSError:
                 pass
-            flash(f"Erro ao processar arquivo: {str(e)}", "error")
+            flash("Erro ao registrar o processamento do arquivo", "error")
             return redirect(request.url)
+        
+        return redirect(url_for("view_job", job_id=job_id))
     
-    return render_template("upload.html")
+    return render_template("upload.html", upload_max_size=format_file_size(UPLOAD_MAX_SIZE))
+
+def submit_transcription_job(job_id, trans_id, payload):
+    """
+    Registra o job e o coloca na fila dos workers
+    """
+    if not create_job(job_id, trans_id, payload):
+        return False
+    job_queue.submit(job_id)
+    return True
+
+def validate_upload_metadata(project_name, description):
+    """
+    Valida o nome do depoimento e a descrição. Retorna a mensagem de erro ou None
+    """
+    if not project_name or len(project_name) < 10:
+        return "O nome do depoimento deve ter pelo menos 10 caracteres"
+    if not description or len(description) < 10:
+        return "A descrição deve ter pelo menos 10 caracteres"
+    return None
+
+def _upload_status_headers(upload):
+    return {
+        'Upload-Offset': str(upload['received']),
+        'Upload-Length': str(upload['total_size']),
+        'Cache-Control': "no-store"
+    }
+
+# Envio retomável em partes (no estilo do protocolo tus): POST cria o envio,
+# PATCH grava cada bloco a partir de Upload-Offset e HEAD informa o offset atual
+# para retomar depois de uma queda de conexão
+@app.route("/uploads", methods=["POST"])
+def create_resumable_upload_route():
+    data = request.get_json(silent=True) or {}
+    total_size = request.headers.get("Upload-Length", type=int)
+    project_name = data.get("project_name", "")
+    description = data.get("description", "")
+    split_audio = bool(data.get("split_audio", True))
+    filename = secure_filename(data.get("filename", ""))
+    
+    if total_size is None:
+        return jsonify({"error": "Cabeçalho Upload-Length obrigatório"}), 400
+    if not filename:
+        return jsonify({"error": "Nenhum arquivo selecionado"}), 400
+    error = validate_upload_metadata(project_name, description)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    # O ID do envio é o ID do job; o arquivo é gravado direto no caminho temporário do job
+    job_id = str(uuid.uuid4())
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{job_id[:8]}_{filename}")
+    metadata = {
+        'project_name': project_name,
+        'description': description,
+        'split_audio': split_audio
+    }
+    
+    try:
+        upload = create_resumable_upload(job_id, filename, file_path, total_size, metadata)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413 if total_size > UPLOAD_MAX_SIZE else 400
+    except Exception as e:
+        logger.error(f"Erro ao criar envio: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    response = jsonify({'id': job_id, 'offset': 0})
+    response.status_code = 201
+    response.headers.update(_upload_status_headers(upload))
+    response.headers['Location'] = url_for("resumable_upload", upload_id=job_id)
+    return response
+
+@app.route("/uploads/<upload_id>", methods=["HEAD", "PATCH"])
+def resumable_upload(upload_id):
+    upload = get_upload(upload_id)
+    if not upload:
+        return jsonify({"error": "Envio não encontrado"}), 404
+    
+    if request.method == "HEAD":
+        return "", 200, _upload_status_headers(upload)
+    
+    if request.mimetype != "application/offset+octet-stream":
+        return jsonify({"error": "Content-Type deve ser application/offset+octet-stream"}), 415
+    offset = request.headers.get("Upload-Offset", type=int)
+    if offset is None:
+        return jsonify({"error": "Cabeçalho Upload-Offset obrigatório"}), 400
+    
+    try:
+        with span("upload_chunk"):
+            received = write_upload_chunk(upload, offset, request.stream)
+    except UploadConflictError as e:
+        current = get_upload(upload_id) or upload
+        return jsonify({"error": str(e)}), 409, _upload_status_headers(current)
+    
+    upload['received'] = received
+    headers = _upload_status_headers(upload)
+    if received < upload['total_size']:
+        return "", 204, headers
+    
+    # Último bloco: o hash já foi calculado durante o envio e o cabeçalho é lido
+    # agora, com o arquivo completo; o job vai para a fila sem nova passada pelo arquivo
+    try:
+        audio_hash, audio_info = finish_upload(upload)
+    except ValueError as e:
+        discard_upload(upload)
+        return jsonify({"error": str(e)}), 415
+    
+    metadata = upload['metadata']
+    payload = {
+        'file_path': upload['file_path'],
+        'filename': upload['filename'],
+        'project_name': metadata['project_name'],
+        'description': metadata['description'],
+        'split_audio': metadata.get('split_audio', True),
+        'transcription_options': {},
+        'audio_hash': audio_hash,
+        'audio_info': audio_info
+    }
+    if not submit_transcription_job(upload_id, str(uuid.uuid4()), payload):
+        return jsonify({"error": "Erro ao registrar o processamento do arquivo"}), 500, headers
+    complete_upload(upload_id, upload_id)
+    
+    job_url = url_for("view_job", job_id=upload_id)
+    logger.info(f"Envio {upload_id} concluído ({received} bytes); job enfileirado")
+    response = jsonify({'id': upload_id, 'offset': received, 'job_url': job_url})
+    response.headers.update(headers)
+    response.headers['Location'] = job_url
+    return response
+
+# Gravação pelo microfone: o navegador envia cada bloco do MediaRecorder enquanto grava
+# (PATCH com Upload-Offset, como em /uploads) e o servidor já converte o trecho recebido.
+# Ao enviar o formulário, /finish cria o job com o áudio pronto
+@app.route("/recordings", methods=["POST"])
+def create_recording_route():
+    data = request.get_json(silent=True) or {}
+    mimetype = (data.get("mimetype") or "audio/webm").split(";")[0].strip().lower()
+    extension = RECORDING_EXTENSIONS.get(mimetype)
+    if not extension:
+        return jsonify({"error": f"Formato de gravação não suportado: {mimetype}"}), 415
+    
+    job_id = str(uuid.uuid4())
+    filename = f"gravacao_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{job_id[:8]}_{filename}")
+    
+    try:
+        create_live_recording(job_id, filename, file_path, mimetype)
+    except Exception as e:
+        logger.error(f"Erro ao iniciar gravação: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    response = jsonify({'id': job_id, 'offset': 0})
+    response.status_code = 201
+    response.headers['Upload-Offset'] = "0"
+    response.headers['Location'] = url_for("recording_chunks", recording_id=job_id)
+    return response
+
+@app.route("/recordings/<recording_id>", methods=["HEAD", "PATCH"])
+def recording_chunks(recording_id):
+    recording = get_recording(recording_id)
+    if not recording:
+        return jsonify({"error": "Gravação não encontrada"}), 404
+    
+    if request.method == "HEAD":
+        return "", 200, {'Upload-Offset': str(recording['received']), 'Cache-Control': "no-store"}
+    
+    if request.mimetype != "application/offset+octet-stream":
+        return jsonify({"error": "Content-Type deve ser application/offset+octet-stream"}), 415
+    offset = request.headers.get("Upload-Offset", type=int)
+    if offset is None:
+        return jsonify({"error": "Cabeçalho Upload-Offset obrigatório"}), 400
+    
+    try:
+        with span("recording_chunk"):
+            received = append_recording_chunk(recording, offset, request.stream)
+    except RecordingConflictError as e:
+        current = get_recording(recording_id) or recording
+        return jsonify({"error": str(e)}), 409, {'Upload-Offset': str(current['received'])}
+    
+    return "", 204, {'Upload-Offset': str(received)}
+
+@app.route("/recordings/<recording_id>/finish", methods=["POST"])
+def finish_recording_route(recording_id):
+    recording = get_recording(recording_id)
+    if not recording:
+        return jsonify({"error": "Gravação não encontrada"}), 404
+    if recording['status'] != 'recording':
+        return jsonify({"error": "Gravação já concluída"}), 409
+    
+    data = request.get_json(silent=True) or {}
+    project_name = data.get("project_name", "")
+    description = data.get("description", "")
+    error = validate_upload_metadata(project_name, description)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    # A conversão já aconteceu durante a gravação: só resta esperar o ffmpeg fechar o arquivo
+    try:
+        file_path, filename, audio_hash, audio_info = finish_live_recording(recording)
+    except ValueError as e:
+        discard_recording(recording)
+        return jsonify({"error": str(e)}), 415
+    
+    payload = {
+        'file_path': file_path,
+        'filename': filename,
+        'project_name': project_name,
+        'description': description,
+        'split_audio': bool(data.get("split_audio", True)),
+        'transcription_options': {},
+        'audio_hash': audio_hash,
+        'audio_info': audio_info
+    }
+    if not submit_transcription_job(recording_id, str(uuid.uuid4()), payload):
+        return jsonify({"error": "Erro ao registrar o processamento do arquivo"}), 500
+    complete_recording(recording_id, recording_id)
+    
+    job_url = url_for("view_job", job_id=recording_id)
+    response = jsonify({'id': recording_id, 'job_url': job_url})
+    response.headers['Location'] = job_url
+    return response
+
+@app.route("/jobs/<job_id>")
+def view_job(job_id):
+    job = get_job(job_id)
+    
+    if not job:
+        flash("Processamento não encontrado", "error")
+        return redirect(url_for("upload_file"))
+    
+    # Redirecionar para a transcrição assim que o job terminar
+    if job['status'] == 'done':
+        flash("Transcrição concluída com sucesso!", "success")
+        return redirect(url_for("view_transcription", trans_id=job['trans_id']))
+    
+    return render_template(
+        "job.html",
+        job_id=job_id,
+        status=job['status'],
+        project=job['payload'].get('project_name', ''),
+        error=job.get('error')
+    )
+
+@app.route("/jobs/<job_id>/status")
+def job_status(job_id):
+    job = get_job(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job não encontrado"}), 404
+    
+    response = {
+        'id': job['id'],
+        'status': job['status'],
+        'current_stage': job['current_stage'],
+        'stages': job['stages'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at']
+    }
+    
+    if job['status'] == 'done':
+        response['redirect_url'] = url_for("view_transcription", trans_id=job['trans_id'])
+    
+    return jsonify(response)
 
 @app.route("/transcriptions")
 def list_transcriptions():
     try:
-        # Obter filtros de data
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        # Obter filtros de data (epoch local, dia inteiro)
+        start_date = date_filter_epoch(request.args.get('start_date'))
+        end_date = date_filter_epoch(request.args.get('end_date'), end_of_day=True)
         
         # Obter termo de busca
         search_term = request.args.get('search', '')
@@ -250,18 +422,19 @@ def list_transcriptions():
         sort_by = request.args.get('sort_by', 'created_at')
         sort_order = request.args.get('sort_order', 'DESC')
         
-        # Formatar datas para o formato usado no banco de dados
-        if start_date:
-            start_date = f"{start_date} 00:00:00"
-        if end_date:
-            end_date = f"{end_date} 23:59:59"
-        
-        # Buscar transcrições com filtro e ordenação
-        transcriptions = get_all_transcriptions(start_date, end_date, sort_by, sort_order)
-        
-        # Filtrar por termo de busca, se fornecido
+        # Buscar transcrições com filtro e ordenação; com termo de busca, usar o índice
+        # textual (nome, descrição e texto), ordenado por relevância por padrão
+        page = None
         if search_term:
-            transcriptions = [t for t in transcriptions if search_term.lower() in t['project'].lower()]
+            transcriptions = search_transcriptions(search_term, start_date, end_date, sort_by, sort_order)
+            if sort_by not in SORTABLE_COLUMNS:
+                sort_by = 'relevance'
+        else:
+            # Sem busca: uma página por vez, com paginação por chave
+            page = list_transcriptions_page(start_date, end_date, sort_by, sort_order,
+                                            cursor=request.args.get('cursor'), limit=TRANSCRIPTIONS_PAGE_SIZE)
+            transcriptions = page['items']
+            sort_by, sort_order = page['sort_by'], page['sort_order']
         
         # Formatar dados para exibição
         for trans in transcriptions:
@@ -269,174 +442,52 @@ def list_transcriptions():
             trans['formatted_date'] = format_timestamp(trans.get('created_at', ''))
             trans['formatted_size'] = format_file_size(trans.get('file_size', 0))
             
-            # Verificar se audio_duration é None e fornecer valor padrão
-            audio_duration = trans.get('audio_duration')
-            if audio_duration is None:
-                audio_duration = 0
-                # Opcionalmente, atualizar no banco de dados com valor padrão
-                update_transcription(trans['id'], audio_duration=0)
-            
-            trans['formatted_duration'] = format_duration(audio_duration)
-            
-            # Verificar se estimated_cost é None e fornecer valor padrão
-            estimated_cost = trans.get('estimated_cost')
-            if estimated_cost is None:
-                estimated_cost = 0.0
-                # Opcionalmente, atualizar no banco de dados com valor padrão
-                update_transcription(trans['id'], estimated_cost=0.0)
-            
-            trans['formatted_cost'] = f"${estimated_cost:.4f}"
+            # Valores ausentes são preenchidos pelo backfill (services/backfill.py), não aqui
+            trans['formatted_duration'] = format_duration(trans.get('audio_duration') or 0)
+            trans['formatted_cost'] = f"${trans.get('estimated_cost') or 0.0:.4f}"
             
             # Verificar speakers_count
             if trans.get('speakers_count') is None:
                 trans['speakers_count'] = 0
+            
+            # Trecho encontrado pela busca, com os termos destacados
+            if trans.get('snippet'):
+                trans['snippet_html'] = highlight_snippet(trans['snippet'])
         
         # Passar parâmetros de ordenação para o template
         return render_template(
             "transcriptions.html", 
             transcriptions=transcriptions,
             current_sort=sort_by,
-            current_order=sort_order
+            current_order=sort_order,
+            next_cursor=page['next_cursor'] if page else None,
+            prev_cursor=page['prev_cursor'] if page else None
         )
     except Exception as e:
         logger.error(f"Erro ao listar transcrições: {e}")
         flash(f"Erro ao listar transcrições: {str(e)}", "error")
         return redirect(url_for("upload_file"))
 
-def format_file_size(size_bytes):
-    """
-    Formata o tamanho do arquivo para exibição
-    """
-    try:
-        # Garantir que size_bytes seja um número
-        size_bytes = float(size_bytes) if size_bytes is not None else 0
-        
-        # Converter bytes para formato legível
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size_bytes < 1024.0:
-                return f"{size_bytes:.2f} {unit}"
-            size_bytes /= 1024.0
-        return f"{size_bytes:.2f} TB"
-    except Exception:
-        return "Desconhecido"
-
-def format_timestamp(timestamp):
-    """
-    Formata um timestamp para exibição
-    """
-    try:
-        if not timestamp:
-            return "Data desconhecida"
-        
-        # Se for uma string de data do SQLite
-        if isinstance(timestamp, str):
-            from datetime import datetime
-            try:
-                dt = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
-                return dt.strftime("%d/%m/%Y %H:%M")
-            except ValueError:
-                return timestamp
-        
-        # Se for um objeto datetime
-        if hasattr(timestamp, 'strftime'):
-            return timestamp.strftime("%d/%m/%Y %H:%M")
-            
-        return str(timestamp)
-    except Exception:
-        return "Data desconhecida"
-
-def format_duration(seconds):
-    """
-    Formata duração em segundos para exibição (hh:mm:ss)
-    """
-    try:
-        # Garantir que seconds seja um número inteiro
-        seconds = int(float(seconds)) if seconds is not None else 0
-        
-        if seconds < 60:
-            return f"{seconds} seg"
-        
-        minutes = seconds // 60
-        remaining_seconds = seconds % 60
-        
-        if minutes < 60:
-            return f"{minutes}m {remaining_seconds}s"
-        
-        hours = minutes // 60
-        remaining_minutes = minutes % 60
-        
-        return f"{hours}h {remaining_minutes}m {remaining_seconds}s"
-    except Exception:
-        return "Desconhecido"
-
-
-def copy_audio_to_transcript_folder(source_path, target_folder, filename):
-    """
-    Copia o arquivo de áudio para a pasta da transcrição
-    """
-    try:
-        # Garantir que o nome do arquivo seja seguro
-        safe_filename = secure_filename(filename)
-        
-        # Caminho completo do destino
-        audio_path = os.path.join(target_folder, safe_filename)
-        
-        # Copiar o arquivo
-        shutil.copy2(source_path, audio_path)
-        
-        # Converter para MP3 se não for (para garantir compatibilidade com os navegadores)
-        if not safe_filename.lower().endswith('.mp3'):
-            try:
-                # Carregar o áudio
-                audio = AudioSegment.from_file(audio_path)
-                
-                # Caminho do MP3
-                mp3_path = os.path.join(target_folder, "audio_playback.mp3")
-                
-                # Exportar como MP3
-                audio.export(mp3_path, format="mp3")
-                
-                return os.path.basename(mp3_path)
-            except Exception as e:
-                logger.error(f"Erro ao converter áudio para MP3: {e}")
-                return safe_filename
-        
-        return safe_filename
-    except Exception as e:
-        logger.error(f"Erro ao copiar arquivo de áudio: {e}")
-        return None
-    
 @app.route("/audio/<trans_id>/<filename>")
-def serve_audio(trans_id, filename):
+@app.route("/audio/<trans_id>/hls/<filename>", defaults={'subfolder': "hls"})
+def serve_audio(trans_id, filename, subfolder=None):
     try:
-        # Buscar transcrição para verificar se o arquivo pertence a ela
-        transcription = get_transcription(trans_id)
-        
-        if not transcription:
-            flash("Transcrição não encontrada", "error")
-            return redirect(url_for("list_transcriptions"))
-        
-        # Verificar se o arquivo está na pasta da transcrição
-        folder_path = transcription.get('folder_path')
-        if not folder_path or not os.path.exists(folder_path):
-            flash("Pasta da transcrição não encontrada", "error")
-            return redirect(url_for("view_transcription", trans_id=trans_id))
-        
-        # Verificar se o nome do arquivo corresponde
-        audio_path = os.path.join(folder_path, filename)
-        if not os.path.exists(audio_path):
+        # Caminho resolvido uma vez por arquivo e mantido em cache (sem banco nem stat a cada range)
+        audio_file = resolve_audio_file(trans_id, f"{subfolder}/{filename}" if subfolder else filename)
+        if not audio_file:
             flash("Arquivo de áudio não encontrado", "error")
             return redirect(url_for("view_transcription", trans_id=trans_id))
         
-        # Detectar o tipo MIME para o arquivo de áudio
-        mime_type = "audio/mpeg"  # Padrão para .mp3
-        if filename.lower().endswith('.wav'):
-            mime_type = "audio/wav"
-        elif filename.lower().endswith('.m4a'):
-            mime_type = "audio/mp4"
-        
-        # Enviar o arquivo
-        return send_file(audio_path, mimetype=mime_type)
+        # Respostas 206 para ranges, 304 para requisições condicionais
+        return send_audio_file(audio_file)
+    except HTTPException:
+        # 416 para um range fora do arquivo
+        raise
+    except FileNotFoundError:
+        # Arquivo removido depois de entrar no cache
+        invalidate_audio_files(trans_id)
+        flash("Arquivo de áudio não encontrado", "error")
+        return redirect(url_for("view_transcription", trans_id=trans_id))
     except Exception as e:
         logger.error(f"Erro ao servir arquivo de áudio: {e}")
         flash(f"Erro ao reproduzir áudio: {str(e)}", "error")
@@ -453,52 +504,42 @@ def view_transcription(trans_id):
             flash("Transcrição não encontrada", "error")
             return redirect(url_for("list_transcriptions"))
         
-        # Extrair nomes dos speakers
-        speakers = []
-        for line in transcription['transcription'].split('\n\n'):
-            if ':' in line:
-                speaker = line.split(':', 1)[0].strip()
-                if speaker not in speakers:
-                    speakers.append(speaker)
+        # Falas com os tempos reais (transcrições antigas não têm)
+        utterances = get_utterances(trans_id)
+        
+        # Áudio do player e, para gravações longas, a playlist HLS
+        artifacts = get_artifacts(trans_id)
+        audio_path = transcription.get('audio_path')
+        
+        # Speakers na ordem em que aparecem (tabela speakers); sem falas, extrair do texto
+        speakers = [speaker['name'] for speaker in get_speakers(trans_id)]
+        if not speakers:
+            speakers = []
+            for line in transcription['transcription'].split('\n\n'):
+                if ':' in line:
+                    speaker = line.split(':', 1)[0].strip()
+                    if speaker not in speakers:
+                        speakers.append(speaker)
         
         # Formatar dados para exibição com tratamento seguro para valores None
         formatted_date = format_timestamp(transcription.get('created_at', ''))
         formatted_size = format_file_size(transcription.get('file_size', 0))
         
-        # Verificar e tratar audio_duration
-        audio_duration = transcription.get('audio_duration')
-        if audio_duration is None or audio_duration == 0:
-            # Tentar calcular a duração se o arquivo estiver disponível
-            try:
-                folder_path = transcription.get('folder_path')
-                audio_file = transcription.get('audio_path')
-                if folder_path and audio_file and os.path.exists(os.path.join(folder_path, audio_file)):
-                    audio = AudioSegment.from_file(os.path.join(folder_path, audio_file))
-                    audio_duration = len(audio) / 1000  # em segundos
-                    # Atualizar no banco de dados
-                    update_transcription(trans_id, audio_duration=audio_duration)
-            except Exception as e:
-                logger.warning(f"Não foi possível calcular a duração: {e}")
-                audio_duration = 0
-        
+        # Somente leitura: valores ausentes são preenchidos pelo backfill (services/backfill.py)
+        audio_duration = transcription.get('audio_duration') or 0
         formatted_duration = format_duration(audio_duration)
         
-        # Recalcular o custo baseado na duração correta
-        estimated_cost = audio_duration * (0.37 / 3600)  # $0.37 por hora
-        if estimated_cost != transcription.get('estimated_cost'):
-            # Atualizar no banco de dados
-            update_transcription(trans_id, estimated_cost=estimated_cost)
-        
+        estimated_cost = transcription.get('estimated_cost')
+        if not estimated_cost:
+            estimated_cost = audio_duration * (0.37 / 3600)  # $0.37 por hora
         formatted_cost = f"${estimated_cost:.4f}"
         
-        # Garantir que speakers_count tenha um valor
-        if transcription.get('speakers_count') is None or transcription.get('speakers_count') == 0:
-            transcription['speakers_count'] = len(speakers) if speakers else 0
-            # Atualizar no banco de dados
-            update_transcription(trans_id, speakers_count=transcription['speakers_count'])
+        if not transcription.get('speakers_count'):
+            transcription['speakers_count'] = len(speakers)
         
         return render_template(
             "transcription.html", 
+            utterances=utterances,
             project=transcription['project'],
             description=transcription['description'],
             filename=transcription['filename'],
@@ -510,7 +551,10 @@ def view_transcription(trans_id):
             formatted_duration=formatted_duration,
             formatted_cost=formatted_cost,
             trans_id=trans_id,
-            audio_path=transcription.get('audio_path'),
+            audio_path=audio_path,
+            audio_mimetype=AUDIO_MIME_TYPES.get(os.path.splitext(audio_path or "")[1].lower(), "audio/mpeg"),
+            hls_path=artifacts['hls']['path'] if 'hls' in artifacts else None,
+            peaks_path=artifacts['peaks']['path'] if 'peaks' in artifacts else None,
             audio_duration=audio_duration
         )
     except Exception as e:
@@ -518,6 +562,40 @@ def view_transcription(trans_id):
         flash(f"Erro ao visualizar transcrição: {str(e)}", "error")
         return redirect(url_for("list_transcriptions"))
     
+@app.route("/api/transcriptions")
+def transcriptions_api():
+    # Lista paginada (por chave) das transcrições, sem o texto completo; datas em YYYY-MM-DD
+    try:
+        limit = min(max(request.args.get('limit', TRANSCRIPTIONS_PAGE_SIZE, type=int), 1), 500)
+        page = list_transcriptions_page(
+            date_filter_epoch(request.args.get('start_date')),
+            date_filter_epoch(request.args.get('end_date'), end_of_day=True),
+            request.args.get('sort_by'), request.args.get('sort_order'),
+            cursor=request.args.get('cursor'), limit=limit
+        )
+        return jsonify(page)
+    except Exception as e:
+        logger.error(f"Erro ao listar transcrições: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route("/api/transcriptions/<trans_id>/utterances")
+def transcription_utterances(trans_id):
+    # Falas que cobrem o intervalo [start_ms, end_ms]; sem parâmetros, todas
+    try:
+        start_ms = request.args.get('start_ms', type=int)
+        end_ms = request.args.get('end_ms', type=int)
+        
+        utterances = get_utterances(trans_id, start_ms, end_ms)
+        return jsonify({
+            'transcription_id': trans_id,
+            'start_ms': start_ms,
+            'end_ms': end_ms,
+            'utterances': utterances
+        })
+    except Exception as e:
+        logger.error(f"Erro ao buscar falas: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/download/<trans_id>/<format>")
 def download_transcription(trans_id, format):
     try:
@@ -534,18 +612,6 @@ def download_transcription(trans_id, format):
             folder_path = create_transcript_folder(trans_id, transcription['project'])
             update_transcription(trans_id, folder_path=folder_path)
         
-        # Processar o diálogo
-        dialogue = transcription['transcription'].split("\n\n")
-        
-        # Preparar metadados para o template
-        meta_info = {
-            'created_at': format_timestamp(transcription.get('created_at', '')),
-            'project': transcription['project'],
-            'filename': transcription['filename'],
-            'audio_duration': format_duration(transcription.get('audio_duration', 0)),
-            'speakers_count': transcription.get('speakers_count', 0)
-        }
-        
         try:
             # Redirecionar solicitações de PDF para DOCX
             if format == "pdf":
@@ -554,10 +620,16 @@ def download_transcription(trans_id, format):
                 format = "docx"  # Mudar o formato para DOCX
                 
             if format == "docx":
-                output_file = os.path.join(folder_path, "transcricao.docx")
-                # Sempre recriar o arquivo para garantir que use o template mais recente
-                create_docx(dialogue, output_file, transcription['project'], 
-                            transcription.get('description', ''), meta_info)
+                # Processar o diálogo (falas estruturadas; texto separado só para transcrições antigas)
+                dialogue = [Utterance.from_row(row) for row in get_utterances(trans_id)]
+                if not dialogue:
+                    dialogue = transcription['transcription'].split("\n\n")
+                
+                # Reaproveita a exportação anterior se falas, metadados e template não mudaram
+                output_file = export_docx(dialogue, folder_path, transcription['project'],
+                                          transcription.get('description', ''), export_meta_info(transcription))
+                if not output_file:
+                    raise RuntimeError("Falha ao gerar o arquivo DOCX")
                 return send_file(output_file, as_attachment=True, download_name=f"{transcription['project']}.docx")
                 
             elif format == "txt":
@@ -582,6 +654,54 @@ def download_transcription(trans_id, format):
         return redirect(url_for("list_transcriptions"))
     
 
+@app.route("/cache/stats")
+def cache_stats():
+    # Contadores de acertos/falhas/remoções do cache de transcrições
+    return jsonify(get_cache_stats())
+
+@app.route("/metrics")
+def metrics():
+    # Histogramas e contadores no formato de texto do Prometheus
+    return render_metrics(), 200, {'Content-Type': PROMETHEUS_CONTENT_TYPE}
+
+@app.route("/profiles", methods=["GET", "POST"])
+def profiles_index():
+    # Perfis das requisições mais lentas; só para o administrador (PROFILE_TOKEN)
+    if not PROFILE_TOKEN:
+        return jsonify({"error": "Não encontrado"}), 404
+    
+    if request.method == "POST":
+        # O segredo vem no corpo do formulário e abre a sessão; nunca vai na URL
+        if not login_profile_admin(request.form.get("token")):
+            flash("Segredo inválido", "error")
+        return redirect(url_for("profiles_index"))
+    
+    if not is_profile_admin():
+        return render_template("profiles.html", login=True), 401
+    
+    profiles = list_profiles(limit=100)
+    for profile in profiles:
+        profile['formatted_date'] = format_timestamp(profile['captured_at'])
+    return render_template("profiles.html", profiles=profiles)
+
+@app.route("/profiles/<filename>")
+def profile_detail(filename):
+    if not is_profile_admin():
+        return jsonify({"error": "Não encontrado"}), 404
+    if profile_path(filename) is None:
+        return jsonify({"error": "Perfil não encontrado"}), 404
+    
+    if request.args.get("download"):
+        # Arquivo pstats: abrir com python -m pstats, snakeviz ou converter para o speedscope
+        return send_file(os.path.abspath(profile_path(filename)), as_attachment=True,
+                         download_name=filename, mimetype="application/octet-stream")
+    
+    sort_by = request.args.get("sort", "cumulative")
+    if sort_by not in ("cumulative", "tottime", "ncalls"):
+        sort_by = "cumulative"
+    return render_template("profiles.html", profiles=None, filename=filename, sort_by=sort_by,
+                           summary=profile_summary(filename, sort_by=sort_by))
+
 @app.route("/audio-info", methods=["POST"])
 def get_audio_info_route():
     try:
@@ -600,8 +720,8 @@ def get_audio_info_route():
         temp_path = os.path.join(app.config['UPLOAD_FOLDER'], "temp_" + filename)
         file.save(temp_path)
         
-        # Obter informações do arquivo
-        audio_info = get_audio_info(temp_path)
+        # Obter informações do arquivo (arquivo temporário, sem cache)
+        audio_info = get_audio_info(temp_path, use_cache=False)
         
         # Novo cálculo de custo: $0.37 por hora = $0.0001028 por segundo
         duration_seconds = audio_info['duration_seconds']
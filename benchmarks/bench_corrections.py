@@ -0,0 +1,97 @@
+"""
+Benchmark do motor de correções (utils/corrections.py).
+
+Compara a implementação anterior (um re.sub por entrada do dicionário) com o
+matcher compilado em passada única, para dicionários de 30, 1k e 10k entradas.
+
+Uso:
+    python -m benchmarks.bench_corrections
+"""
+import re
+import time
+import random
+import string
+from utils import corrections
+
+DICTIONARY_SIZES = [30, 1000, 10000]
+UTTERANCES = 500
+
+def _random_word(rng, min_len=4, max_len=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len)))
+
+def build_dictionary(size, rng):
+    """
+    Gera um dicionário sintético com o dicionário real mais entradas aleatórias
+    """
+    dictionary = dict(corrections.CORRECTIONS)
+    while len(dictionary) < size:
+        dictionary[_random_word(rng)] = _random_word(rng)
+    return dict(list(dictionary.items())[:size])
+
+def build_utterances(dictionary, rng, count=UTTERANCES):
+    """
+    Gera falas sintéticas com ~30 palavras, algumas delas com erros do dicionário
+    """
+    errors = list(dictionary)
+    utterances = []
+    for _ in range(count):
+        words = [rng.choice(errors) if rng.random() < 0.1 else _random_word(rng, 2, 8) for _ in range(30)]
+        utterances.append(" ".join(words) + ".")
+    return utterances
+
+def legacy_correct_text(text, dictionary):
+    """
+    Implementação anterior: um re.sub (não compilado) por entrada do dicionário
+    """
+    corrected = text
+    for error, correction in dictionary.items():
+        corrected = re.sub(r'\b' + error + r'\b', correction, corrected, flags=re.IGNORECASE)
+    return corrected
+
+def run():
+    rng = random.Random(42)
+    original = dict(corrections.CORRECTIONS)
+    results = []
+
+    try:
+        for size in DICTIONARY_SIZES:
+            dictionary = build_dictionary(size, rng)
+            utterances = build_utterances(dictionary, rng)
+
+            corrections.CORRECTIONS.clear()
+            corrections.add_corrections(dictionary)
+
+            start = time.perf_counter()
+            corrections._get_matcher()
+            compile_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            corrections.correct_texts(utterances)
+            compiled_time = time.perf_counter() - start
+
+            # A versão anterior fica lenta demais com 10k entradas: medir uma amostra
+            sample = utterances[:max(5, len(utterances) * 30 // size)]
+            start = time.perf_counter()
+            for text in sample:
+                legacy_correct_text(text, dictionary)
+            legacy_time = (time.perf_counter() - start) * len(utterances) / len(sample)
+
+            results.append({
+                'dictionary_size': size,
+                'compile_ms': compile_time * 1000,
+                'compiled_utterances_per_s': len(utterances) / compiled_time,
+                'legacy_utterances_per_s': len(utterances) / legacy_time,
+            })
+    finally:
+        corrections.CORRECTIONS.clear()
+        corrections.add_corrections(original)
+
+    print(f"{'entradas':>10} {'compilação (ms)':>16} {'compilado (falas/s)':>20} {'anterior (falas/s)':>19} {'ganho':>8}")
+    for r in results:
+        speedup = r['compiled_utterances_per_s'] / r['legacy_utterances_per_s']
+        print(f"{r['dictionary_size']:>10} {r['compile_ms']:>16.1f} {r['compiled_utterances_per_s']:>20.0f} "
+              f"{r['legacy_utterances_per_s']:>19.0f} {speedup:>7.1f}x")
+    return results
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,133 @@
+"""
+Benchmark de concorrência do acesso ao SQLite (models/database.py).
+
+Executa uma carga mista de leituras (detalhe, falas, lista) e escritas (atualização
+de metadados e das falas) com vários workers, comparando a camada anterior
+(uma conexão nova por chamada, journal de rollback) com a conexão reaproveitada
+por thread em modo WAL.
+
+Uso:
+    python -m benchmarks.bench_db_concurrency
+"""
+import os
+import time
+import uuid
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+from models import database
+from models.utterance import Utterance
+
+ROWS = 200
+UTTERANCES_PER_ROW = 50
+WORKERS = [1, 4, 8]
+OPERATIONS_PER_WORKER = 400
+WRITE_RATIO = 0.2
+
+def legacy_connection():
+    """
+    Camada anterior: sqlite3.connect a cada chamada, no modo de journal padrão
+    """
+    conn = sqlite3.connect(database.DB_FILE)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def seed(rng):
+    """
+    Cria transcrições e falas sintéticas no banco atual e retorna os IDs
+    """
+    ids = []
+    for index in range(ROWS):
+        trans_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        database.save_transcription(trans_id, f"audio_{index}.mp3", f"Projeto {index}", "Descrição sintética",
+                                    "A: texto", "output/x", 1024, 2, 60.0, 0.01)
+        database.save_utterances(trans_id, [Utterance("A" if i % 2 else "B", f"fala {i}", i * 1000, i * 1000 + 900)
+                                            for i in range(UTTERANCES_PER_ROW)])
+        ids.append(trans_id)
+    return ids
+
+def worker(ids, seed_value, latencies, errors):
+    rng = random.Random(seed_value)
+    for _ in range(OPERATIONS_PER_WORKER):
+        trans_id = rng.choice(ids)
+        start = time.perf_counter()
+        try:
+            if rng.random() < WRITE_RATIO:
+                if rng.random() < 0.5:
+                    saved = database.update_transcription(trans_id, speakers_count=rng.randint(1, 5))
+                else:
+                    saved = database.save_utterances(trans_id, [Utterance("A", "fala", i * 1000, i * 1000 + 900)
+                                                                for i in range(UTTERANCES_PER_ROW)])
+                # As funções do banco registram o erro e retornam False (ex.: "database is locked")
+                if saved is False:
+                    errors.append(1)
+            else:
+                operation = rng.random()
+                if operation < 0.6:
+                    database.get_transcription(trans_id)
+                elif operation < 0.9:
+                    database.get_utterances(trans_id, 10000, 20000)
+                else:
+                    database.get_all_transcriptions()
+        except Exception:
+            errors.append(1)
+        latencies.append(time.perf_counter() - start)
+
+def run_scenario(workers, ids):
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=worker, args=(ids, seed_value, latencies, errors))
+               for seed_value in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'ops_per_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'errors': len(errors),
+    }
+
+def run():
+    original_file = database.DB_FILE
+    original_connection = database.get_db_connection
+    work_dir = tempfile.mkdtemp(prefix="bench_db_")
+    results = []
+
+    # Os erros de escrita entram na contagem em vez de poluir a saída
+    database.logger.disabled = True
+    try:
+        for mode in ("anterior", "wal"):
+            database.DB_FILE = os.path.join(work_dir, f"{mode}.db")
+            database.get_db_connection = legacy_connection if mode == "anterior" else original_connection
+            database.init_db()
+            if mode == "anterior":
+                with database.get_db_connection() as conn:
+                    conn.execute("PRAGMA journal_mode=DELETE")
+            ids = seed(random.Random(42))
+
+            for workers in WORKERS:
+                result = run_scenario(workers, ids)
+                result.update({'mode': mode, 'workers': workers})
+                results.append(result)
+    finally:
+        database.logger.disabled = False
+        database.get_db_connection = original_connection
+        database.close_db_connection()
+        database.DB_FILE = original_file
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'modo':>9} {'workers':>8} {'ops/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'erros':>6}")
+    for r in results:
+        print(f"{r['mode']:>9} {r['workers']:>8} {r['ops_per_s']:>9.0f} {r['p50_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['errors']:>6}")
+    return results
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,138 @@
+"""
+Benchmark de ponta a ponta do pipeline de transcrição, sem a API real.
+
+Usa o backend local (services/transcription_backends.py) com latência, variação e
+taxa de falhas configuráveis. Mede:
+  - transcribe_audio_file com o arquivo inteiro e segmentado (tempo, fator de
+    tempo real e chamadas ao backend);
+  - a rota de upload: vários jobs enviados de uma vez, do POST até o job concluído
+    (latência por job e vazão).
+
+O banco, os uploads e as saídas ficam em um diretório temporário.
+
+Uso:
+    python -m benchmarks.bench_pipeline
+    BENCH_JOBS=8 FAKE_TRANSCRIPTION_FAILURE_RATE=0.1 python -m benchmarks.bench_pipeline
+"""
+import io
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+
+# Áudio sintético: minutos de cada arquivo e duração dos segmentos no modo dividido
+AUDIO_MINUTES = float(os.getenv("BENCH_AUDIO_MINUTES", "10"))
+SEGMENT_SECONDS = int(os.getenv("BENCH_SEGMENT_SECONDS", "120"))
+
+# Jobs enviados de uma vez pela rota de upload
+JOBS = int(os.getenv("BENCH_JOBS", "4"))
+UPLOAD_AUDIO_MINUTES = float(os.getenv("BENCH_UPLOAD_AUDIO_MINUTES", "2"))
+
+# Latência do backend local (por padrão, bem menor que a da API real, para o benchmark ser rápido)
+os.environ.setdefault("FAKE_TRANSCRIPTION_LATENCY", "0.5")
+os.environ.setdefault("FAKE_TRANSCRIPTION_LATENCY_PER_MINUTE", "0.2")
+os.environ["TRANSCRIPTION_BACKEND"] = "fake"
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def synthetic_interview(path, minutes):
+    """
+    Gera um WAV mono 16 kHz com trechos de "fala" (tom com variação) separados por
+    silêncios, para a detecção de silêncio ter onde cortar
+    """
+    expression = "0.4*sin(2*PI*(180+40*sin(2*PI*0.5*t))*t)*lt(mod(t\\,7)\\,5.5)"
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi",
+                    "-i", f"aevalsrc={expression}:s=16000:d={minutes * 60}", "-ac", "1", path], check=True)
+    return path
+
+def bench_transcribe(work_dir):
+    from services.transcribe import transcribe_audio_file
+    from services.transcription_backends import FakeTranscriptionBackend
+
+    audio_path = synthetic_interview(os.path.join(work_dir, "entrevista.wav"), AUDIO_MINUTES)
+    results = []
+    for split in (False, True):
+        backend = FakeTranscriptionBackend()
+        start = time.perf_counter()
+        result = transcribe_audio_file(audio_path, split=split, segment_length=SEGMENT_SECONDS, backend=backend)
+        elapsed = time.perf_counter() - start
+        results.append({
+            'mode': "segmentado" if split else "inteiro",
+            'seconds': elapsed,
+            'rtf': elapsed / (AUDIO_MINUTES * 60),
+            'calls': backend.calls,
+            'utterances': len(result['utterances']),
+            'ok': result['speakers_count'] > 0,
+        })
+
+    print(f"transcribe_audio_file ({AUDIO_MINUTES:g} min de áudio)")
+    print(f"{'modo':>11} {'tempo (s)':>10} {'RTF':>7} {'chamadas':>9} {'falas':>6} {'ok':>4}")
+    for r in results:
+        print(f"{r['mode']:>11} {r['seconds']:>10.2f} {r['rtf']:>7.4f} {r['calls']:>9} "
+              f"{r['utterances']:>6} {'sim' if r['ok'] else 'não':>4}")
+    return results
+
+def bench_upload_route(work_dir):
+    import app as application
+
+    # app.py configura o logging em INFO; aqui só interessam avisos e erros
+    logging.getLogger().setLevel(logging.WARNING)
+    client = application.app.test_client()
+    audio_path = synthetic_interview(os.path.join(work_dir, "upload.wav"), UPLOAD_AUDIO_MINUTES)
+
+    submitted = {}
+    start = time.perf_counter()
+    for index in range(JOBS):
+        with open(audio_path, 'rb') as f:
+            # Conteúdo diferente por job para não acertar o cache de transcrições
+            data = f.read() + index.to_bytes(4, 'little')
+        response = client.post("/", data={
+            'project_name': f"Benchmark do pipeline {index}",
+            'description': "Depoimento sintético",
+            'file': (io.BytesIO(data), f"upload_{index}.wav"),
+        }, content_type="multipart/form-data")
+        job_id = response.location.rsplit('/', 1)[1]
+        submitted[job_id] = time.perf_counter()
+
+    latencies = []
+    failed = 0
+    pending = set(submitted)
+    while pending:
+        for job_id in list(pending):
+            status = client.get(f"/jobs/{job_id}/status").json
+            if status['status'] in ('done', 'failed'):
+                latencies.append(time.perf_counter() - submitted[job_id])
+                failed += status['status'] == 'failed'
+                pending.discard(job_id)
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"\nRota de upload ({JOBS} jobs de {UPLOAD_AUDIO_MINUTES:g} min, "
+          f"{application.job_queue.workers} workers)")
+    print(f"{'jobs/min':>9} {'p50 (s)':>8} {'máx (s)':>8} {'falhas':>7}")
+    print(f"{JOBS / elapsed * 60:>9.1f} {latencies[len(latencies) // 2]:>8.2f} {latencies[-1]:>8.2f} {failed:>7}")
+    return {'jobs_per_min': JOBS / elapsed * 60, 'p50_s': latencies[len(latencies) // 2],
+            'max_s': latencies[-1], 'failed': failed}
+
+def run():
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    original_dir = os.getcwd()
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        # A aplicação usa caminhos relativos (banco, uploads, output, template DOCX)
+        shutil.copy(os.path.join(REPO_ROOT, "depoimento_template.docx"), work_dir)
+        os.chdir(work_dir)
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        results = {'transcribe': bench_transcribe(work_dir), 'upload': bench_upload_route(work_dir)}
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+if __name__ == "__main__":
+    run()
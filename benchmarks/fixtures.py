@@ -0,0 +1,108 @@
+"""
+Dados sintéticos para os benchmarks: transcrições de 1 minuto a algumas horas de
+fala, com 2 a 10 speakers, e bancos com 100 a 100k transcrições.
+"""
+import time
+import uuid
+import random
+from models import database
+from models.utterance import Utterance, render_transcript
+from services.transcript_stitching import StitchedTranscript, StitchedUtterance
+from utils.corrections import CORRECTIONS
+
+# Fala contínua em português: cerca de 150 palavras por minuto
+WORDS_PER_MINUTE = 150
+
+NAMES = ["Carlos", "Mariana", "João", "Fernanda", "Ricardo", "Patrícia", "Eduardo", "Luciana", "Marcos", "Beatriz"]
+
+VOCABULARY = (
+    "então eu trabalhei na empresa durante quase dez anos no setor de produção e depois "
+    "fui transferido para a área administrativa onde fiquei responsável pelo controle "
+    "de estoque a gente recebia as ordens do gerente e repassava para a equipe não "
+    "me lembro exatamente da data mas foi no começo do ano o senhor pode explicar "
+    "como funcionava o registro de ponto naquela época sim claro quem assinava os "
+    "documentos era o supervisor do turno e havia reuniões toda semana com a diretoria"
+).split()
+
+# Erros do dicionário de correções aparecem em ~2% das palavras
+TYPOS = list(CORRECTIONS)
+TYPO_RATE = 0.02
+
+def synthetic_utterances(minutes, speakers, seed=42):
+    """
+    Falas de 5 a 25 segundos alternando entre os speakers (rótulos A, B, ... como
+    na AssemblyAI). Cada speaker se apresenta na primeira fala e os nomes aparecem
+    de vez em quando nas falas dos outros
+    """
+    rng = random.Random(seed)
+    labels = [chr(ord('A') + index) for index in range(speakers)]
+    names = NAMES[:speakers]
+    introduced = set()
+    utterances = []
+    cursor_ms = 0
+    end_ms = int(minutes * 60 * 1000)
+    current = 0
+
+    while cursor_ms < end_ms:
+        duration_ms = min(end_ms - cursor_ms, rng.randint(5000, 25000))
+        count = max(1, duration_ms * WORDS_PER_MINUTE // 60000)
+        words = []
+        for _ in range(count):
+            if rng.random() < TYPO_RATE:
+                words.append(rng.choice(TYPOS))
+            elif rng.random() < 0.01:
+                words.append(rng.choice(names))
+            else:
+                words.append(rng.choice(VOCABULARY))
+        speaker = labels[current]
+        if speaker not in introduced:
+            words[:4] = ["meu", "nome", "é", f"{names[current]},"]
+            introduced.add(speaker)
+        words[0] = words[0].capitalize()
+        text = " ".join(words) + "."
+
+        utterances.append(Utterance(speaker, text, cursor_ms, cursor_ms + duration_ms))
+        cursor_ms += duration_ms + rng.randint(200, 1500)
+        # Entrevistas: o entrevistador (A) volta a falar com frequência
+        current = 0 if current != 0 and rng.random() < 0.5 else rng.randrange(speakers)
+    return utterances
+
+def synthetic_transcript(utterances):
+    """
+    Transcrição bruta no formato da AssemblyAI (para a identificação de speakers)
+    """
+    return StitchedTranscript([StitchedUtterance(u.speaker, u.text, u.start, u.end, 0.9) for u in utterances],
+                              audio_duration=utterances[-1].end / 1000 if utterances else 0)
+
+def synthetic_formatted_text(utterances):
+    """
+    Texto plano "Speaker: fala", como nas transcrições antigas
+    """
+    return render_transcript(utterances)
+
+def seed_transcriptions(rows, seed=42):
+    """
+    Insere transcrições sintéticas no banco atual (database.DB_FILE) em um único
+    lote. O texto de cada uma é curto: o custo medido é o da listagem, não o do texto
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    batch = []
+    for index in range(rows):
+        duration = rng.uniform(60, 4 * 3600)
+        batch.append((
+            str(uuid.UUID(int=rng.getrandbits(128))), f"audio_{index}.mp3", f"Projeto {index % 500}",
+            "Descrição sintética", f"A: fala {index}", now - rng.randint(0, 3 * 365 * 86400),
+            f"output/{index}", rng.randint(100_000, 500_000_000), rng.randint(2, 10), duration,
+            duration * (0.37 / 3600)
+        ))
+
+    with database.get_db_connection() as conn:
+        conn.executemany(
+            """INSERT INTO transcriptions (id, filename, project, description, transcription, created_at,
+                                           folder_path, file_size, speakers_count, audio_duration, estimated_cost)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            batch
+        )
+        conn.commit()
+    return rows
@@ -0,0 +1,200 @@
+"""
+Suíte de micro-benchmarks dos caminhos quentes de texto, exportação e listagem:
+correct_text, extract_self_identifier, fix_transcript_speakers, preprocess_transcript,
+create_docx e get_all_transcriptions (mais a primeira página da lista paginada).
+
+Cada caso roda sobre dados sintéticos (benchmarks/fixtures.py) e registra o tempo
+(menor e mediana) e o pico de memória (tracemalloc, em uma execução separada para não
+distorcer o tempo). Com --save, o resultado vira a linha de base (JSON); sem ele,
+o resultado é comparado com a linha de base e o processo termina com código 1 se
+algum caso ficar mais lento (ou usar mais memória) além do limite.
+
+A linha de base depende da máquina: gere-a na mesma máquina em que vai comparar.
+
+Uso:
+    python -m benchmarks.suite --save          # grava benchmarks/baseline.json
+    python -m benchmarks.suite                 # compara com a linha de base
+    python -m benchmarks.suite --quick --threshold 0.5
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+from datetime import datetime
+from models import database
+from services.speaker_identification import extract_self_identifier, fix_transcript_speakers, preprocess_transcript
+from utils.corrections import correct_text
+from utils.formatters import create_docx
+from benchmarks import fixtures
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Regressão: mais lento (ou mais memória) que a linha de base por mais que esta fração
+DEFAULT_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.25"))
+
+# Diferenças absolutas menores que isso são ruído, não regressão
+MIN_DELTA_SECONDS = 0.002
+MIN_DELTA_KB = 256
+
+# Transcrições (minutos de fala, speakers) e bancos (linhas)
+TRANSCRIPT_SIZES = [(1, 2), (60, 4), (240, 10)]
+QUICK_TRANSCRIPT_SIZES = [(1, 2), (60, 4)]
+DB_ROWS = [100, 10_000, 100_000]
+QUICK_DB_ROWS = [100, 10_000]
+
+# Repetições: pelo menos MIN_REPEATS, até somar MIN_TOTAL_SECONDS ou chegar a MAX_REPEATS
+MIN_REPEATS = 3
+MAX_REPEATS = 20
+MIN_TOTAL_SECONDS = 0.5
+
+def measure(function):
+    """
+    Menor tempo e mediana de várias execuções (depois de uma de aquecimento, que
+    carrega caches como o template DOCX) e pico de memória de uma execução.
+    A comparação usa o menor tempo, o menos sensível a ruído da máquina
+    """
+    function()
+    timings = []
+    total = 0.0
+    while len(timings) < MIN_REPEATS or (total < MIN_TOTAL_SECONDS and len(timings) < MAX_REPEATS):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(timings), 'median_seconds': statistics.median(timings), 'peak_kb': peak / 1024,
+            'repeats': len(timings)}
+
+def text_cases(transcript_sizes, work_dir):
+    """
+    Casos de texto e exportação para cada tamanho de transcrição
+    """
+    for minutes, speakers in transcript_sizes:
+        utterances = fixtures.synthetic_utterances(minutes, speakers)
+        texts = [u.text for u in utterances]
+        transcript = fixtures.synthetic_transcript(utterances)
+        formatted_text = fixtures.synthetic_formatted_text(utterances)
+        speaker_texts = {}
+        for utterance in utterances:
+            speaker_texts.setdefault(utterance.speaker, []).append(utterance.text)
+        joined = [" ".join(parts) for parts in speaker_texts.values()]
+        docx_path = os.path.join(work_dir, f"bench_{minutes}.docx")
+        meta_info = {'created_at': "01/01/2024 10:00", 'project': "Benchmark", 'filename': "audio.mp3",
+                     'audio_duration': f"{minutes} min", 'speakers_count': speakers}
+        size = f"{minutes}min_{speakers}spk"
+
+        yield f"correct_text/{size}", lambda texts=texts: [correct_text(text) for text in texts]
+        yield f"extract_self_identifier/{size}", lambda joined=joined: [extract_self_identifier(t) for t in joined]
+        yield f"fix_transcript_speakers/{size}", lambda text=formatted_text: fix_transcript_speakers(text)
+        yield f"preprocess_transcript/{size}", lambda transcript=transcript: preprocess_transcript(transcript)
+        yield f"create_docx/{size}", lambda u=utterances, p=docx_path, m=meta_info: create_docx(
+            u, p, "Benchmark", "Depoimento sintético", m)
+
+def db_cases(db_rows, work_dir):
+    """
+    Casos de listagem para cada tamanho de banco (um arquivo SQLite por tamanho)
+    """
+    for rows in db_rows:
+        database.close_db_connection()
+        database.DB_FILE = os.path.join(work_dir, f"bench_{rows}.db")
+        database.init_db()
+        fixtures.seed_transcriptions(rows)
+
+        yield f"get_all_transcriptions/{rows}rows", lambda: database.get_all_transcriptions(sort_by="created_at",
+                                                                                            sort_order="DESC")
+        yield f"list_transcriptions_page/{rows}rows", lambda: database.list_transcriptions_page(limit=50)
+
+def run_suite(quick=False):
+    work_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    original_db_file = database.DB_FILE
+    results = {}
+    try:
+        transcript_sizes = QUICK_TRANSCRIPT_SIZES if quick else TRANSCRIPT_SIZES
+        rows = QUICK_DB_ROWS if quick else DB_ROWS
+        for cases in (text_cases(transcript_sizes, work_dir), db_cases(rows, work_dir)):
+            for name, function in cases:
+                results[name] = measure(function)
+                r = results[name]
+                print(f"{name:<45} {r['seconds'] * 1000:>10.2f} ms {r['peak_kb']:>10.0f} KB")
+    finally:
+        database.close_db_connection()
+        database.DB_FILE = original_db_file
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Lista as regressões (tempo ou memória) em relação à linha de base
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if (current['seconds'] > previous['seconds'] * (1 + threshold) and
+                current['seconds'] - previous['seconds'] > MIN_DELTA_SECONDS):
+            regressions.append(f"{name}: tempo {previous['seconds'] * 1000:.2f} ms -> "
+                               f"{current['seconds'] * 1000:.2f} ms "
+                               f"(+{(current['seconds'] / previous['seconds'] - 1) * 100:.0f}%)")
+        if (current['peak_kb'] > previous['peak_kb'] * (1 + threshold) and
+                current['peak_kb'] - previous['peak_kb'] > MIN_DELTA_KB):
+            regressions.append(f"{name}: memória {previous['peak_kb']:.0f} KB -> {current['peak_kb']:.0f} KB "
+                               f"(+{(current['peak_kb'] / previous['peak_kb'] - 1) * 100:.0f}%)")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks dos caminhos quentes")
+    parser.add_argument("--save", action="store_true", help="grava o resultado como linha de base")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="arquivo JSON da linha de base")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fração de piora tolerada (padrão: %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="só os tamanhos menores")
+    args = parser.parse_args(argv)
+
+    # Erros registrados pelas funções medidas não devem poluir a saída
+    logging.basicConfig(level=logging.WARNING)
+    results = run_suite(quick=args.quick)
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'machine': platform.platform(),
+                'results': results
+            }, f, indent=2, sort_keys=True)
+        print(f"\nLinha de base gravada em {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nSem linha de base em {args.baseline}; rode com --save para criá-la")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressão(ões) acima de {args.threshold * 100:.0f}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\nSem regressões acima de {args.threshold * 100:.0f}% em relação à linha de base")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,12 @@
 import os
+import re
+import json
+import base64
+import time
 import sqlite3
 import logging
-from datetime import datetime
+import threading
+from models.migrations import run_migrations
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -9,71 +14,89 @@ logger = logging.getLogger(__name__)
 # Caminho do banco de dados
 DB_FILE = "transcriptions.db"
 
-def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados"""
-    conn = sqlite3.connect(DB_FILE)
+# Ajustes de desempenho do SQLite
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "20000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "256"))
+
+# Uma conexão por thread (e por arquivo de banco), reaproveitada entre as chamadas
+_local = threading.local()
+
+def _open_connection(db_file):
+    """Abre uma conexão nova com WAL e os pragmas de desempenho"""
+    conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=DB_CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row  # Para acessar colunas pelo nome
+    
+    # WAL: leitores não esperam pelos escritores (a configuração fica gravada no arquivo)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Com WAL, NORMAL mantém a consistência e só sincroniza no checkpoint
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    # Falas, speakers e artefatos são removidos junto com a transcrição
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+def get_db_connection():
+    """
+    Retorna a conexão da thread atual com o banco de dados, criando-a na primeira chamada.
+    A conexão é reaproveitada (junto com o cache de comandos preparados) e deve ser
+    usada com "with", que faz commit ou rollback ao final do bloco sem fechá-la
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        # Nunca reaproveitar conexões herdadas de outro processo (fork)
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    
+    conn = connections.get(DB_FILE)
+    if conn is None:
+        conn = connections[DB_FILE] = _open_connection(DB_FILE)
     return conn
 
+def close_db_connection():
+    """Fecha a conexão da thread atual, se houver"""
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Erro ao fechar conexão com o banco: {e}")
+    _local.connections = {}
+    _local.pid = os.getpid()
+
 def init_db():
-    """Inicializa o banco de dados com as tabelas necessárias"""
+    """Aplica as migrações pendentes do esquema (ver models/migrations.py)"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        # Verificar se a tabela já existe
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='transcriptions'")
-        table_exists = cursor.fetchone() is not None
-        
-        if not table_exists:
-            # Criar a tabela do zero se não existir
-            cursor.execute('''CREATE TABLE transcriptions (
-                                id TEXT PRIMARY KEY,
-                                filename TEXT,
-                                project TEXT,
-                                description TEXT,
-                                transcription TEXT,
-                                created_at TIMESTAMP,
-                                folder_path TEXT,
-                                file_size INTEGER,
-                                speakers_count INTEGER,
-                                audio_duration INTEGER,
-                                estimated_cost REAL,
-                                audio_path TEXT)''')
-        else:
-            # Verificar colunas existentes
-            cursor.execute("PRAGMA table_info(transcriptions)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            # Adicionar colunas que não existem
-            if 'created_at' not in columns:
-                cursor.execute("ALTER TABLE transcriptions ADD COLUMN created_at TIMESTAMP")
-            
-            if 'folder_path' not in columns:
-                cursor.execute("ALTER TABLE transcriptions ADD COLUMN folder_path TEXT")
-                
-            if 'file_size' not in columns:
-                cursor.execute("ALTER TABLE transcriptions ADD COLUMN file_size INTEGER")
-                
-            if 'speakers_count' not in columns:
-                cursor.execute("ALTER TABLE transcriptions ADD COLUMN speakers_count INTEGER")
-                
-            if 'audio_duration' not in columns:
-                cursor.execute("ALTER TABLE transcriptions ADD COLUMN audio_duration INTEGER")
-                
-            if 'estimated_cost' not in columns:
-                cursor.execute("ALTER TABLE transcriptions ADD COLUMN estimated_cost REAL")
-                
-            if 'audio_path' not in columns:
-                cursor.execute("ALTER TABLE transcriptions ADD COLUMN audio_path TEXT")
-        
-        conn.commit()
-        logger.info("Banco de dados inicializado com sucesso")
+        version = run_migrations(conn)
+        logger.info(f"Banco de dados inicializado com sucesso (esquema versão {version})")
+
+def rebuild_search_index(cursor=None):
+    """
+    Reconstrói os índices de busca a partir das tabelas (ex.: após restaurar
+    um backup antigo ou alterar as tabelas manualmente)
+    """
+    if cursor is None:
+        with get_db_connection() as conn:
+            rebuild_search_index(conn.cursor())
+            conn.commit()
+            return True
+    
+    cursor.execute("INSERT INTO transcriptions_fts (transcriptions_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO utterances_fts (utterances_fts) VALUES ('rebuild')")
+    logger.info("Índices de busca reconstruídos")
+    return True
 
 def save_transcription(trans_id, filename, project_name, description, transcription, folder_path, file_size, speakers_count=0, audio_duration=0, estimated_cost=0.0):
     """Salva uma transcrição no banco de dados"""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            current_time = int(time.time())
             
             cursor.execute(
                 """INSERT INTO transcriptions 
@@ -137,7 +160,13 @@ def get_transcription(trans_id):
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM transcriptions WHERE id = ?", (trans_id,))
+            # audio_path: arquivo de áudio do player, registrado em artifacts
+            cursor.execute(
+                """SELECT t.*, (SELECT path FROM artifacts a
+                                WHERE a.transcription_id = t.id AND a.kind = 'audio') AS audio_path
+                   FROM transcriptions t WHERE t.id = ?""",
+                (trans_id,)
+            )
             result = cursor.fetchone()
             
             if result:
@@ -210,8 +239,342 @@ def get_all_transcriptions(start_date=None, end_date=None, sort_by=None, sort_or
         logger.error(f"Erro ao listar transcrições: {e}")
         return []
 
+# Colunas exibidas na lista de transcrições (sem o texto completo)
+# (todas cobertas pelo índice idx_transcriptions_created_at)
+TRANSCRIPTION_LIST_COLUMNS = ['id', 'filename', 'project', 'created_at', 'file_size',
+                              'speakers_count', 'audio_duration', 'estimated_cost']
+
+# Colunas aceitas para ordenação da lista
+SORTABLE_COLUMNS = ['created_at', 'project', 'filename', 'file_size',
+                    'speakers_count', 'audio_duration', 'estimated_cost']
+
+# Marcadores dos termos encontrados nos trechos (convertidos em <mark> na interface)
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+def _fts_query(search_term):
+    """
+    Converte o texto digitado em uma consulta FTS5 segura: cada palavra vira um
+    prefixo entre aspas e todas precisam aparecer
+    """
+    words = re.findall(r"\w+", search_term or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+def search_transcriptions(search_term, start_date=None, end_date=None, sort_by=None, sort_order=None, limit=100):
+    """
+    Busca textual (FTS5) no nome, na descrição e no texto das transcrições.
+    Retorna as transcrições ordenadas por relevância (bm25) ou pela coluna escolhida,
+    com um trecho do texto encontrado e a fala correspondente (índice e início em ms)
+    """
+    match = _fts_query(search_term)
+    if not match:
+        return []
+    
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            columns = ", ".join(f"t.{column}" for column in TRANSCRIPTION_LIST_COLUMNS)
+            
+            # Pesos do bm25: nome > descrição > texto
+            query = f"""SELECT {columns},
+                               bm25(transcriptions_fts, 10.0, 4.0, 1.0) AS rank,
+                               snippet(transcriptions_fts, -1, ?, ?, '…', 16) AS snippet
+                        FROM transcriptions_fts
+                        JOIN transcriptions t ON t.seq = transcriptions_fts.rowid
+                        WHERE transcriptions_fts MATCH ?"""
+            params = [SNIPPET_START, SNIPPET_END, match]
+            
+            if start_date:
+                query += " AND t.created_at >= ?"
+                params.append(start_date)
+            if end_date:
+                query += " AND t.created_at <= ?"
+                params.append(end_date)
+            
+            if sort_by in SORTABLE_COLUMNS:
+                direction = sort_order.upper() if sort_order and sort_order.upper() in ['ASC', 'DESC'] else 'ASC'
+                query += f" ORDER BY t.{sort_by} {direction}"
+            else:
+                query += " ORDER BY rank"
+            query += " LIMIT ?"
+            params.append(limit)
+            
+            cursor.execute(query, params)
+            results = [dict(row) for row in cursor.fetchall()]
+            if not results:
+                return []
+            
+            # Fala mais relevante de cada transcrição encontrada, para o link direto
+            by_id = {result['id']: result for result in results}
+            placeholders = ", ".join("?" for _ in by_id)
+            cursor.execute(
+                f"""SELECT seq, transcription_id, idx, start_ms FROM (
+                        SELECT u.seq, u.transcription_id, u.idx, u.start_ms,
+                               ROW_NUMBER() OVER (PARTITION BY u.transcription_id
+                                                  ORDER BY utterances_fts.rank) AS position
+                        FROM utterances_fts
+                        JOIN utterances u ON u.seq = utterances_fts.rowid
+                        WHERE utterances_fts MATCH ? AND u.transcription_id IN ({placeholders})
+                    ) WHERE position = 1""",
+                [match, *by_id]
+            )
+            best = {row['seq']: row for row in cursor.fetchall()}
+            
+            if best:
+                # snippet() não pode ser usado junto com a função de janela: segunda consulta
+                cursor.execute(
+                    f"""SELECT rowid, snippet(utterances_fts, 0, ?, ?, '…', 16) AS snippet
+                        FROM utterances_fts
+                        WHERE utterances_fts MATCH ? AND rowid IN ({", ".join("?" for _ in best)})""",
+                    [SNIPPET_START, SNIPPET_END, match, *best]
+                )
+                for row in cursor.fetchall():
+                    utterance = best[row['rowid']]
+                    result = by_id[utterance['transcription_id']]
+                    result['utterance_index'] = utterance['idx']
+                    result['utterance_start_ms'] = utterance['start_ms']
+                    result['snippet'] = row['snippet']
+            
+            return results
+    except sqlite3.OperationalError as e:
+        # Sem FTS5: filtrar pelo nome e pela descrição
+        logger.warning(f"Busca textual indisponível, usando LIKE: {e}")
+        return _search_transcriptions_like(search_term, start_date, end_date, limit)
+    except Exception as e:
+        logger.error(f"Erro ao buscar transcrições: {e}")
+        return []
+
+def encode_page_cursor(sort_by, sort_order, row, direction):
+    """
+    Gera o cursor opaco de uma página: posição (valor da coluna, id) e direção
+    """
+    data = json.dumps([sort_by, sort_order, row[sort_by], row['id'], direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(cursor_value, sort_by, sort_order):
+    """
+    Lê um cursor; retorna (valor, id, direção) ou None se for inválido ou de outra ordenação
+    """
+    if not cursor_value:
+        return None
+    try:
+        padded = cursor_value + '=' * (-len(cursor_value) % 4)
+        cursor_sort, cursor_order, value, last_id, direction = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        logger.warning("Cursor de paginação inválido ignorado")
+        return None
+    if cursor_sort != sort_by or cursor_order != sort_order or direction not in ('next', 'prev'):
+        return None
+    return value, last_id, direction
+
+def _seek_segments(column, descending, position):
+    """
+    Condições que continuam ORDER BY column, id a partir da posição do cursor.
+    O SQLite ordena NULL antes de qualquer valor, então a ordem é dividida em dois
+    trechos (linhas com NULL e linhas com valor), cada um percorrido por busca no
+    índice (coluna, id) com comparação de row values
+    """
+    op = '<' if descending else '>'
+    null_rows = (f"{column} IS NULL", [])
+    value_rows = (f"{column} IS NOT NULL", [])
+    
+    if position is None:
+        return [value_rows, null_rows] if descending else [null_rows, value_rows]
+    
+    value, last_id = position[0], position[1]
+    if value is None:
+        null_rest = (f"{column} IS NULL AND id {op} ?", [last_id])
+        return [null_rest] if descending else [null_rest, value_rows]
+    
+    value_rest = (f"({column}, id) {op} (?, ?)", [value, last_id])
+    return [value_rest, null_rows] if descending else [value_rest]
+
+def list_transcriptions_page(start_date=None, end_date=None, sort_by=None, sort_order=None, cursor=None, limit=50):
+    """
+    Página da lista de transcrições com paginação por chave (seek) sobre (coluna, id):
+    o custo não depende da posição da página. Seleciona apenas as colunas da tabela.
+    Retorna {'items', 'next_cursor', 'prev_cursor', 'sort_by', 'sort_order'}
+    """
+    if sort_by not in SORTABLE_COLUMNS:
+        sort_by = 'created_at'
+    if sort_order and sort_order.upper() in ['ASC', 'DESC']:
+        sort_order = sort_order.upper()
+    else:
+        # Padrão é descendente para datas, ascendente para o resto
+        sort_order = 'DESC' if sort_by == 'created_at' else 'ASC'
+    
+    page = {'items': [], 'next_cursor': None, 'prev_cursor': None, 'sort_by': sort_by, 'sort_order': sort_order}
+    position = decode_page_cursor(cursor, sort_by, sort_order)
+    backwards = position is not None and position[2] == 'prev'
+    
+    # Para voltar uma página, percorrer na ordem inversa e depois inverter o resultado
+    descending = (sort_order == 'DESC') != backwards
+    direction = 'DESC' if descending else 'ASC'
+    
+    try:
+        with get_db_connection() as conn:
+            filters = []
+            filter_params = []
+            if start_date:
+                filters.append("created_at >= ?")
+                filter_params.append(start_date)
+            if end_date:
+                filters.append("created_at <= ?")
+                filter_params.append(end_date)
+            
+            rows = []
+            for condition, condition_params in _seek_segments(sort_by, descending, position):
+                query = (f"SELECT {', '.join(TRANSCRIPTION_LIST_COLUMNS)} FROM transcriptions "
+                         f"WHERE {' AND '.join(filters + [condition])} "
+                         f"ORDER BY {sort_by} {direction}, id {direction} LIMIT ?")
+                params = filter_params + condition_params + [limit + 1 - len(rows)]
+                rows.extend(dict(row) for row in conn.execute(query, params).fetchall())
+                if len(rows) > limit:
+                    break
+    except Exception as e:
+        logger.error(f"Erro ao listar transcrições: {e}")
+        return page
+    
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    if backwards:
+        items.reverse()
+    page['items'] = items
+    if not items:
+        return page
+    
+    if backwards:
+        page['next_cursor'] = encode_page_cursor(sort_by, sort_order, items[-1], 'next')
+        if has_more:
+            page['prev_cursor'] = encode_page_cursor(sort_by, sort_order, items[0], 'prev')
+    else:
+        if has_more:
+            page['next_cursor'] = encode_page_cursor(sort_by, sort_order, items[-1], 'next')
+        if position:
+            page['prev_cursor'] = encode_page_cursor(sort_by, sort_order, items[0], 'prev')
+    return page
+
+def _search_transcriptions_like(search_term, start_date=None, end_date=None, limit=100):
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            pattern = f"%{search_term}%"
+            query = (f"SELECT {', '.join(TRANSCRIPTION_LIST_COLUMNS)} FROM transcriptions "
+                     "WHERE (project LIKE ? OR description LIKE ?)")
+            params = [pattern, pattern]
+            if start_date:
+                query += " AND created_at >= ?"
+                params.append(start_date)
+            if end_date:
+                query += " AND created_at <= ?"
+                params.append(end_date)
+            query += " ORDER BY created_at DESC LIMIT ?"
+            params.append(limit)
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Erro ao buscar transcrições: {e}")
+        return []
+
+def save_utterances(trans_id, utterances):
+    """Salva as falas (lista de Utterance) de uma transcrição, substituindo as anteriores"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM utterances WHERE transcription_id = ?", (trans_id,))
+            cursor.executemany(
+                """INSERT INTO utterances (transcription_id, idx, speaker, start_ms, end_ms, text)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [(trans_id, index, u.speaker, u.start, u.end, u.text) for index, u in enumerate(utterances)]
+            )
+            _refresh_speakers(cursor, trans_id)
+            conn.commit()
+            logger.info(f"{len(utterances)} falas salvas para a transcrição {trans_id}")
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao salvar falas: {e}")
+        return False
+
+def _refresh_speakers(cursor, trans_id):
+    """Recalcula os speakers de uma transcrição a partir das falas salvas"""
+    cursor.execute("DELETE FROM speakers WHERE transcription_id = ?", (trans_id,))
+    cursor.execute(
+        """INSERT INTO speakers (transcription_id, name, first_idx, utterance_count, speaking_ms)
+           SELECT transcription_id, speaker, MIN(idx), COUNT(*), SUM(MAX(end_ms - start_ms, 0))
+           FROM utterances WHERE transcription_id = ? AND speaker IS NOT NULL
+           GROUP BY speaker""",
+        (trans_id,)
+    )
+
+def get_speakers(trans_id):
+    """Obtém os speakers de uma transcrição na ordem em que aparecem, com falas e tempo de fala"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT name, utterance_count, speaking_ms FROM speakers
+                   WHERE transcription_id = ? ORDER BY first_idx""",
+                (trans_id,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Erro ao buscar speakers: {e}")
+        return []
+
+def save_artifact(trans_id, kind, path, size_bytes=None):
+    """Registra um arquivo gerado para a transcrição (audio, docx, txt), com caminho relativo à pasta"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute(
+                """INSERT INTO artifacts (transcription_id, kind, path, size_bytes, created_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(transcription_id, kind) DO UPDATE SET
+                       path = excluded.path, size_bytes = excluded.size_bytes, created_at = excluded.created_at""",
+                (trans_id, kind, path, size_bytes, int(time.time()))
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao registrar artefato: {e}")
+        return False
+
+def get_artifacts(trans_id):
+    """Obtém os arquivos registrados de uma transcrição, por tipo"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT kind, path, size_bytes, created_at FROM artifacts WHERE transcription_id = ?",
+                           (trans_id,))
+            return {row['kind']: dict(row) for row in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"Erro ao buscar artefatos: {e}")
+        return {}
+
+def get_utterances(trans_id, start_ms=None, end_ms=None):
+    """Obtém as falas de uma transcrição, opcionalmente apenas as que cobrem o intervalo [start_ms, end_ms]"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            query = "SELECT idx, speaker, start_ms, end_ms, text FROM utterances WHERE transcription_id = ?"
+            params = [trans_id]
+            
+            if start_ms is not None:
+                query += " AND end_ms > ?"
+                params.append(start_ms)
+                
+            if end_ms is not None:
+                query += " AND start_ms < ?"
+                params.append(end_ms)
+            
+            query += " ORDER BY idx"
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Erro ao buscar falas: {e}")
+        return []
+
 def delete_transcription(trans_id):
-    """Exclui uma transcrição pelo ID"""
+    """Exclui uma transcrição pelo ID (falas, speakers e artefatos saem em cascata)"""
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -223,6 +586,86 @@ def delete_transcription(trans_id):
         logger.error(f"Erro ao excluir transcrição: {e}")
         return False
 
+def get_maintenance_state(name, default=None):
+    """Obtém o valor salvo de uma tarefa de manutenção"""
+    try:
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT value FROM maintenance_state WHERE name = ?", (name,)).fetchone()
+            return row['value'] if row else default
+    except Exception as e:
+        logger.error(f"Erro ao buscar estado de manutenção: {e}")
+        return default
+
+def set_maintenance_state(name, value):
+    """Salva o valor de uma tarefa de manutenção"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute(
+                """INSERT INTO maintenance_state (name, value, updated_at) VALUES (?, ?, ?)
+                   ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at""",
+                (name, value, int(time.time()))
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao salvar estado de manutenção: {e}")
+        return False
+
+def get_backfill_batch(after_seq, limit):
+    """
+    Próximas transcrições (por seq) com duração ou número de speakers zerados
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT t.seq, t.id, t.folder_path, t.transcription,
+                          t.audio_duration, t.estimated_cost, t.speakers_count,
+                          (SELECT path FROM artifacts a
+                           WHERE a.transcription_id = t.id AND a.kind = 'audio') AS audio_path
+                   FROM transcriptions t
+                   WHERE t.seq > ? AND (t.audio_duration = 0 OR t.speakers_count = 0)
+                   ORDER BY t.seq LIMIT ?""",
+                (after_seq, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Erro ao buscar lote do backfill: {e}")
+        return []
+
+def apply_backfill_batch(updates, state_name, last_seq):
+    """
+    Grava um lote do backfill e a nova posição na mesma transação.
+    updates é uma lista de tuplas (audio_duration, estimated_cost, speakers_count, id)
+    """
+    try:
+        with get_db_connection() as conn:
+            conn.executemany(
+                "UPDATE transcriptions SET audio_duration = ?, estimated_cost = ?, speakers_count = ? WHERE id = ?",
+                updates
+            )
+            conn.execute(
+                """INSERT INTO maintenance_state (name, value, updated_at) VALUES (?, ?, ?)
+                   ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at""",
+                (state_name, str(last_seq), int(time.time()))
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao gravar lote do backfill: {e}")
+        return False
+
+def count_utterance_speakers(trans_id):
+    """Conta os speakers registrados a partir das falas estruturadas de uma transcrição"""
+    try:
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT COUNT(*) AS total FROM speakers WHERE transcription_id = ?",
+                               (trans_id,)).fetchone()
+            return row['total'] if row else 0
+    except Exception as e:
+        logger.error(f"Erro ao contar speakers: {e}")
+        return 0
+
 def count_speakers_in_transcription(transcription):
     """Conta quantos speakers diferentes existem na transcrição"""
     try:
@@ -234,4 +677,456 @@ def count_speakers_in_transcription(transcription):
         return len(speakers)
     except Exception as e:
         logger.error(f"Erro ao contar speakers: {e}")
-        return 0
\ No newline at end of file
+        return 0
+
+def create_job(job_id, trans_id, payload):
+    """Registra um novo job na fila com status 'queued'"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            current_time = int(time.time())
+            cursor.execute(
+                """INSERT INTO jobs (id, trans_id, status, payload, created_at)
+                   VALUES (?, ?, 'queued', ?, ?)""",
+                (job_id, trans_id, json.dumps(payload), current_time)
+            )
+            conn.commit()
+            logger.info(f"Job {job_id} criado para a transcrição {trans_id}")
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao criar job: {e}")
+        return False
+
+def update_job_status(job_id, status, current_stage=None, error=None):
+    """Atualiza o status de um job (queued, running, done, failed)"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            current_time = int(time.time())
+            updates = ["status = ?"]
+            params = [status]
+            
+            if status in ('done', 'failed'):
+                updates.append("finished_at = ?")
+                params.append(current_time)
+            
+            if current_stage is not None:
+                updates.append("current_stage = ?")
+                params.append(current_stage)
+                
+            if error is not None:
+                updates.append("error = ?")
+                params.append(error)
+            
+            params.append(job_id)
+            cursor.execute(f"UPDATE jobs SET {', '.join(updates)} WHERE id = ?", params)
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao atualizar job: {e}")
+        return False
+
+def claim_job(job_id, owner):
+    """Marca um job 'queued' como 'running' para o processo owner; retorna False se outro worker já o assumiu"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            current_time = int(time.time())
+            cursor.execute(
+                """UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), owner = ?,
+                                  heartbeat_at = ?, attempts = attempts + 1
+                   WHERE id = ? AND status = 'queued'""",
+                (current_time, owner, current_time, job_id)
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+    except Exception as e:
+        logger.error(f"Erro ao assumir job: {e}")
+        return False
+
+def touch_jobs(job_ids, owner):
+    """Renova o batimento dos jobs em execução neste processo"""
+    if not job_ids:
+        return True
+    try:
+        with get_db_connection() as conn:
+            current_time = int(time.time())
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                [(current_time, job_id, owner) for job_id in job_ids]
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao renovar o batimento dos jobs: {e}")
+        return False
+
+def requeue_stale_jobs(heartbeat_before, max_attempts):
+    """Devolve à fila os jobs 'running' sem batimento desde heartbeat_before (processo encerrado).
+    Os que já usaram todas as tentativas são marcados como 'failed'. Retorna os IDs devolvidos"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            current_time = int(time.time())
+            stale = "status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)"
+            cursor.execute(
+                f"""UPDATE jobs SET status = 'failed', finished_at = ?, owner = NULL,
+                                   error = 'Processamento interrompido e tentativas esgotadas'
+                    WHERE {stale} AND attempts >= ?""",
+                (current_time, heartbeat_before, max_attempts)
+            )
+            cursor.execute(f"SELECT id FROM jobs WHERE {stale} ORDER BY created_at", (heartbeat_before,))
+            job_ids = [row['id'] for row in cursor.fetchall()]
+            cursor.execute(f"UPDATE jobs SET status = 'queued', owner = NULL WHERE {stale}", (heartbeat_before,))
+            conn.commit()
+            return job_ids
+    except Exception as e:
+        logger.error(f"Erro ao devolver jobs interrompidos à fila: {e}")
+        return []
+
+def start_job_stage(job_id, stage):
+    """Registra o início de uma etapa do job"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            current_time = int(time.time())
+            cursor.execute(
+                """INSERT OR REPLACE INTO job_stages (job_id, stage, started_at, finished_at, duration)
+                   VALUES (?, ?, ?, NULL, NULL)""",
+                (job_id, stage, current_time)
+            )
+            cursor.execute("UPDATE jobs SET current_stage = ? WHERE id = ?", (stage, job_id))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao registrar etapa do job: {e}")
+        return False
+
+def finish_job_stage(job_id, stage, duration):
+    """Registra o fim de uma etapa do job e sua duração em segundos"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            current_time = int(time.time())
+            cursor.execute(
+                "UPDATE job_stages SET finished_at = ?, duration = ? WHERE job_id = ? AND stage = ?",
+                (current_time, duration, job_id, stage)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao finalizar etapa do job: {e}")
+        return False
+
+def get_job(job_id):
+    """Obtém um job pelo ID, incluindo suas etapas"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            result = cursor.fetchone()
+            
+            if not result:
+                return None
+            
+            job = dict(result)
+            job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+            
+            cursor.execute(
+                "SELECT stage, started_at, finished_at, duration FROM job_stages WHERE job_id = ? ORDER BY rowid",
+                (job_id,)
+            )
+            job['stages'] = [dict(row) for row in cursor.fetchall()]
+            return job
+    except Exception as e:
+        logger.error(f"Erro ao buscar job: {e}")
+        return None
+
+def get_queued_jobs():
+    """Obtém os IDs dos jobs aguardando um worker, em ordem de criação"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")
+            return [row['id'] for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Erro ao listar jobs pendentes: {e}")
+        return []
+
+def create_upload(upload_id, filename, file_path, total_size, metadata):
+    """Registra um envio retomável"""
+    try:
+        with get_db_connection() as conn:
+            current_time = int(time.time())
+            conn.execute(
+                """INSERT INTO uploads (id, filename, file_path, total_size, received, metadata, status,
+                                        created_at, updated_at)
+                   VALUES (?, ?, ?, ?, 0, ?, 'uploading', ?, ?)""",
+                (upload_id, filename, file_path, total_size, json.dumps(metadata), current_time, current_time)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao registrar envio: {e}")
+        return False
+
+def get_upload(upload_id):
+    """Obtém um envio retomável pelo ID"""
+    try:
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+            if not row:
+                return None
+            upload = dict(row)
+            upload['metadata'] = json.loads(upload['metadata']) if upload['metadata'] else {}
+            return upload
+    except Exception as e:
+        logger.error(f"Erro ao buscar envio: {e}")
+        return None
+
+def update_upload_received(upload_id, received):
+    """Atualiza a quantidade de bytes já gravados de um envio"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("UPDATE uploads SET received = ?, updated_at = ? WHERE id = ?",
+                         (received, int(time.time()), upload_id))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao atualizar envio: {e}")
+        return False
+
+def complete_upload(upload_id, job_id):
+    """Marca um envio como concluído e associa o job criado para ele"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("UPDATE uploads SET status = 'complete', job_id = ?, updated_at = ? WHERE id = ?",
+                         (job_id, int(time.time()), upload_id))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao concluir envio: {e}")
+        return False
+
+def get_stale_uploads(updated_before):
+    """Obtém os envios incompletos sem atividade desde updated_before (epoch)"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.execute(
+                "SELECT id, file_path FROM uploads WHERE status = 'uploading' AND updated_at < ?",
+                (updated_before,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Erro ao listar envios abandonados: {e}")
+        return []
+
+def delete_upload(upload_id):
+    """Remove o registro de um envio"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM uploads WHERE id = ?", (upload_id,))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao excluir envio: {e}")
+        return False
+
+def create_recording(recording_id, filename, file_path, mimetype):
+    """Registra uma gravação enviada em blocos"""
+    try:
+        with get_db_connection() as conn:
+            current_time = int(time.time())
+            conn.execute(
+                """INSERT INTO recordings (id, filename, file_path, mimetype, received, status, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, 0, 'recording', ?, ?)""",
+                (recording_id, filename, file_path, mimetype, current_time, current_time)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao registrar gravação: {e}")
+        return False
+
+def get_recording(recording_id):
+    """Obtém uma gravação pelo ID"""
+    try:
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT * FROM recordings WHERE id = ?", (recording_id,)).fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Erro ao buscar gravação: {e}")
+        return None
+
+def update_recording_received(recording_id, received):
+    """Atualiza a quantidade de bytes já gravados de uma gravação"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("UPDATE recordings SET received = ?, updated_at = ? WHERE id = ?",
+                         (received, int(time.time()), recording_id))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao atualizar gravação: {e}")
+        return False
+
+def complete_recording(recording_id, job_id):
+    """Marca uma gravação como concluída e associa o job criado para ela"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("UPDATE recordings SET status = 'complete', job_id = ?, updated_at = ? WHERE id = ?",
+                         (job_id, int(time.time()), recording_id))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao concluir gravação: {e}")
+        return False
+
+def get_stale_recordings(updated_before):
+    """Obtém as gravações não concluídas sem atividade desde updated_before (epoch)"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.execute(
+                "SELECT id, file_path FROM recordings WHERE status = 'recording' AND updated_at < ?",
+                (updated_before,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Erro ao listar gravações abandonadas: {e}")
+        return []
+
+def delete_recording(recording_id):
+    """Remove o registro de uma gravação"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao excluir gravação: {e}")
+        return False
+
+def get_audio_probe(path, file_size, mtime_ns):
+    """Obtém os metadados de áudio armazenados, se o arquivo não mudou desde a análise"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT info FROM audio_probes WHERE path = ? AND file_size = ? AND mtime_ns = ?",
+                (path, file_size, mtime_ns)
+            )
+            result = cursor.fetchone()
+            return json.loads(result['info']) if result else None
+    except Exception as e:
+        logger.error(f"Erro ao buscar metadados de áudio: {e}")
+        return None
+
+def save_audio_probe(path, file_size, mtime_ns, info):
+    """Armazena os metadados de áudio de um arquivo"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            current_time = int(time.time())
+            cursor.execute(
+                """INSERT OR REPLACE INTO audio_probes (path, file_size, mtime_ns, info, created_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (path, file_size, mtime_ns, json.dumps(info), current_time)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao salvar metadados de áudio: {e}")
+        return False
+
+def _increment_cache_counter(cursor, name, amount=1):
+    cursor.execute(
+        """INSERT INTO cache_counters (name, value) VALUES (?, ?)
+           ON CONFLICT(name) DO UPDATE SET value = value + excluded.value""",
+        (name, amount)
+    )
+
+def get_cached_transcript(audio_hash, options_key):
+    """Busca uma transcrição bruta no cache, registrando o acerto ou a falha"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT transcript, audio_duration FROM transcript_cache WHERE audio_hash = ? AND options_key = ?",
+                (audio_hash, options_key)
+            )
+            result = cursor.fetchone()
+            
+            if result:
+                current_time = int(time.time())
+                cursor.execute(
+                    """UPDATE transcript_cache SET hits = hits + 1, last_used_at = ?
+                       WHERE audio_hash = ? AND options_key = ?""",
+                    (current_time, audio_hash, options_key)
+                )
+                _increment_cache_counter(cursor, 'transcript_cache_hits')
+            else:
+                _increment_cache_counter(cursor, 'transcript_cache_misses')
+            
+            conn.commit()
+            return dict(result) if result else None
+    except Exception as e:
+        logger.error(f"Erro ao buscar transcrição no cache: {e}")
+        return None
+
+def save_cached_transcript(audio_hash, options_key, transcript, audio_duration=None):
+    """Armazena uma transcrição bruta no cache"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            current_time = int(time.time())
+            cursor.execute(
+                """INSERT OR REPLACE INTO transcript_cache
+                   (audio_hash, options_key, transcript, audio_duration, created_at, last_used_at, hits)
+                   VALUES (?, ?, ?, ?, ?, ?, 0)""",
+                (audio_hash, options_key, transcript, audio_duration, current_time, current_time)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Erro ao salvar transcrição no cache: {e}")
+        return False
+
+def evict_cached_transcripts(max_entries, max_age_days):
+    """Remove entradas não usadas há mais de max_age_days e as menos usadas recentemente além de max_entries"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM transcript_cache WHERE last_used_at < ?",
+                (int(time.time() - max_age_days * 86400),)
+            )
+            removed = cursor.rowcount
+            cursor.execute(
+                """DELETE FROM transcript_cache WHERE rowid NOT IN
+                   (SELECT rowid FROM transcript_cache ORDER BY last_used_at DESC LIMIT ?)""",
+                (max_entries,)
+            )
+            removed += cursor.rowcount
+            if removed:
+                _increment_cache_counter(cursor, 'transcript_cache_evictions', removed)
+            conn.commit()
+            return removed
+    except Exception as e:
+        logger.error(f"Erro ao limpar o cache de transcrições: {e}")
+        return 0
+
+def get_cache_stats():
+    """Obtém os contadores do cache de transcrições e o número de entradas"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, value FROM cache_counters")
+            stats = {row['name']: row['value'] for row in cursor.fetchall()}
+            cursor.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(LENGTH(transcript)), 0) AS size FROM transcript_cache")
+            row = cursor.fetchone()
+            stats['transcript_cache_entries'] = row['entries']
+            stats['transcript_cache_bytes'] = row['size']
+            return stats
+    except Exception as e:
+        logger.error(f"Erro ao obter estatísticas do cache: {e}")
+        return {}
@@ -0,0 +1,386 @@
+import sqlite3
+import logging
+from datetime import datetime
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+def _legacy_epoch(value):
+    """
+    Converte as datas antigas em texto ("AAAA-MM-DD HH:MM:SS", hora local) para epoch
+    """
+    if value is None or isinstance(value, (int, float)):
+        return None if value is None else int(value)
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d"):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+def _migration_1_initial(cursor):
+    """
+    Esquema anterior ao controle de versão. Em bancos antigos, adiciona as colunas
+    que faltarem (esta verificação agora roda uma única vez)
+    """
+    cursor.execute('''CREATE TABLE IF NOT EXISTS transcriptions (
+                        id TEXT PRIMARY KEY,
+                        filename TEXT,
+                        project TEXT,
+                        description TEXT,
+                        transcription TEXT,
+                        created_at TIMESTAMP,
+                        folder_path TEXT,
+                        file_size INTEGER,
+                        speakers_count INTEGER,
+                        audio_duration INTEGER,
+                        estimated_cost REAL,
+                        audio_path TEXT)''')
+
+    cursor.execute("PRAGMA table_info(transcriptions)")
+    columns = [column[1] for column in cursor.fetchall()]
+    for column, column_type in [('created_at', 'TIMESTAMP'), ('folder_path', 'TEXT'), ('file_size', 'INTEGER'),
+                                ('speakers_count', 'INTEGER'), ('audio_duration', 'INTEGER'),
+                                ('estimated_cost', 'REAL'), ('audio_path', 'TEXT')]:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE transcriptions ADD COLUMN {column} {column_type}")
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS utterances (
+                        transcription_id TEXT NOT NULL,
+                        idx INTEGER NOT NULL,
+                        speaker TEXT,
+                        start_ms INTEGER NOT NULL,
+                        end_ms INTEGER NOT NULL,
+                        text TEXT,
+                        PRIMARY KEY (transcription_id, idx))''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        trans_id TEXT,
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        current_stage TEXT,
+                        payload TEXT,
+                        error TEXT,
+                        created_at TIMESTAMP,
+                        started_at TIMESTAMP,
+                        finished_at TIMESTAMP)''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS job_stages (
+                        job_id TEXT NOT NULL,
+                        stage TEXT NOT NULL,
+                        started_at TIMESTAMP,
+                        finished_at TIMESTAMP,
+                        duration REAL,
+                        PRIMARY KEY (job_id, stage))''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS audio_probes (
+                        path TEXT PRIMARY KEY,
+                        file_size INTEGER,
+                        mtime_ns INTEGER,
+                        info TEXT,
+                        created_at TIMESTAMP)''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS transcript_cache (
+                        audio_hash TEXT NOT NULL,
+                        options_key TEXT NOT NULL,
+                        transcript BLOB NOT NULL,
+                        audio_duration REAL,
+                        created_at TIMESTAMP,
+                        last_used_at TIMESTAMP,
+                        hits INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (audio_hash, options_key))''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS cache_counters (
+                        name TEXT PRIMARY KEY,
+                        value INTEGER NOT NULL DEFAULT 0)''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS maintenance_state (
+                        name TEXT PRIMARY KEY,
+                        value TEXT,
+                        updated_at TIMESTAMP)''')
+
+def _migration_2_normalized(cursor):
+    """
+    Modelo normalizado: transcrições, falas, speakers, artefatos e jobs, com datas em
+    epoch (INTEGER) e índices de cobertura para a lista e os filtros por data
+    """
+    # Tabelas e triggers de busca são recriados ao final
+    for table in ('transcriptions_fts', 'utterances_fts'):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    for trigger in ('transcriptions_defaults', 'transcriptions_not_null',
+                    'transcriptions_fts_insert', 'transcriptions_fts_delete', 'transcriptions_fts_update',
+                    'utterances_fts_insert', 'utterances_fts_delete', 'utterances_fts_update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    # Transcrições: seq é o rowid estável usado pelo índice de busca;
+    # as colunas derivadas nunca ficam NULL
+    cursor.execute('''CREATE TABLE transcriptions_new (
+                        seq INTEGER PRIMARY KEY,
+                        id TEXT NOT NULL UNIQUE,
+                        filename TEXT,
+                        project TEXT,
+                        description TEXT,
+                        transcription TEXT,
+                        created_at INTEGER NOT NULL,
+                        folder_path TEXT,
+                        file_size INTEGER NOT NULL DEFAULT 0,
+                        speakers_count INTEGER NOT NULL DEFAULT 0,
+                        audio_duration REAL NOT NULL DEFAULT 0,
+                        estimated_cost REAL NOT NULL DEFAULT 0)''')
+    cursor.execute('''INSERT INTO transcriptions_new
+                        (id, filename, project, description, transcription, created_at, folder_path,
+                         file_size, speakers_count, audio_duration, estimated_cost)
+                      SELECT id, filename, project, description, transcription,
+                             COALESCE(legacy_epoch(created_at), 0), folder_path,
+                             COALESCE(file_size, 0), COALESCE(speakers_count, 0), COALESCE(audio_duration, 0),
+                             COALESCE(estimated_cost, COALESCE(audio_duration, 0) * (0.37 / 3600))
+                      FROM transcriptions WHERE id IS NOT NULL ORDER BY rowid''')
+
+    # Arquivos gerados por transcrição (áudio do player, DOCX, TXT), caminho relativo à pasta
+    cursor.execute('''CREATE TABLE artifacts (
+                        transcription_id TEXT NOT NULL REFERENCES transcriptions (id) ON DELETE CASCADE,
+                        kind TEXT NOT NULL,
+                        path TEXT NOT NULL,
+                        size_bytes INTEGER,
+                        created_at INTEGER NOT NULL,
+                        PRIMARY KEY (transcription_id, kind)) WITHOUT ROWID''')
+    cursor.execute('''INSERT INTO artifacts (transcription_id, kind, path, created_at)
+                      SELECT id, 'audio', audio_path, COALESCE(legacy_epoch(created_at), 0)
+                      FROM transcriptions WHERE id IS NOT NULL AND audio_path IS NOT NULL AND audio_path != ''
+                      ''')
+
+    cursor.execute("DROP TABLE transcriptions")
+    cursor.execute("ALTER TABLE transcriptions_new RENAME TO transcriptions")
+
+    # Índice de cobertura da ordem padrão (e dos filtros por data): a lista é lida só do índice
+    cursor.execute('''CREATE INDEX idx_transcriptions_created_at ON transcriptions
+                      (created_at, id, project, filename, file_size, speakers_count, audio_duration, estimated_cost)''')
+    # Índices (coluna, id) para a paginação por chave nas demais ordenações
+    for column in ('project', 'filename', 'file_size', 'speakers_count', 'audio_duration', 'estimated_cost'):
+        cursor.execute(f"CREATE INDEX idx_transcriptions_{column} ON transcriptions ({column}, id)")
+
+    # Falas: seq é o rowid estável do índice de busca
+    cursor.execute('''CREATE TABLE utterances_new (
+                        seq INTEGER PRIMARY KEY,
+                        transcription_id TEXT NOT NULL REFERENCES transcriptions (id) ON DELETE CASCADE,
+                        idx INTEGER NOT NULL,
+                        speaker TEXT,
+                        start_ms INTEGER NOT NULL,
+                        end_ms INTEGER NOT NULL,
+                        text TEXT,
+                        UNIQUE (transcription_id, idx))''')
+    cursor.execute('''INSERT INTO utterances_new (transcription_id, idx, speaker, start_ms, end_ms, text)
+                      SELECT transcription_id, idx, speaker, start_ms, end_ms, text FROM utterances
+                      WHERE transcription_id IN (SELECT id FROM transcriptions)
+                      ORDER BY transcription_id, idx''')
+    cursor.execute("DROP TABLE utterances")
+    cursor.execute("ALTER TABLE utterances_new RENAME TO utterances")
+    # Cobre as buscas por intervalo de tempo do player sem ler a tabela
+    cursor.execute("CREATE INDEX idx_utterances_start ON utterances (transcription_id, start_ms, end_ms)")
+
+    # Speakers por transcrição, na ordem em que aparecem
+    cursor.execute('''CREATE TABLE speakers (
+                        transcription_id TEXT NOT NULL REFERENCES transcriptions (id) ON DELETE CASCADE,
+                        name TEXT NOT NULL,
+                        first_idx INTEGER NOT NULL,
+                        utterance_count INTEGER NOT NULL DEFAULT 0,
+                        speaking_ms INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (transcription_id, name)) WITHOUT ROWID''')
+    cursor.execute('''INSERT INTO speakers (transcription_id, name, first_idx, utterance_count, speaking_ms)
+                      SELECT transcription_id, speaker, MIN(idx), COUNT(*), SUM(MAX(end_ms - start_ms, 0))
+                      FROM utterances WHERE speaker IS NOT NULL
+                      GROUP BY transcription_id, speaker''')
+
+    # Jobs e etapas com datas em epoch
+    cursor.execute('''CREATE TABLE jobs_new (
+                        id TEXT PRIMARY KEY,
+                        trans_id TEXT,
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        current_stage TEXT,
+                        payload TEXT,
+                        error TEXT,
+                        created_at INTEGER NOT NULL,
+                        started_at INTEGER,
+                        finished_at INTEGER)''')
+    cursor.execute('''INSERT INTO jobs_new
+                      SELECT id, trans_id, status, current_stage, payload, error,
+                             COALESCE(legacy_epoch(created_at), 0), legacy_epoch(started_at), legacy_epoch(finished_at)
+                      FROM jobs''')
+    cursor.execute('''CREATE TABLE job_stages_new (
+                        job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+                        stage TEXT NOT NULL,
+                        started_at INTEGER,
+                        finished_at INTEGER,
+                        duration REAL,
+                        PRIMARY KEY (job_id, stage))''')
+    cursor.execute('''INSERT INTO job_stages_new
+                      SELECT job_id, stage, legacy_epoch(started_at), legacy_epoch(finished_at), duration
+                      FROM job_stages WHERE job_id IN (SELECT id FROM jobs) ORDER BY rowid''')
+    cursor.execute("DROP TABLE job_stages")
+    cursor.execute("DROP TABLE jobs")
+    cursor.execute("ALTER TABLE jobs_new RENAME TO jobs")
+    cursor.execute("ALTER TABLE job_stages_new RENAME TO job_stages")
+    # Cobre a retomada dos jobs pendentes (status, ordem de criação, id)
+    cursor.execute("CREATE INDEX idx_jobs_status ON jobs (status, created_at, id)")
+
+    # Caches e estado de manutenção: mesmas tabelas, datas convertidas para epoch
+    cursor.execute("UPDATE audio_probes SET created_at = legacy_epoch(created_at)")
+    cursor.execute('''UPDATE transcript_cache SET created_at = legacy_epoch(created_at),
+                                                  last_used_at = COALESCE(legacy_epoch(last_used_at), 0)''')
+    cursor.execute("DROP INDEX IF EXISTS idx_transcript_cache_last_used")
+    cursor.execute("CREATE INDEX idx_transcript_cache_last_used ON transcript_cache (last_used_at)")
+    cursor.execute("UPDATE maintenance_state SET updated_at = legacy_epoch(updated_at)")
+    # As transcrições foram renumeradas: o backfill recomeça do início
+    cursor.execute("DELETE FROM maintenance_state WHERE name = 'backfill_derived_columns'")
+
+    _create_search_index(cursor)
+
+def _create_search_index(cursor):
+    """
+    Índices FTS5 (transcrições e falas) no modo external content sobre seq, mantidos
+    em sincronia por triggers, e indexação das linhas existentes
+    """
+    try:
+        cursor.execute('''CREATE VIRTUAL TABLE transcriptions_fts USING fts5(
+                            project, description, transcription,
+                            content='transcriptions', content_rowid='seq',
+                            tokenize='unicode61 remove_diacritics 2')''')
+        cursor.execute('''CREATE VIRTUAL TABLE utterances_fts USING fts5(
+                            text,
+                            content='utterances', content_rowid='seq',
+                            tokenize='unicode61 remove_diacritics 2')''')
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 indisponível nesta versão do SQLite, busca limitada ao nome: {e}")
+        return False
+
+    cursor.execute('''CREATE TRIGGER transcriptions_fts_insert AFTER INSERT ON transcriptions BEGIN
+                        INSERT INTO transcriptions_fts (rowid, project, description, transcription)
+                        VALUES (new.seq, new.project, new.description, new.transcription);
+                      END''')
+    cursor.execute('''CREATE TRIGGER transcriptions_fts_delete AFTER DELETE ON transcriptions BEGIN
+                        INSERT INTO transcriptions_fts (transcriptions_fts, rowid, project, description, transcription)
+                        VALUES ('delete', old.seq, old.project, old.description, old.transcription);
+                      END''')
+    cursor.execute('''CREATE TRIGGER transcriptions_fts_update
+                      AFTER UPDATE OF project, description, transcription ON transcriptions BEGIN
+                        INSERT INTO transcriptions_fts (transcriptions_fts, rowid, project, description, transcription)
+                        VALUES ('delete', old.seq, old.project, old.description, old.transcription);
+                        INSERT INTO transcriptions_fts (rowid, project, description, transcription)
+                        VALUES (new.seq, new.project, new.description, new.transcription);
+                      END''')
+
+    cursor.execute('''CREATE TRIGGER utterances_fts_insert AFTER INSERT ON utterances BEGIN
+                        INSERT INTO utterances_fts (rowid, text) VALUES (new.seq, new.text);
+                      END''')
+    cursor.execute('''CREATE TRIGGER utterances_fts_delete AFTER DELETE ON utterances BEGIN
+                        INSERT INTO utterances_fts (utterances_fts, rowid, text) VALUES ('delete', old.seq, old.text);
+                      END''')
+    cursor.execute('''CREATE TRIGGER utterances_fts_update AFTER UPDATE OF text ON utterances BEGIN
+                        INSERT INTO utterances_fts (utterances_fts, rowid, text) VALUES ('delete', old.seq, old.text);
+                        INSERT INTO utterances_fts (rowid, text) VALUES (new.seq, new.text);
+                      END''')
+
+    cursor.execute("INSERT INTO transcriptions_fts (transcriptions_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO utterances_fts (utterances_fts) VALUES ('rebuild')")
+    return True
+
+def _migration_3_uploads(cursor):
+    """
+    Envios retomáveis: tamanho total, bytes recebidos e metadados do formulário
+    """
+    cursor.execute('''CREATE TABLE uploads (
+                        id TEXT PRIMARY KEY,
+                        filename TEXT NOT NULL,
+                        file_path TEXT NOT NULL,
+                        total_size INTEGER NOT NULL,
+                        received INTEGER NOT NULL DEFAULT 0,
+                        metadata TEXT,
+                        status TEXT NOT NULL DEFAULT 'uploading',
+                        job_id TEXT,
+                        created_at INTEGER NOT NULL,
+                        updated_at INTEGER NOT NULL)''')
+    # Limpeza dos envios abandonados
+    cursor.execute("CREATE INDEX idx_uploads_status ON uploads (status, updated_at)")
+
+def _migration_4_recordings(cursor):
+    """
+    Gravações do navegador enviadas em blocos durante a captura
+    """
+    cursor.execute('''CREATE TABLE recordings (
+                        id TEXT PRIMARY KEY,
+                        filename TEXT NOT NULL,
+                        file_path TEXT NOT NULL,
+                        mimetype TEXT,
+                        received INTEGER NOT NULL DEFAULT 0,
+                        status TEXT NOT NULL DEFAULT 'recording',
+                        job_id TEXT,
+                        created_at INTEGER NOT NULL,
+                        updated_at INTEGER NOT NULL)''')
+    cursor.execute("CREATE INDEX idx_recordings_status ON recordings (status, updated_at)")
+
+def _migration_5_job_heartbeat(cursor):
+    """
+    Dono (host:pid) e batimento dos jobs em execução, e tentativas de cada job
+    """
+    cursor.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+    cursor.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at INTEGER")
+    cursor.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+# Migrações numeradas, aplicadas em ordem e uma única vez (versão em PRAGMA user_version).
+# Nunca altere uma migração já publicada: adicione uma nova ao final
+MIGRATIONS = [
+    (1, "esquema inicial", _migration_1_initial),
+    (2, "modelo normalizado com datas em epoch", _migration_2_normalized),
+    (3, "envios retomáveis", _migration_3_uploads),
+    (4, "gravações enviadas durante a captura", _migration_4_recordings),
+    (5, "dono, batimento e tentativas dos jobs", _migration_5_job_heartbeat),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """Versão do esquema gravada no cabeçalho do banco"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(conn):
+    """
+    Aplica as migrações pendentes, cada uma em sua transação junto com a nova versão.
+    Com o banco atualizado, custa apenas a leitura de PRAGMA user_version.
+    Retorna a versão final
+    """
+    version = get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    conn.create_function("legacy_epoch", 1, _legacy_epoch, deterministic=True)
+    # Tabelas são recriadas durante as migrações: chaves estrangeiras verificadas ao final
+    conn.execute("PRAGMA foreign_keys=OFF")
+    try:
+        for number, description, migration in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Outro processo pode ter aplicado a migração enquanto esperávamos o lock
+                version = get_schema_version(conn)
+                if number <= version:
+                    conn.rollback()
+                    continue
+
+                start = datetime.now()
+                migration(conn.cursor())
+
+                violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+                if violations:
+                    raise sqlite3.IntegrityError(f"{len(violations)} referências inválidas após a migração {number}")
+
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+                version = number
+                logger.info(f"Migração {number} ({description}) aplicada em "
+                            f"{(datetime.now() - start).total_seconds():.2f} segundos")
+            except Exception:
+                conn.rollback()
+                logger.error(f"Erro na migração {number} ({description}); banco mantido na versão {version}")
+                raise
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
+    return version
@@ -77,7 +77,7 @@ class Transcription:
                         """INSERT INTO transcriptions 
                            (id, filename, project, description, transcription, 
                             created_at, folder_path, file_size, speakers_count) 
-                           VALUES (?, ?, ?, ?, ?, datetime('now'), ?, ?, ?)""",
+                           VALUES (?, ?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER), ?, ?, ?)""",
                         (self.id, self.filename, self.project, self.description,
                          self.transcription, self.folder_path, self.file_size,
                          self.speakers_count)
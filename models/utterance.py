@@ -0,0 +1,40 @@
+class Utterance:
+    """
+    Fala de uma transcrição (speaker, texto e tempos em ms). Registro compacto com
+    __slots__, usado do retorno da AssemblyAI até a gravação no banco e as exportações
+    """
+    __slots__ = ('speaker', 'text', 'start', 'end')
+
+    def __init__(self, speaker, text, start=0, end=0):
+        self.speaker = speaker
+        self.text = text
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Cria uma fala a partir de uma linha da tabela utterances
+        """
+        return cls(row['speaker'], row['text'], row['start_ms'], row['end_ms'])
+
+    def as_line(self):
+        """
+        Linha no formato usado nos arquivos exportados ("Speaker: texto")
+        """
+        return f"{self.speaker}: {self.text}"
+
+    def __repr__(self):
+        return f"Utterance({self.speaker!r}, {self.text[:30]!r}, {self.start}, {self.end})"
+
+def render_transcript(utterances):
+    """
+    Gera o texto plano da transcrição (falas separadas por linha em branco)
+    """
+    return "\n\n".join(utterance.as_line() for utterance in utterances)
+
+def unique_speakers(utterances):
+    """
+    Speakers na ordem em que falam pela primeira vez
+    """
+    return list(dict.fromkeys(utterance.speaker for utterance in utterances))
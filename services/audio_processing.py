@@ -1,10 +1,67 @@
 import os
+import re
+import time
+import wave
+import shutil
 import logging
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
 from pydub import AudioSegment
+from pydub.utils import mediainfo_json
+from werkzeug.utils import secure_filename
+from models.database import get_audio_probe, save_audio_probe
+from utils.metrics import span
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
+# Diretório base para arquivos temporários por job (ex.: /dev/shm para usar tmpfs)
+SCRATCH_ROOT = os.getenv("SCRATCH_DIR") or None
+
+# Cache em memória dos metadados de áudio, chaveado por (caminho, tamanho, mtime);
+# usado ao mesmo tempo pelas requisições e pelos workers dos jobs
+_PROBE_CACHE = {}
+_PROBE_CACHE_MAX_ENTRIES = 1024
+_PROBE_CACHE_LOCK = threading.Lock()
+
+# Sem ffprobe (só o ffmpeg instalado), o cabeçalho é lido da saída de "ffmpeg -i"
+FFPROBE_AVAILABLE = any(shutil.which(name) for name in ("ffprobe", "avprobe"))
+
+# Versão para reprodução no navegador: mono, baixa taxa de bits (aac -> .m4a, opus -> .opus);
+# 24 kHz bastam para voz e reduzem o tempo de codificação do AAC
+PLAYBACK_CODEC = os.getenv("PLAYBACK_CODEC", "aac").lower()
+PLAYBACK_BITRATE = os.getenv("PLAYBACK_BITRATE", "48k")
+PLAYBACK_CODECS = {
+    'aac': (".m4a", ["-c:a", "aac", "-ar", "24000", "-movflags", "+faststart"]),
+    'opus': (".opus", ["-c:a", "libopus", "-application", "voip"]),
+}
+
+# Áudio enviado inteiro ao serviço de transcrição: antes do envio, o ffmpeg converte para
+# voz (mono 16 kHz) em FLAC (sem perdas além da reamostragem) ou Opus (bem menor); "off" envia o original
+UPLOAD_TRANSCODE = os.getenv("UPLOAD_TRANSCODE", "flac").lower()
+UPLOAD_TRANSCODE_OPUS_BITRATE = os.getenv("UPLOAD_TRANSCODE_OPUS_BITRATE", "32k")
+# Extensão, argumentos do ffmpeg e taxa de bits típica do resultado (bits/s)
+UPLOAD_TRANSCODE_CODECS = {
+    'flac': (".flac", ["-c:a", "flac"], 160_000),
+    'opus': (".ogg", ["-c:a", "libopus", "-application", "voip", "-b:a", UPLOAD_TRANSCODE_OPUS_BITRATE], 32_000),
+}
+# Fontes com taxa de bits até este múltiplo da taxa típica do resultado já são compactas
+UPLOAD_TRANSCODE_MIN_RATIO = float(os.getenv("UPLOAD_TRANSCODE_MIN_RATIO", "1.5"))
+# Codecs com perdas: convertê-los para FLAC só aumentaria o arquivo
+LOSSY_CODECS = {'aac', 'mp3', 'opus', 'vorbis', 'wmav1', 'wmav2', 'amr_nb', 'amr_wb', 'ac3', 'eac3'}
+
+# Gravações a partir desta duração (segundos) também ganham uma versão HLS segmentada
+PLAYBACK_HLS_MIN_SECONDS = float(os.getenv("PLAYBACK_HLS_MIN_SECONDS", "1800"))
+PLAYBACK_HLS_SEGMENT_SECONDS = int(os.getenv("PLAYBACK_HLS_SEGMENT_SECONDS", "10"))
+
+class InvalidAudioError(ValueError):
+    """
+    Arquivo sem áudio legível (cabeçalho inválido, corrompido ou sem duração).
+    Repetir o processamento não muda o resultado
+    """
+
 def convert_audio(file_path, output_format="wav"):
     """
     Converte o arquivo para o formato desejado
@@ -25,62 +82,271 @@ def convert_audio(file_path, output_format="wav"):
         logger.error(f"Erro ao converter áudio: {e}")
         return file_path
 
-def split_audio(file_path, segment_length=30):
+@contextmanager
+def job_scratch_dir(prefix="job_"):
     """
-    Divide o áudio em segmentos menores para processamento
+    Cria um diretório temporário exclusivo para um job (em SCRATCH_DIR, se configurado)
+    e o remove com todo o conteúdo ao final
     """
+    path = tempfile.mkdtemp(prefix=prefix, dir=SCRATCH_ROOT)
     try:
-        logger.info(f"Dividindo áudio em segmentos de {segment_length} segundos")
-        audio = AudioSegment.from_file(file_path)
-        
-        # Criar diretório para segmentos
-        segment_dir = os.path.join(os.path.dirname(file_path), "segments")
-        os.makedirs(segment_dir, exist_ok=True)
-        
-        segment_paths = []
-        segment_length_ms = segment_length * 1000  # Converter para milissegundos
-        
-        for i, start in enumerate(range(0, len(audio), segment_length_ms)):
-            end = min(start + segment_length_ms, len(audio))
-            segment = audio[start:end]
-            
-            segment_path = os.path.join(segment_dir, f"segment_{i}.wav")
-            segment.export(segment_path, format="wav")
-            segment_paths.append(segment_path)
-            
-        logger.info(f"Áudio dividido em {len(segment_paths)} segmentos")
-        return segment_paths
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Diretório temporário removido: {path}")
+
+def detect_silences(file_path, noise_db=-35, min_silence=0.5):
+    """
+    Detecta os trechos de silêncio do áudio com o filtro silencedetect do ffmpeg.
+    A saída é lida linha a linha, sem carregar o áudio em memória.
+    Retorna uma lista de tuplas (início, fim) em segundos
+    """
+    command = [
+        AudioSegment.converter, "-hide_banner", "-nostats", "-i", file_path,
+        "-vn", "-ac", "1", "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}",
+        "-f", "null", "-"
+    ]
+    silences = []
+    silence_start = None
+    
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               text=True, errors="ignore")
+    for line in process.stderr:
+        match = re.search(r'silence_start: (-?[\d.]+)', line)
+        if match:
+            silence_start = max(0.0, float(match.group(1)))
+            continue
+        match = re.search(r'silence_end: ([\d.]+)', line)
+        if match and silence_start is not None:
+            silences.append((silence_start, float(match.group(1))))
+            silence_start = None
+    
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg falhou ao detectar silêncios em {file_path}")
+    
+    # Silêncio que vai até o fim do arquivo
+    if silence_start is not None:
+        silences.append((silence_start, None))
+    
+    logger.info(f"{len(silences)} trechos de silêncio detectados em {file_path}")
+    return silences
+
+def plan_segments(duration, silences, segment_length, search_window=None):
+    """
+    Escolhe os pontos de corte a cada ~segment_length segundos, usando o meio do
+    silêncio mais próximo do alvo (dentro de search_window) para não cortar falas.
+    Retorna uma lista de tuplas (início, fim) em segundos
+    """
+    if search_window is None:
+        search_window = segment_length * 0.2
+    
+    midpoints = [(start + (end if end is not None else duration)) / 2 for start, end in silences]
+    cuts = [0.0]
+    
+    # Não deixar um último segmento muito curto
+    while duration - cuts[-1] > segment_length * 1.25:
+        target = cuts[-1] + segment_length
+        candidates = [m for m in midpoints
+                      if abs(m - target) <= search_window and m > cuts[-1] + segment_length / 2]
+        cuts.append(min(candidates, key=lambda m: abs(m - target)) if candidates else target)
+    
+    cuts.append(duration)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+def extract_segment(file_path, start, end, output_path):
+    """
+    Extrai o trecho [start, end] (em segundos) para um arquivo FLAC mono 16 kHz,
+    com o ffmpeg fazendo a leitura em streaming.
+    Um trecho por chamada (e não o segment muxer) porque as janelas da transcrição
+    segmentada se sobrepõem e só as que estão em envio precisam existir em disco
+    """
+    command = [
+        AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-y",
+        "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", file_path,
+        "-vn", "-ac", "1", "-ar", "16000", "-c:a", "flac", output_path
+    ]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return output_path
+
+def transcode_for_upload(file_path, output_dir, codec=UPLOAD_TRANSCODE):
+    """
+    Converte o áudio para voz (mono 16 kHz, FLAC ou Opus) antes do envio ao serviço
+    de transcrição, com o ffmpeg lendo em streaming. Retorna o caminho do arquivo
+    convertido, ou None quando a conversão está desligada ou não compensa (fonte já
+    compacta ou resultado maior que o original)
+    """
+    if codec not in UPLOAD_TRANSCODE_CODECS:
+        return None
+    extension, codec_arguments, target_bitrate = UPLOAD_TRANSCODE_CODECS[codec]
+    source_size = os.path.getsize(file_path)
+    
+    # Decidir antes de codificar, pela taxa de bits da fonte (quaisquer canais e taxa de amostragem)
+    try:
+        info = probe_audio(file_path, use_cache=False)
+        duration = info['duration_seconds']
+        source_bitrate = info.get('bit_rate') or (source_size * 8 / duration if duration > 0 else 0)
+        if codec == 'flac' and info.get('codec') in LOSSY_CODECS:
+            logger.info(f"Conversão antes do envio ignorada: áudio já comprimido com perdas ({info['codec']})")
+            return None
+        if 0 < source_bitrate <= target_bitrate * UPLOAD_TRANSCODE_MIN_RATIO:
+            logger.info(f"Conversão antes do envio ignorada: áudio já compacto ({source_bitrate / 1000:.0f} kbps)")
+            return None
+    except Exception as e:
+        # Sem cabeçalho legível: converter mesmo assim (o tamanho do resultado ainda é verificado)
+        logger.info(f"Não foi possível analisar o áudio antes da conversão: {e}")
+    
+    output_path = os.path.join(output_dir, f"upload_audio{extension}")
+    try:
+        _run_ffmpeg(["-i", file_path, "-vn", "-ac", "1", "-ar", "16000", *codec_arguments, output_path])
     except Exception as e:
-        logger.error(f"Erro ao dividir áudio: {e}")
-        return [file_path]  # Retorna o arquivo original em caso de erro
+        logger.error(f"Erro ao converter o áudio antes do envio: {e}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None
+    
+    # Proteção: a estimativa acima pode errar (ex.: taxa de bits ausente do cabeçalho)
+    if os.path.getsize(output_path) >= source_size:
+        logger.info("Conversão antes do envio descartada: o resultado não ficou menor que o original")
+        os.remove(output_path)
+        return None
+    return output_path
 
-def get_audio_info(file_path):
+def _read_ffmpeg_header(file_path):
+    """
+    Lê o cabeçalho pela saída de "ffmpeg -i" (sem arquivo de saída o ffmpeg só
+    analisa o contêiner e termina, sem decodificar o áudio)
+    """
+    result = subprocess.run([AudioSegment.converter, "-hide_banner", "-i", file_path],
+                            capture_output=True, text=True, errors="replace")
+    output = result.stderr
+    stream = re.search(r"Stream #\S+.*?: Audio: ([^,\s]+)[^,]*, (\d+) Hz, ([^,]+), ([^,\n]+)(?:, (\d+) kb/s)?", output)
+    if not stream:
+        raise ValueError(f"Nenhum stream de áudio encontrado por ffmpeg -i: {file_path}")
+    
+    duration = 0.0
+    duration_match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", output)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    bitrate_match = re.search(r"Duration: .*?bitrate: (\d+) kb/s", output)
+    
+    layout = stream.group(3).strip()
+    channels_match = re.match(r"(\d+) channels", layout)
+    channels = int(channels_match.group(1)) if channels_match else {
+        'mono': 1, 'stereo': 2, '2.1': 3, 'quad': 4, '5.0': 5, '5.1': 6, '7.1': 8
+    }.get(layout.split('(')[0], 0)
+    sample_format = stream.group(4).strip()
+    bit_rate = int(stream.group(5) or (bitrate_match.group(1) if bitrate_match else 0)) * 1000
+    
+    return {
+        'duration_seconds': duration,
+        'channels': channels,
+        # Como no ffprobe: largura só para PCM inteiro; formatos comprimidos ficam com 2 bytes
+        'sample_width': {'s24': 3, 's32': 4}.get(sample_format[:3], 2),
+        'frame_rate': int(stream.group(2)),
+        'codec': stream.group(1),
+        'bit_rate': bit_rate
+    }
+
+def _read_audio_header(file_path):
+    """
+    Lê duração, canais e taxa de amostragem do cabeçalho do contêiner (ffprobe),
+    sem decodificar o áudio. Sem ffprobe, usa a saída de "ffmpeg -i"; para WAV,
+    o módulo wave é a última alternativa
+    """
+    if FFPROBE_AVAILABLE:
+        try:
+            info = mediainfo_json(file_path)
+            streams = [s for s in info.get('streams', []) if s.get('codec_type') == 'audio']
+            if streams:
+                stream = streams[0]
+                duration = info.get('format', {}).get('duration') or stream.get('duration') or 0
+                bits_per_sample = int(stream.get('bits_per_sample') or 0)
+                return {
+                    'duration_seconds': float(duration),
+                    'channels': int(stream.get('channels') or 0),
+                    'sample_width': bits_per_sample // 8 if bits_per_sample else 2,
+                    'frame_rate': int(stream.get('sample_rate') or 0),
+                    'codec': stream.get('codec_name', ''),
+                    'bit_rate': int(info.get('format', {}).get('bit_rate') or stream.get('bit_rate') or 0)
+                }
+        except Exception as e:
+            logger.debug(f"ffprobe falhou para {file_path}: {e}")
+    
+    if file_path.lower().endswith('.wav'):
+        try:
+            with wave.open(file_path, 'rb') as wav_file:
+                frame_rate = wav_file.getframerate()
+                return {
+                    'duration_seconds': wav_file.getnframes() / frame_rate if frame_rate else 0,
+                    'channels': wav_file.getnchannels(),
+                    'sample_width': wav_file.getsampwidth(),
+                    'frame_rate': frame_rate,
+                    'codec': 'pcm',
+                    'bit_rate': frame_rate * wav_file.getnchannels() * wav_file.getsampwidth() * 8
+                }
+        except (wave.Error, EOFError) as e:
+            logger.debug(f"Módulo wave não leu {file_path}: {e}")
+    
+    try:
+        return _read_ffmpeg_header(file_path)
+    except Exception as e:
+        logger.debug(f"ffmpeg -i falhou para {file_path}: {e}")
+    
+    raise InvalidAudioError(f"Não foi possível ler o cabeçalho do áudio: {file_path}")
+
+def _cache_probe(key, info):
+    with _PROBE_CACHE_LOCK:
+        if key not in _PROBE_CACHE and len(_PROBE_CACHE) >= _PROBE_CACHE_MAX_ENTRIES:
+            _PROBE_CACHE.pop(next(iter(_PROBE_CACHE)))
+        _PROBE_CACHE[key] = info
+
+def probe_audio(file_path, use_cache=True):
+    """
+    Obtém as informações do arquivo de áudio lendo apenas o cabeçalho,
+    em memória constante. O resultado é armazenado no banco de dados para que
+    o mesmo arquivo (mesmo caminho, tamanho e data de modificação) não seja analisado de novo
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    
+    if use_cache:
+        with _PROBE_CACHE_LOCK:
+            info = _PROBE_CACHE.get(key)
+        if info:
+            return info
+        info = get_audio_probe(*key)
+        if info:
+            _cache_probe(key, info)
+            return info
+    
+    info = _read_audio_header(file_path)
+    
+    # Calcular tamanho do arquivo em MB
+    file_size_mb = stat.st_size / (1024 * 1024)
+    
+    # Calcular minutos e segundos
+    minutes = int(info['duration_seconds'] // 60)
+    seconds = int(info['duration_seconds'] % 60)
+    
+    info.update({
+        'file_size_bytes': stat.st_size,
+        'file_size_mb': round(file_size_mb, 2),
+        'duration_formatted': f"{minutes}m {seconds}s"
+    })
+    
+    if use_cache and info['duration_seconds'] > 0:
+        _cache_probe(key, info)
+        save_audio_probe(*key, info)
+    
+    return info
+
+def get_audio_info(file_path, use_cache=True):
     """
     Obtém informações sobre o arquivo de áudio
     """
     try:
-        audio = AudioSegment.from_file(file_path)
-        
-        # Calcular tamanho do arquivo em MB
-        file_size_bytes = os.path.getsize(file_path)
-        file_size_mb = file_size_bytes / (1024 * 1024)
-        
-        # Calcular duração em segundos
-        duration_seconds = len(audio) / 1000
-        
-        # Calcular minutos e segundos
-        minutes = int(duration_seconds // 60)
-        seconds = int(duration_seconds % 60)
-        
-        return {
-            'file_size_bytes': file_size_bytes,
-            'file_size_mb': round(file_size_mb, 2),
-            'duration_seconds': duration_seconds,
-            'duration_formatted': f"{minutes}m {seconds}s",
-            'channels': audio.channels,
-            'sample_width': audio.sample_width,
-            'frame_rate': audio.frame_rate
-        }
+        return probe_audio(file_path, use_cache=use_cache)
     except Exception as e:
         logger.error(f"Erro ao obter informações do áudio: {e}")
         return {
@@ -93,19 +359,72 @@ def get_audio_info(file_path):
             'frame_rate': 0
         }
 
-def cleanup_segments(directory):
+def move_audio_to_transcript_folder(source_path, target_folder, filename):
+    """
+    Move o arquivo de áudio original para a pasta da transcrição (sem cópia
+    quando estão no mesmo sistema de arquivos)
+    """
+    try:
+        # Garantir que o nome do arquivo seja seguro
+        safe_filename = secure_filename(filename)
+        
+        # Caminho completo do destino
+        audio_path = os.path.join(target_folder, safe_filename)
+        
+        shutil.move(source_path, audio_path)
+        return safe_filename
+    except Exception as e:
+        logger.error(f"Erro ao mover arquivo de áudio: {e}")
+        return None
+
+def _run_ffmpeg(arguments):
+    command = [AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-y", *arguments]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+def build_playback_renditions(source_path, target_folder, duration):
     """
-    Limpa os arquivos temporários de segmentos
+    Gera as versões para reprodução com o ffmpeg lendo o original em streaming:
+    um arquivo mono de baixa taxa de bits para voz (AAC ou Opus) e, para gravações
+    com mais de PLAYBACK_HLS_MIN_SECONDS, um HLS segmentado para o player buscar
+    qualquer ponto sem baixar o arquivo inteiro.
+    Retorna {'audio': nome do arquivo ou None, 'hls': caminho da playlist ou None}
     """
+    renditions = {'audio': None, 'hls': None}
+    extension, codec_arguments = PLAYBACK_CODECS.get(PLAYBACK_CODEC, PLAYBACK_CODECS['aac'])
+    
+    start_time = time.time()
+    playback_name = f"audio_playback{extension}"
+    temp_path = os.path.join(target_folder, f".tmp_{playback_name}")
     try:
-        segment_dir = os.path.join(directory, "segments")
-        if os.path.exists(segment_dir):
-            for file in os.listdir(segment_dir):
-                if file.startswith("segment_") and file.endswith(".wav"):
-                    os.remove(os.path.join(segment_dir, file))
-            logger.info(f"Segmentos temporários removidos de {segment_dir}")
-            return True
-        return False
+        with span("playback_encode"):
+            _run_ffmpeg(["-i", source_path, "-vn", "-ac", "1", *codec_arguments,
+                         "-b:a", PLAYBACK_BITRATE, temp_path])
+        os.replace(temp_path, os.path.join(target_folder, playback_name))
+        renditions['audio'] = playback_name
     except Exception as e:
-        logger.error(f"Erro ao limpar segmentos: {e}")
-        return False
\ No newline at end of file
+        logger.error(f"Erro ao gerar o áudio de reprodução: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    if duration and duration >= PLAYBACK_HLS_MIN_SECONDS:
+        hls_dir = os.path.join(target_folder, "hls")
+        temp_dir = os.path.join(target_folder, ".tmp_hls")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        try:
+            # HLS com AAC em MPEG-TS: reproduzido nativamente (Safari) ou pelo hls.js
+            with span("hls_encode"):
+                _run_ffmpeg(["-i", source_path, "-vn", "-ac", "1", "-c:a", "aac", "-ar", "24000",
+                             "-b:a", PLAYBACK_BITRATE, "-f", "hls", "-hls_time", str(PLAYBACK_HLS_SEGMENT_SECONDS),
+                             "-hls_playlist_type", "vod",
+                             "-hls_segment_filename", os.path.join(temp_dir, "segment_%05d.ts"),
+                             os.path.join(temp_dir, "playlist.m3u8")])
+            shutil.rmtree(hls_dir, ignore_errors=True)
+            os.replace(temp_dir, hls_dir)
+            renditions['hls'] = "hls/playlist.m3u8"
+        except Exception as e:
+            logger.error(f"Erro ao gerar o HLS de reprodução: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    logger.info(f"Versões de reprodução geradas em {time.time() - start_time:.2f} segundos: {renditions}")
+    return renditions
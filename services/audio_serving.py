@@ -0,0 +1,154 @@
+import os
+import stat
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+from flask import current_app, request
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+from models.database import get_transcription
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# O áudio de uma transcrição nunca muda depois de gravado: cache longo no navegador
+AUDIO_CACHE_MAX_AGE = int(os.getenv("AUDIO_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+
+# Quantos arquivos (trans_id, nome) ficam resolvidos em memória
+AUDIO_PATH_CACHE_SIZE = int(os.getenv("AUDIO_PATH_CACHE_SIZE", "1024"))
+
+# Entrega dos bytes: "" (pela aplicação), "x-sendfile" (Apache/lighttpd) ou "x-accel-redirect" (nginx)
+AUDIO_SENDFILE = os.getenv("AUDIO_SENDFILE", "").lower()
+
+# nginx: location interna que aponta para a pasta de saída (ex.: location /protected-output/ { internal; alias ...; })
+AUDIO_ACCEL_PREFIX = os.getenv("AUDIO_ACCEL_PREFIX", "/protected-output/")
+AUDIO_ACCEL_ROOT = os.path.abspath(os.getenv("AUDIO_ACCEL_ROOT", "output"))
+
+AUDIO_MIME_TYPES = {
+    '.mp3': "audio/mpeg",
+    '.wav': "audio/wav",
+    '.m4a': "audio/mp4",
+    '.ogg': "audio/ogg",
+    '.opus': "audio/ogg",
+    '.flac': "audio/flac",
+    # Picos da forma de onda (services/waveform.py)
+    '.peaks': "application/octet-stream",
+    # HLS
+    '.m3u8': "application/vnd.apple.mpegurl",
+    '.ts': "video/mp2t",
+}
+
+class AudioFile:
+    """
+    Arquivo de áudio já resolvido: caminho, tamanho, data de modificação e ETag
+    """
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'mimetype')
+
+    def __init__(self, path, size, mtime, etag, mimetype):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.etag = etag
+        self.mimetype = mimetype
+
+_audio_files = OrderedDict()
+_audio_files_lock = threading.Lock()
+
+def resolve_audio_file(trans_id, filename):
+    """
+    Localiza um arquivo de áudio da pasta da transcrição. O resultado fica em um
+    cache LRU, então as requisições seguintes (ex.: cada range de uma busca no player)
+    não consultam o banco nem o sistema de arquivos. Retorna None se não existir
+    """
+    key = (trans_id, filename)
+    with _audio_files_lock:
+        audio_file = _audio_files.get(key)
+        if audio_file is not None:
+            _audio_files.move_to_end(key)
+            return audio_file
+
+    transcription = get_transcription(trans_id)
+    if not transcription or not transcription.get('folder_path'):
+        return None
+
+    # Apenas arquivos dentro da pasta da transcrição
+    path = safe_join(os.path.abspath(transcription['folder_path']), filename)
+    if path is None:
+        return None
+
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+
+    # ETag forte: o conteúdo só muda junto com o tamanho ou a data de modificação
+    digest = hashlib.sha1(f"{trans_id}/{filename}:{file_stat.st_size}:{file_stat.st_mtime_ns}".encode('utf-8'))
+    extension = os.path.splitext(filename)[1].lower()
+    audio_file = AudioFile(path, file_stat.st_size, int(file_stat.st_mtime), digest.hexdigest()[:20],
+                           AUDIO_MIME_TYPES.get(extension, "audio/mpeg"))
+
+    with _audio_files_lock:
+        _audio_files[key] = audio_file
+        _audio_files.move_to_end(key)
+        while len(_audio_files) > AUDIO_PATH_CACHE_SIZE:
+            _audio_files.popitem(last=False)
+    return audio_file
+
+def invalidate_audio_files(trans_id):
+    """
+    Remove do cache os arquivos de uma transcrição (ex.: arquivo substituído ou removido)
+    """
+    with _audio_files_lock:
+        for key in [key for key in _audio_files if key[0] == trans_id]:
+            del _audio_files[key]
+
+def _accel_redirect_path(path):
+    relative = os.path.relpath(path, AUDIO_ACCEL_ROOT)
+    if relative.startswith(os.pardir):
+        return None
+    return AUDIO_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative.replace(os.sep, '/'))
+
+def send_audio_file(audio_file):
+    """
+    Resposta para um arquivo de áudio com ETag, Last-Modified e cache imutável.
+    Requisições condicionais recebem 304 e requisições com Range recebem 206 com
+    apenas o trecho pedido. Com AUDIO_SENDFILE, o servidor da frente envia os bytes
+    (e trata os ranges); a aplicação só define os cabeçalhos
+    """
+    accel_path = _accel_redirect_path(audio_file.path) if AUDIO_SENDFILE == "x-accel-redirect" else None
+
+    if accel_path:
+        response = current_app.response_class(mimetype=audio_file.mimetype)
+        response.headers['X-Accel-Redirect'] = accel_path
+    elif AUDIO_SENDFILE == "x-sendfile":
+        response = current_app.response_class(mimetype=audio_file.mimetype)
+        response.headers['X-Sendfile'] = audio_file.path
+    else:
+        file = open(audio_file.path, 'rb')
+        response = current_app.response_class(wrap_file(request.environ, file), mimetype=audio_file.mimetype,
+                                              direct_passthrough=True)
+        response.content_length = audio_file.size
+
+    response.set_etag(audio_file.etag)
+    response.last_modified = audio_file.mtime
+    response.cache_control.public = True
+    response.cache_control.max_age = AUDIO_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+
+    if accel_path or AUDIO_SENDFILE == "x-sendfile":
+        response = response.make_conditional(request.environ)
+        if response.status_code == 304:
+            response.headers.pop('X-Accel-Redirect', None)
+            response.headers.pop('X-Sendfile', None)
+        return response
+
+    try:
+        return response.make_conditional(request.environ, accept_ranges=True, complete_length=audio_file.size)
+    except Exception:
+        # Range inválido (416): fechar o arquivo antes de propagar
+        response.close()
+        raise
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import argparse
+import threading
+from models.database import (init_db, get_backfill_batch, apply_backfill_batch, get_maintenance_state,
+                             set_maintenance_state, count_utterance_speakers, count_speakers_in_transcription)
+from services.audio_processing import probe_audio
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Executar o backfill em segundo plano quando a aplicação começa a atender
+BACKFILL_ON_STARTUP = os.getenv("BACKFILL_ON_STARTUP", "0") == "1"
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "200"))
+
+# Nome do registro em maintenance_state com o último seq processado
+STATE_NAME = "backfill_derived_columns"
+
+def _derived_values(row):
+    """
+    Calcula duração, custo e número de speakers de uma transcrição antiga
+    """
+    audio_duration = row['audio_duration'] or 0
+    if not audio_duration and row['folder_path'] and row['audio_path']:
+        audio_file = os.path.join(row['folder_path'], row['audio_path'])
+        if os.path.exists(audio_file):
+            try:
+                # Leitura apenas do cabeçalho
+                audio_duration = probe_audio(audio_file)['duration_seconds']
+            except Exception as e:
+                logger.warning(f"Não foi possível calcular a duração de {row['id']}: {e}")
+
+    estimated_cost = audio_duration * (0.37 / 3600)  # $0.37 por hora
+
+    speakers_count = row['speakers_count'] or 0
+    if not speakers_count:
+        speakers_count = count_utterance_speakers(row['id']) or \
+            count_speakers_in_transcription(row['transcription'] or "")
+
+    return audio_duration, estimated_cost, speakers_count
+
+def backfill_derived_columns(batch_size=BACKFILL_BATCH_SIZE, max_batches=None, reset=False):
+    """
+    Preenche duração, custo e número de speakers das transcrições antigas em lotes,
+    cada um em uma transação. A posição é salva a cada lote, então uma execução
+    interrompida continua de onde parou. Retorna o número de linhas atualizadas
+    """
+    if reset:
+        set_maintenance_state(STATE_NAME, "0")
+    last_seq = int(get_maintenance_state(STATE_NAME, "0"))
+
+    start_time = time.time()
+    updated = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        rows = get_backfill_batch(last_seq, batch_size)
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            audio_duration, estimated_cost, speakers_count = _derived_values(row)
+            updates.append((audio_duration, estimated_cost, speakers_count, row['id']))
+
+        if not apply_backfill_batch(updates, STATE_NAME, rows[-1]['seq']):
+            logger.error(f"Backfill interrompido após o seq {last_seq}")
+            break
+
+        last_seq = rows[-1]['seq']
+        updated += len(updates)
+        batches += 1
+        logger.info(f"Backfill: lote {batches} com {len(updates)} transcrições (até o seq {last_seq})")
+
+    logger.info(f"Backfill concluído: {updated} transcrições em {time.time() - start_time:.2f} segundos")
+    return updated
+
+def start_backfill_thread():
+    """
+    Executa o backfill em uma thread em segundo plano
+    """
+    thread = threading.Thread(target=backfill_derived_columns, name="backfill", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Preenche duração, custo e speakers das transcrições antigas")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--reset", action="store_true", help="Recomeçar do início da tabela")
+    args = parser.parse_args()
+
+    init_db()
+    backfill_derived_columns(args.batch_size, args.max_batches, args.reset)
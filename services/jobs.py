@@ -0,0 +1,179 @@
+import os
+import time
+import queue
+import socket
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from models.database import (get_job, claim_job, update_job_status, start_job_stage,
+                             finish_job_stage, get_queued_jobs, touch_jobs, requeue_stale_jobs)
+from services.transcription_backends import TranscriptionError
+from utils.metrics import span, observe_job, JOBS_QUEUED
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Número de workers que processam os jobs em paralelo
+JOB_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "2"))
+
+# Batimento dos jobs em execução: intervalo de renovação e tempo sem batimento após o qual
+# o processo dono é considerado encerrado e o job volta para a fila (segundos)
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", "120"))
+
+# Tentativas de cada job (a primeira execução conta) e espera antes de cada nova tentativa
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+
+# Falhas passageiras, que valem uma nova tentativa: serviço de transcrição, rede e tempo
+# esgotado em subprocessos. Áudio inválido ou arquivo ausente falham na hora
+JOB_RETRYABLE_ERRORS = (TranscriptionError, ConnectionError, TimeoutError, subprocess.TimeoutExpired)
+
+# Identifica o processo dono dos jobs que ele executa
+JOB_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+@contextmanager
+def job_stage(job_id, stage):
+    """
+    Marca uma etapa do job, registrando início, fim e duração no banco de dados
+    e no histograma de etapas (/metrics)
+    """
+    start_job_stage(job_id, stage)
+    stage_span = span(stage)
+    try:
+        with stage_span:
+            yield
+    finally:
+        finish_job_stage(job_id, stage, stage_span.duration)
+        logger.info(f"Job {job_id}: etapa '{stage}' concluída em {stage_span.duration:.2f} segundos")
+
+class JobQueue:
+    """
+    Fila persistente de jobs processada por um pool de threads.
+    O estado de cada job fica no SQLite, de modo que jobs pendentes
+    são retomados quando a aplicação reinicia. Com vários processos, cada job
+    em execução tem um dono e um batimento: só os jobs cujo dono parou de
+    renovar o batimento voltam para a fila.
+    """
+    def __init__(self, handler, workers=JOB_WORKERS):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.owner = JOB_OWNER
+        self._queue = queue.Queue()
+        self._threads = []
+        self._running = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def ensure_started(self):
+        """
+        Inicia os workers uma única vez e re-enfileira os jobs pendentes
+        """
+        if self._started:
+            return
+
+        with self._lock:
+            if self._started:
+                return
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+            thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+            # Retomar jobs interrompidos (dono sem batimento) e os que aguardavam um worker;
+            # se outro processo também os enfileirar, claim_job garante uma única execução
+            requeue_stale_jobs(time.time() - JOB_HEARTBEAT_TIMEOUT, JOB_MAX_ATTEMPTS)
+            pending = get_queued_jobs()
+            for job_id in pending:
+                self._queue.put(job_id)
+
+            if pending:
+                logger.info(f"{len(pending)} job(s) pendente(s) re-enfileirado(s)")
+
+            self._started = True
+            logger.info(f"Fila de jobs iniciada com {self.workers} worker(s) ({self.owner})")
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            with self._lock:
+                running = list(self._running)
+            touch_jobs(running, self.owner)
+
+            # Jobs de outro processo que parou de responder
+            for job_id in requeue_stale_jobs(time.time() - JOB_HEARTBEAT_TIMEOUT, JOB_MAX_ATTEMPTS):
+                logger.warning(f"Job {job_id} sem batimento do dono; devolvido à fila")
+                self._queue.put(job_id)
+
+    def submit(self, job_id):
+        """
+        Enfileira um job já registrado no banco de dados
+        """
+        self.ensure_started()
+        self._queue.put(job_id)
+        JOBS_QUEUED.set(self._queue.qsize())
+        logger.info(f"Job {job_id} enfileirado (tamanho da fila: {self._queue.qsize()})")
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            JOBS_QUEUED.set(self._queue.qsize())
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id):
+        job = get_job(job_id)
+        if not job:
+            logger.error(f"Job {job_id} não encontrado no banco de dados")
+            return
+
+        # Um job pode ser enfileirado duas vezes (ex.: retomado no início);
+        # apenas o worker que o assumir no banco de dados o executa
+        if not claim_job(job_id, self.owner):
+            logger.info(f"Job {job_id} ignorado (status: {job['status']})")
+            return
+        job['attempts'] += 1
+
+        with self._lock:
+            self._running.add(job_id)
+        start_time = time.perf_counter()
+        try:
+            self.handler(job)
+            update_job_status(job_id, 'done', current_stage='done')
+            elapsed = time.perf_counter() - start_time
+            observe_job('done', elapsed)
+            logger.info(f"Job {job_id} concluído em {elapsed:.2f} segundos")
+        except Exception as e:
+            if is_retryable(job, e):
+                logger.warning(f"Job {job_id} falhou (tentativa {job['attempts']} de {JOB_MAX_ATTEMPTS}); "
+                               f"nova tentativa em {JOB_RETRY_DELAY * job['attempts']:.0f} segundos: {e}")
+                update_job_status(job_id, 'queued', error=str(e))
+                self._retry_later(job_id, JOB_RETRY_DELAY * job['attempts'])
+                observe_job('retried', time.perf_counter() - start_time)
+            else:
+                logger.error(f"Job {job_id} falhou: {e}")
+                update_job_status(job_id, 'failed', error=str(e))
+                observe_job('failed', time.perf_counter() - start_time)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _retry_later(self, job_id, delay):
+        timer = threading.Timer(delay, self._queue.put, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+
+def is_retryable(job, error):
+    """
+    Uma falha pode ser repetida enquanto houver tentativas e se for passageira
+    (JOB_RETRYABLE_ERRORS)
+    """
+    return job['attempts'] < JOB_MAX_ATTEMPTS and isinstance(error, JOB_RETRYABLE_ERRORS)
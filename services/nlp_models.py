@@ -0,0 +1,79 @@
+import os
+import time
+import logging
+import threading
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Modelo spaCy usado pela identificação de speakers
+SPACY_MODEL = os.getenv("SPACY_MODEL", "pt_core_news_sm")
+
+# Carregar o modelo em segundo plano logo que a aplicação começa a atender
+NLP_PREWARM = os.getenv("NLP_PREWARM", "0") == "1"
+
+class ModelRegistry:
+    """
+    Registro de modelos de NLP carregados sob demanda e compartilhados pelas threads
+    do processo. Nunca faz download em tempo de execução: o modelo deve ser instalado
+    antes (python -m spacy download pt_core_news_sm)
+    """
+    def __init__(self):
+        self._models = {}
+        self._load_times = {}
+        self._lock = threading.Lock()
+
+    def get(self, name=SPACY_MODEL):
+        """
+        Retorna o modelo, carregando-o na primeira chamada; None se não estiver disponível
+        """
+        if name in self._models:
+            return self._models[name]
+
+        with self._lock:
+            # Outra thread pode ter carregado enquanto esperávamos
+            if name in self._models:
+                return self._models[name]
+
+            start_time = time.time()
+            try:
+                import spacy
+                model = spacy.load(name)
+                load_time = time.time() - start_time
+                logger.info(f"Modelo spaCy '{name}' carregado em {load_time:.2f} segundos")
+            except Exception as e:
+                # Guardar a falha para não tentar de novo a cada chamada
+                model = None
+                load_time = time.time() - start_time
+                logger.error(f"Modelo spaCy '{name}' indisponível ({e}). "
+                             f"Instale com: python -m spacy download {name}")
+
+            self._load_times[name] = load_time
+            self._models[name] = model
+            return model
+
+    def prewarm(self, name=SPACY_MODEL):
+        """
+        Carrega o modelo em uma thread em segundo plano
+        """
+        if name in self._models:
+            return None
+
+        thread = threading.Thread(target=self.get, args=(name,), name=f"nlp-prewarm-{name}", daemon=True)
+        thread.start()
+        logger.info(f"Pré-carregamento do modelo spaCy '{name}' iniciado")
+        return thread
+
+    def load_times(self):
+        """
+        Tempo de carregamento (segundos) de cada modelo já carregado
+        """
+        return dict(self._load_times)
+
+registry = ModelRegistry()
+
+def get_nlp():
+    """
+    Retorna o modelo spaCy configurado (carregado sob demanda)
+    """
+    return registry.get(SPACY_MODEL)
@@ -0,0 +1,171 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from models.database import save_transcription, save_utterances, get_transcription, save_artifact
+from services.jobs import job_stage, is_retryable
+from services.audio_processing import (move_audio_to_transcript_folder, build_playback_renditions, probe_audio,
+                                       job_scratch_dir, InvalidAudioError)
+from services.transcribe import transcribe_audio_file
+from services.transcription_backends import TranscriptionError
+from services.waveform import build_peaks_file
+from utils.formatters import export_docx, export_meta_info, create_transcript_folder
+from utils.metrics import observe_realtime_factor
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Versões de reprodução e picos da forma de onda (ffmpeg) gerados em paralelo com a transcrição
+PLAYBACK_WORKERS = int(os.getenv("PLAYBACK_WORKERS", "2"))
+_playback_executor = ThreadPoolExecutor(max_workers=PLAYBACK_WORKERS, thread_name_prefix="playback")
+
+def process_transcription_job(job):
+    """
+    Executa as etapas do pipeline de upload para um job da fila:
+    análise do áudio, transcrição, cópia do áudio, gravação no banco e exportações
+    """
+    job_id = job['id']
+    trans_id = job['trans_id']
+    payload = job['payload']
+
+    file_path = payload['file_path']
+    filename = payload['filename']
+    project_name = payload['project_name']
+    description = payload['description']
+    split_audio = payload.get('split_audio', True)
+    transcription_options = payload.get('transcription_options') or {}
+
+    start_time = time.perf_counter()
+    playback_future = None
+    peaks_future = None
+    error = None
+
+    try:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Arquivo de upload não encontrado: {file_path}")
+
+        # Obter informações do arquivo
+        with job_stage(job_id, 'probe'):
+            try:
+                # Envio em partes: o cabeçalho já foi lido quando o último bloco chegou.
+                # Arquivo temporário: não vale a pena guardar os metadados no cache
+                audio_info = payload.get('audio_info') or probe_audio(file_path, use_cache=False)
+            except Exception as e:
+                raise InvalidAudioError(f"Arquivo de áudio inválido ou corrompido: {e}")
+            file_size = audio_info['file_size_bytes']
+            audio_duration = audio_info['duration_seconds']
+            if audio_duration == 0:
+                raise InvalidAudioError("Duração do áudio não pode ser zero")
+            estimated_cost = audio_duration * (0.37 / 3600)
+
+        # Criar pasta para a transcrição
+        folder_path = create_transcript_folder(trans_id, project_name)
+
+        # O ffmpeg gera as versões de reprodução enquanto a transcrição aguarda a API
+        playback_future = _playback_executor.submit(build_playback_renditions, file_path, folder_path, audio_duration)
+        peaks_future = _playback_executor.submit(build_peaks_file, file_path, folder_path)
+
+        # Segmentos e outros temporários ficam no diretório exclusivo do job
+        with job_stage(job_id, 'transcribe'), job_scratch_dir(prefix=f"job_{job_id[:8]}_") as scratch_dir:
+            result = transcribe_audio_file(file_path, split=split_audio,
+                                           transcription_options=transcription_options,
+                                           scratch_dir=scratch_dir,
+                                           audio_hash=payload.get('audio_hash'))
+            transcription = result['text']
+            speakers_count = result['speakers_count']
+
+            # Atualizar a duração e o custo se disponível na API
+            if 'audio_duration' in result:
+                audio_duration = result['audio_duration']
+                estimated_cost = audio_duration * (0.37 / 3600)
+                logger.info(f"Duração do áudio obtida da API: {audio_duration} segundos")
+
+        # Falhas da API chegam aqui como resultado vazio: podem ser repetidas
+        if not transcription or len(transcription.strip()) == 0 or speakers_count == 0:
+            raise TranscriptionError(transcription or "A transcrição está vazia")
+
+        with job_stage(job_id, 'playback'):
+            renditions = playback_future.result()
+
+        with job_stage(job_id, 'peaks'):
+            peaks_filename = peaks_future.result()
+
+        # Mover o original para a pasta da transcrição (fica arquivado, sem cópia)
+        with job_stage(job_id, 'audio_move'):
+            original_filename = move_audio_to_transcript_folder(file_path, folder_path, filename)
+
+        # Salvar transcrição no banco de dados
+        with job_stage(job_id, 'db_write'):
+            saved = save_transcription(
+                trans_id=trans_id,
+                filename=filename,
+                project_name=project_name,
+                description=description,
+                transcription=transcription,
+                folder_path=folder_path,
+                file_size=file_size,
+                speakers_count=speakers_count,
+                audio_duration=audio_duration,
+                estimated_cost=estimated_cost
+            )
+            if not saved:
+                raise RuntimeError("Falha ao salvar a transcrição no banco de dados")
+            
+            # Falas com os tempos reais, usadas pelo player
+            save_utterances(trans_id, result.get('utterances', []))
+
+            # Registrar o original e as versões do player; sem versão de reprodução, o player usa o original
+            if original_filename:
+                save_artifact(trans_id, 'original', original_filename,
+                              os.path.getsize(os.path.join(folder_path, original_filename)))
+            audio_filename = renditions['audio'] or original_filename
+            if audio_filename:
+                save_artifact(trans_id, 'audio', audio_filename,
+                              os.path.getsize(os.path.join(folder_path, audio_filename)))
+            if renditions['hls']:
+                save_artifact(trans_id, 'hls', renditions['hls'])
+            if peaks_filename:
+                save_artifact(trans_id, 'peaks', peaks_filename,
+                              os.path.getsize(os.path.join(folder_path, peaks_filename)))
+
+        # Gerar arquivos para download
+        with job_stage(job_id, 'docx'):
+            # Falas estruturadas; o texto só é separado se a transcrição não as tiver
+            dialogue = result.get('utterances') or transcription.split("\n\n")
+            
+            # Mesmos metadados do download, para que a exportação já fique em cache
+            saved_transcription = get_transcription(trans_id)
+            docx_path = export_docx(dialogue, folder_path, project_name, saved_transcription.get('description', ''),
+                                    export_meta_info(saved_transcription))
+            if docx_path:
+                save_artifact(trans_id, 'docx', os.path.basename(docx_path), os.path.getsize(docx_path))
+
+        with job_stage(job_id, 'txt'):
+            txt_path = os.path.join(folder_path, "transcricao.txt")
+            with open(txt_path, 'w', encoding='utf-8') as f:
+                f.write(transcription)
+            save_artifact(trans_id, 'txt', "transcricao.txt", os.path.getsize(txt_path))
+
+        total_time = time.perf_counter() - start_time
+        observe_realtime_factor(total_time, audio_duration)
+        logger.info(f"Job {job_id}: processamento completo em {total_time:.2f} segundos")
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # O ffmpeg pode ainda estar lendo o upload se a transcrição falhou
+        wait([future for future in (playback_future, peaks_future) if future is not None])
+
+        # Mantém o upload enquanto o job ainda puder ser repetido
+        if error is None or not is_retryable(job, error):
+            _remove_upload(file_path)
+
+def _remove_upload(file_path):
+    """
+    Remove o arquivo de upload temporário (normalmente já movido para a pasta da transcrição)
+    """
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception as cleanup_error:
+        logger.warning(f"Erro na limpeza de arquivos temporários: {cleanup_error}")
@@ -0,0 +1,267 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import subprocess
+from pydub import AudioSegment
+from werkzeug.exceptions import ClientDisconnected
+from models.database import (create_recording, get_recording, update_recording_received, delete_recording,
+                             get_stale_recordings)
+from services.audio_processing import probe_audio
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo de uma gravação (padrão: 2 GB)
+RECORDING_MAX_SIZE = int(os.getenv("RECORDING_MAX_SIZE", str(2 * 1024 ** 3)))
+
+# Gravações sem novos blocos por mais que isso são descartadas
+RECORDING_EXPIRE_HOURS = float(os.getenv("RECORDING_EXPIRE_HOURS", "6"))
+
+# Conversão feita enquanto a gravação acontece: WAV mono 16 kHz, o que a transcrição precisa
+# e que pode ser analisado só pelo cabeçalho
+RECORDING_SAMPLE_RATE = int(os.getenv("RECORDING_SAMPLE_RATE", "16000"))
+
+# Tempo máximo para o ffmpeg terminar a conversão depois do último bloco
+RECORDING_FINISH_TIMEOUT = float(os.getenv("RECORDING_FINISH_TIMEOUT", "60"))
+
+RECORDING_EXTENSIONS = {
+    'audio/webm': ".webm",
+    'audio/ogg': ".ogg",
+    'audio/mp4': ".m4a",
+    'audio/mpeg': ".mp3",
+    'audio/wav': ".wav",
+}
+
+# Bloco lido do corpo da requisição por vez
+RECORDING_READ_SIZE = 256 * 1024
+
+class RecordingConflictError(Exception):
+    """
+    Offset do bloco diferente do já gravado, gravação concluída ou outro bloco em andamento
+    """
+
+class LiveRecording:
+    """
+    Estado em memória de uma gravação em andamento: hash parcial e o ffmpeg que
+    converte o áudio à medida que os blocos chegam
+    """
+    __slots__ = ('lock', 'received', 'digest', 'process', 'wav_path')
+
+    def __init__(self, wav_path):
+        self.lock = threading.Lock()
+        self.received = 0
+        self.digest = hashlib.sha256()
+        self.process = None
+        self.wav_path = wav_path
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def _wav_path(recording):
+    return f"{os.path.splitext(recording['file_path'])[0]}.wav"
+
+def _start_transcoder(wav_path):
+    """
+    ffmpeg lendo o contêiner do navegador pela entrada padrão e gravando o WAV
+    """
+    command = [
+        AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", "pipe:0", "-vn", "-ac", "1", "-ar", str(RECORDING_SAMPLE_RATE),
+        "-c:a", "pcm_s16le", wav_path
+    ]
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+def _stop_transcoder(session, timeout=RECORDING_FINISH_TIMEOUT):
+    """
+    Fecha a entrada do ffmpeg e aguarda o fim da conversão. Retorna True se o WAV ficou completo
+    """
+    process, session.process = session.process, None
+    if process is None:
+        return False
+    try:
+        process.stdin.close()
+    except OSError:
+        pass
+    try:
+        return process.wait(timeout=timeout) == 0
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        logger.warning(f"Conversão da gravação não terminou em {timeout} segundos")
+        return False
+
+def _kill_transcoder(session):
+    process, session.process = session.process, None
+    if process is not None:
+        process.kill()
+        process.wait()
+
+def _get_session(recording):
+    """
+    Sessão em memória da gravação. Depois de um reinício a conversão ao vivo e o
+    hash parcial se perdem: o arquivo original segue para o pipeline e o hash é
+    calculado no final
+    """
+    with _sessions_lock:
+        session = _sessions.get(recording['id'])
+        if session is None:
+            session = LiveRecording(_wav_path(recording))
+            if recording['received'] == 0:
+                try:
+                    session.process = _start_transcoder(session.wav_path)
+                except Exception as e:
+                    logger.warning(f"Conversão ao vivo indisponível para a gravação {recording['id']}: {e}")
+            else:
+                session.digest = None
+            _sessions[recording['id']] = session
+        return session
+
+def _forget(recording_id):
+    with _sessions_lock:
+        return _sessions.pop(recording_id, None)
+
+def create_live_recording(recording_id, filename, file_path, mimetype):
+    """
+    Registra uma gravação e cria o arquivo vazio que recebe os blocos
+    """
+    cleanup_stale_recordings()
+
+    open(file_path, 'wb').close()
+    if not create_recording(recording_id, filename, file_path, mimetype):
+        os.remove(file_path)
+        raise RuntimeError("Erro ao registrar a gravação")
+
+    recording = get_recording(recording_id)
+    _get_session(recording)
+    logger.info(f"Gravação {recording_id} iniciada ({mimetype})")
+    return recording
+
+def append_recording_chunk(recording, offset, stream):
+    """
+    Acrescenta um bloco (ondataavailable do MediaRecorder) ao arquivo da gravação e
+    repassa os mesmos bytes ao ffmpeg, que converte o trecho já recebido enquanto a
+    entrevista continua. Retorna o offset após a gravação
+    """
+    session = _get_session(recording)
+    if not session.lock.acquire(blocking=False):
+        raise RecordingConflictError("Outro bloco desta gravação está sendo gravado")
+
+    try:
+        recording = get_recording(recording['id'])
+        if not recording:
+            raise RecordingConflictError("Gravação não encontrada")
+        if recording['status'] != 'recording':
+            raise RecordingConflictError("Gravação já concluída")
+        if offset != recording['received']:
+            raise RecordingConflictError(f"Offset esperado: {recording['received']}")
+
+        received = recording['received']
+        # Sessão fora de sincronia com o arquivo (ex.: falha ao salvar o offset): a conversão
+        # ao vivo não é mais confiável (o pipeline usará o arquivo original) e o hash é refeito no final
+        if session.received != received:
+            _kill_transcoder(session)
+            session.digest = None
+
+        try:
+            with open(recording['file_path'], 'r+b') as f:
+                f.seek(received)
+                f.truncate()
+                while received < RECORDING_MAX_SIZE:
+                    data = stream.read(min(RECORDING_READ_SIZE, RECORDING_MAX_SIZE - received))
+                    if not data:
+                        break
+                    f.write(data)
+                    received += len(data)
+                    session.received = received
+                    if session.digest is not None:
+                        session.digest.update(data)
+                    if session.process:
+                        try:
+                            session.process.stdin.write(data)
+                        except OSError as e:
+                            logger.warning(f"Conversão ao vivo da gravação {recording['id']} interrompida: {e}")
+                            _kill_transcoder(session)
+        except ClientDisconnected:
+            logger.warning(f"Conexão interrompida na gravação {recording['id']} em {received} bytes")
+        finally:
+            update_recording_received(recording['id'], received)
+
+        if session.process:
+            try:
+                session.process.stdin.flush()
+            except OSError:
+                _kill_transcoder(session)
+        return received
+    finally:
+        session.lock.release()
+
+def finish_live_recording(recording):
+    """
+    Encerra a gravação: aguarda o ffmpeg terminar (o áudio já foi convertido durante a
+    captura) e devolve o arquivo para o pipeline, o nome, o SHA-256 e as informações
+    do áudio. Sem a conversão ao vivo, o arquivo original é usado
+    """
+    if recording['received'] == 0:
+        raise ValueError("A gravação está vazia")
+
+    session = _forget(recording['id'])
+    wav_path = _wav_path(recording)
+    converted = False
+    if session:
+        with session.lock:
+            converted = _stop_transcoder(session) and os.path.exists(wav_path)
+
+    if session and session.digest is not None and session.received == recording['received']:
+        audio_hash = session.digest.hexdigest()
+    else:
+        digest = hashlib.sha256()
+        with open(recording['file_path'], 'rb') as f:
+            for data in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(data)
+        audio_hash = digest.hexdigest()
+
+    if converted:
+        os.remove(recording['file_path'])
+        file_path = wav_path
+        filename = f"{os.path.splitext(recording['filename'])[0]}.wav"
+    else:
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
+        file_path = recording['file_path']
+        filename = recording['filename']
+
+    try:
+        audio_info = probe_audio(file_path, use_cache=False)
+    except Exception as e:
+        raise ValueError(f"Arquivo de áudio inválido ou corrompido: {e}")
+    logger.info(f"Gravação {recording['id']} concluída: {recording['received']} bytes recebidos, "
+                f"{'convertida durante a captura' if converted else 'sem conversão ao vivo'}")
+    return file_path, filename, audio_hash, audio_info
+
+def discard_recording(recording):
+    """
+    Interrompe a conversão e remove os arquivos e o registro de uma gravação
+    """
+    session = _forget(recording['id'])
+    if session:
+        _kill_transcoder(session)
+    for path in (recording['file_path'], _wav_path(recording)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    delete_recording(recording['id'])
+
+def cleanup_stale_recordings():
+    """
+    Descarta as gravações abandonadas há mais de RECORDING_EXPIRE_HOURS
+    """
+    stale = get_stale_recordings(int(time.time() - RECORDING_EXPIRE_HOURS * 3600))
+    for recording in stale:
+        discard_recording(recording)
+    if stale:
+        logger.info(f"{len(stale)} gravações abandonadas removidas")
+    return len(stale)
@@ -1,22 +1,13 @@
 import re
 import logging
-import spacy
 from collections import defaultdict, Counter
+from models.utterance import Utterance
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
-# Carregar modelo spaCy para processamento de linguagem natural
-try:
-    nlp = spacy.load("pt_core_news_sm")
-except:
-    try:
-        import os
-        os.system("python -m spacy download pt_core_news_sm")
-        nlp = spacy.load("pt_core_news_sm")
-    except Exception as e:
-        logger.error(f"Erro ao carregar modelo spaCy: {e}")
-        nlp = None
+# O modelo spaCy é carregado sob demanda por services.nlp_models.get_nlp();
+# a identificação atual usa apenas expressões regulares
 
 # Lista de palavras que NÃO são nomes próprios válidos para speakers
 INVALID_SPEAKER_NAMES = [
@@ -138,13 +129,6 @@ def process_speakers_identification(transcript):
             speaker_identities[speaker_tag] = name
     
     # Criar uma versão aprimorada do objeto transcrição
-    class EnhancedUtterance:
-        def __init__(self, original_utterance, new_speaker):
-            self.speaker = new_speaker
-            self.text = original_utterance.text
-            self.start = original_utterance.start if hasattr(original_utterance, 'start') else 0
-            self.end = original_utterance.end if hasattr(original_utterance, 'end') else 0
-    
     class EnhancedTranscript:
         def __init__(self, original_transcript, speaker_mapping):
             self.utterances = []
@@ -155,7 +139,9 @@ def process_speakers_identification(transcript):
             # Copiar os utterances com os novos nomes de speakers
             for utterance in original_transcript.utterances:
                 new_speaker = speaker_mapping.get(utterance.speaker, f"Pessoa {utterance.speaker}")
-                self.utterances.append(EnhancedUtterance(utterance, new_speaker))
+                self.utterances.append(Utterance(new_speaker, utterance.text,
+                                                 getattr(utterance, 'start', 0) or 0,
+                                                 getattr(utterance, 'end', 0) or 0))
     
     # Criar a versão aprimorada da transcrição
     enhanced_transcript = EnhancedTranscript(transcript, speaker_identities)
@@ -163,57 +149,70 @@ def process_speakers_identification(transcript):
     logger.info(f"Speakers identificados: {speaker_identities}")
     return enhanced_transcript, speaker_identities
 
-def fix_transcript_speakers(formatted_text):
+def _speaker_mapping(lines):
     """
-    Corrige problemas com identificadores de speakers em um texto já formatado
+    Calcula o novo nome de cada speaker a partir de pares (speaker, texto)
     """
-    # Dividir o texto por linhas
-    segments = formatted_text.split('\n\n')
-    fixed_segments = []
     speaker_mapping = {}
     person_counter = 1
     
     # Primeira passada: identificar nomes inválidos de speakers
-    for segment in segments:
-        if ':' in segment:
-            parts = segment.split(':', 1)
-            speaker = parts[0].strip()
-            
-            # Verificar se é um identificador inválido
-            if (speaker.lower() in INVALID_SPEAKER_NAMES or 
-                re.match(r'^[A-Z]+$', speaker)):
-                if speaker not in speaker_mapping:
-                    speaker_mapping[speaker] = f"Pessoa {person_counter}"
-                    person_counter += 1
+    for speaker, _ in lines:
+        # Verificar se é um identificador inválido
+        if (speaker.lower() in INVALID_SPEAKER_NAMES or 
+            re.match(r'^[A-Z]+$', speaker)):
+            if speaker not in speaker_mapping:
+                speaker_mapping[speaker] = f"Pessoa {person_counter}"
+                person_counter += 1
     
     # Segunda passada: procurar auto-identificações
-    for i, segment in enumerate(segments):
-        if ':' in segment:
-            parts = segment.split(':', 1)
-            speaker = parts[0].strip()
-            text = parts[1].strip()
-            
-            # Verificar auto-identificação
-            name = extract_self_identifier(text)
-            if name:
-                # Atualizar mapeamento para todos os segments deste speaker
-                old_name = speaker_mapping.get(speaker, speaker)
-                for s, mapped_name in speaker_mapping.items():
-                    if mapped_name == old_name:
-                        speaker_mapping[s] = name
-    
-    # Terceira passada: aplicar correções
+    for speaker, text in lines:
+        name = extract_self_identifier(text)
+        if name:
+            # Atualizar mapeamento para todos os segments deste speaker
+            old_name = speaker_mapping.get(speaker, speaker)
+            for s, mapped_name in speaker_mapping.items():
+                if mapped_name == old_name:
+                    speaker_mapping[s] = name
+    
+    return speaker_mapping
+
+def fix_utterance_speakers(utterances):
+    """
+    Corrige os identificadores de speakers diretamente nas falas (lista de Utterance),
+    sem passar pelo texto formatado. Altera as falas e retorna a mesma lista
+    """
+    speaker_mapping = _speaker_mapping([(u.speaker, u.text) for u in utterances])
+    
+    for utterance in utterances:
+        if utterance.speaker in speaker_mapping:
+            utterance.speaker = speaker_mapping[utterance.speaker]
+    
+    return utterances
+
+def fix_transcript_speakers(formatted_text):
+    """
+    Corrige problemas com identificadores de speakers em um texto já formatado
+    (transcrições antigas, sem as falas estruturadas)
+    """
+    # Dividir o texto por linhas
+    segments = formatted_text.split('\n\n')
+    lines = []
     for segment in segments:
         if ':' in segment:
-            parts = segment.split(':', 1)
-            speaker = parts[0].strip()
-            text = parts[1].strip()
-            
-            if speaker in speaker_mapping:
-                fixed_segments.append(f"{speaker_mapping[speaker]}: {text}")
-            else:
-                fixed_segments.append(segment)
+            speaker, text = segment.split(':', 1)
+            lines.append((speaker.strip(), text.strip()))
+        else:
+            lines.append(None)
+    
+    speaker_mapping = _speaker_mapping([line for line in lines if line])
+    
+    # Aplicar correções
+    fixed_segments = []
+    for segment, line in zip(segments, lines):
+        if line and line[0] in speaker_mapping:
+            fixed_segments.append(f"{speaker_mapping[line[0]]}: {line[1]}")
         else:
             fixed_segments.append(segment)
     
-    return '\n\n'.join(fixed_segments)
\ No newline at end of file
+    return '\n\n'.join(fixed_segments)
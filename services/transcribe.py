@@ -1,10 +1,18 @@
 import os
 import time
 import logging
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import assemblyai as aai
-from utils.corrections import correct_text
-from services.speaker_identification import process_speakers_identification
+from utils.corrections import correct_texts
+from models.utterance import Utterance, render_transcript, unique_speakers
+from services.speaker_identification import process_speakers_identification, fix_utterance_speakers
+from services.audio_processing import (probe_audio, detect_silences, plan_segments, extract_segment, job_scratch_dir,
+                                       transcode_for_upload)
+from services.transcript_stitching import stitch_transcripts
+from services.transcript_cache import lookup_transcript, store_transcript
+from services.transcription_backends import AssemblyAIBackend, TranscriptionError, get_backend
+from utils.metrics import span, UPLOAD_BYTES_SAVED
 
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -12,125 +20,223 @@ load_dotenv()
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
-# Configuração da API AssemblyAI
-api_key = os.getenv("ASSEMBLYAI_API_KEY")
-if not api_key:
-    logger.error("ASSEMBLYAI_API_KEY não encontrada no ambiente. Verifique o arquivo .env")
-    raise ValueError("ASSEMBLYAI_API_KEY não configurada")
+# Transcrição segmentada: duração alvo de cada segmento, sobreposição entre
+# segmentos (para reconciliar os speakers) e número de envios simultâneos
+SEGMENT_LENGTH = int(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", "600"))
+SEGMENT_OVERLAP = float(os.getenv("TRANSCRIBE_SEGMENT_OVERLAP", "10"))
+MAX_PARALLEL_SEGMENTS = int(os.getenv("TRANSCRIBE_MAX_PARALLEL", "4"))
 
-aai.settings.api_key = api_key
+def build_transcription_config(options=None):
+    """
+    Função mantida para compatibilidade: configuração da AssemblyAI
+    """
+    return AssemblyAIBackend().build_config(options)
 
-def transcribe_with_assemblyai(file_path, options=None):
+def _transcribe_segment(backend, file_path, segment_path, window_start, end, options):
     """
-    Transcreve o áudio usando a API da AssemblyAI (versão atualizada)
+    Extrai um segmento e o envia ao backend de transcrição, com uma nova tentativa em caso de erro
     """
+    extract_segment(file_path, window_start, end, segment_path)
+    
     try:
-        # Configurar as opções de transcrição
-        config = aai.TranscriptionConfig(
-            speaker_labels=True,         # Ativar identificação de speakers
-            # language_code="pt",          # Definir idioma como português
-            punctuate=True,              # Adicionar pontuação automática
-            format_text=True,            # Formatar o texto automaticamente
-            # speech_recognizer removido pois não existe mais na API atual
-            language_detection=True      # Usar detecção automática de idioma
-        )
-        
-        # Aplicar opções avançadas se fornecidas
-        if options:
-            if 'audio_start_from' in options and options['audio_start_from'] > 0:
-                config.audio_start_from = options['audio_start_from']
-                logger.info(f"Iniciando transcrição a partir de {options['audio_start_from']} segundos")
-                
-            if 'audio_end_at' in options and options['audio_end_at'] > 0:
-                config.audio_end_at = options['audio_end_at']
-                logger.info(f"Terminando transcrição em {options['audio_end_at']} segundos")
-                
-            if 'word_boost' in options and options['word_boost']:
-                config.word_boost = options['word_boost']
-                logger.info(f"Palavras enfatizadas: {options['word_boost']}")
-                
-            if 'webhook_url' in options and options['webhook_url']:
-                config.webhook_url = options['webhook_url']
-                logger.info(f"Webhook configurado: {options['webhook_url']}")
-        
-        # Criar o objeto transcriber
-        transcriber = aai.Transcriber()
-        
-        logger.info(f"Iniciando transcrição com AssemblyAI: {file_path}")
-        start_time = time.time()
+        last_error = None
+        for attempt in range(2):
+            try:
+                with span("transcript_api"):
+                    return backend.transcribe(segment_path, options)
+            except TranscriptionError as e:
+                last_error = e
+            logger.warning(f"Erro na transcrição do segmento {segment_path} (tentativa {attempt + 1}): {last_error}")
+        
+        raise RuntimeError(f"Falha na transcrição do segmento {segment_path}: {last_error}")
+    finally:
+        # Só os segmentos em envio ficam em disco
+        if os.path.exists(segment_path):
+            os.remove(segment_path)
+
+def transcribe_segmented(file_path, backend, options=None, segment_length=SEGMENT_LENGTH,
+                         overlap=SEGMENT_OVERLAP, max_workers=MAX_PARALLEL_SEGMENTS,
+                         scratch_dir=None):
+    """
+    Divide o áudio em silêncios, transcreve os segmentos em paralelo e junta o resultado,
+    corrigindo os tempos pelo deslocamento de cada segmento e reconciliando os speakers.
+    Os segmentos são gravados em scratch_dir (o diretório do job) ou em um diretório
+    temporário próprio. Retorna None se o áudio é curto demais para ser dividido
+    """
+    if scratch_dir is None:
+        with job_scratch_dir(prefix="segments_") as own_dir:
+            return transcribe_segmented(file_path, backend, options, segment_length, overlap,
+                                        max_workers, scratch_dir=own_dir)
+    
+    duration = probe_audio(file_path, use_cache=False)['duration_seconds']
+    
+    # Evitar a passada de detecção de silêncio quando não haverá divisão
+    if duration <= segment_length * 1.25:
+        return None
+    
+    segments = plan_segments(duration, detect_silences(file_path), segment_length)
+    
+    if len(segments) < 2:
+        return None
+    
+    logger.info(f"Transcrição segmentada: {len(segments)} segmentos, até {max_workers} em paralelo")
+    
+    # Cada segmento (exceto o primeiro) começa `overlap` segundos antes do corte.
+    # A extração acontece dentro de cada worker, então no máximo max_workers
+    # segmentos existem em disco ao mesmo tempo
+    windows = [(max(0.0, start - overlap) if i > 0 else 0.0, start, end)
+               for i, (start, end) in enumerate(segments)]
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [
+            executor.submit(_transcribe_segment, backend, file_path,
+                            os.path.join(scratch_dir, f"segment_{i:04d}.flac"),
+                            window_start, end, options)
+            for i, (window_start, _, end) in enumerate(windows)
+        ]
+        transcripts = [future.result() for future in futures]
+    
+    parts = [(transcript, window_start, start)
+             for transcript, (window_start, start, _) in zip(transcripts, windows)]
+    return stitch_transcripts(parts, audio_duration=duration)
+
+@contextmanager
+def upload_audio_path(file_path, scratch_dir=None):
+    """
+    Áudio a enviar inteiro ao backend: a versão para voz gerada por transcode_for_upload
+    (removida ao final) ou, se ela não compensar, o original.
+    Gera (caminho, segundos gastos na conversão)
+    """
+    with ExitStack() as stack:
+        target_dir = scratch_dir or stack.enter_context(job_scratch_dir(prefix="upload_"))
+        with span("upload_transcode") as transcode_span:
+            compact_path = transcode_for_upload(file_path, target_dir)
+        if not compact_path:
+            yield file_path, transcode_span.duration
+            return
+        
+        source_size = os.path.getsize(file_path)
+        compact_size = os.path.getsize(compact_path)
+        logger.info(f"Áudio convertido para envio em {transcode_span.duration:.2f} segundos: "
+                    f"{source_size / 1024 / 1024:.1f} MB -> {compact_size / 1024 / 1024:.1f} MB")
+        try:
+            yield compact_path, transcode_span.duration
+        finally:
+            if os.path.exists(compact_path):
+                os.remove(compact_path)
+
+def _log_upload_savings(backend, file_path, upload_path, transcode_seconds):
+    """
+    Registra os bytes economizados e, com a vazão de envio do backend, o tempo de envio
+    economizado ao lado do tempo gasto na conversão (saldo do job)
+    """
+    if upload_path == file_path or not os.path.exists(upload_path):
+        return
+    saved_bytes = os.path.getsize(file_path) - os.path.getsize(upload_path)
+    UPLOAD_BYTES_SAVED.inc(saved_bytes)
+    message = (f"Conversão antes do envio economizou {saved_bytes / 1024 / 1024:.1f} MB "
+               f"(conversão: {transcode_seconds:.2f} segundos")
+    if backend.upload_rate:
+        saved_seconds = saved_bytes / backend.upload_rate
+        message += f"; envio: ~{saved_seconds:.1f} segundos a menos; saldo: ~{saved_seconds - transcode_seconds:.1f} segundos"
+    logger.info(message + ")")
+
+def transcribe_with_backend(file_path, options=None, split=False, segment_length=SEGMENT_LENGTH,
+                            scratch_dir=None, audio_hash=None, backend=None):
+    """
+    Transcreve o áudio com o backend configurado (AssemblyAI por padrão; veja
+    services/transcription_backends.py)
+    """
+    try:
+        backend = backend or get_backend()
+        
+        logger.info(f"Iniciando transcrição com {backend.name}: {file_path}")
         
         # Verificar se o arquivo existe
         if not os.path.exists(file_path):
             logger.error(f"Arquivo não encontrado: {file_path}")
             return None
         
-        # Iniciar a transcrição (método atualizado)
-        transcript = transcriber.transcribe(
-            file_path,
-            config=config
-        )
+        # O mesmo áudio com as mesmas opções já foi transcrito: reutilizar o resultado bruto
+        transcript = lookup_transcript(audio_hash, options)
         
-        if transcript.status == aai.TranscriptStatus.error:
-            logger.error(f"Erro na transcrição: {transcript.error}")
-            return None
-        
-        elapsed_time = time.time() - start_time
-        logger.info(f"Transcrição concluída em {elapsed_time:.2f} segundos")
+        if transcript is None:
+            # Áudios longos: segmentos em paralelo (recortes de tempo exigem o arquivo inteiro)
+            if split and not options:
+                try:
+                    transcript = transcribe_segmented(file_path, backend, options, segment_length=segment_length,
+                                                      scratch_dir=scratch_dir)
+                except Exception as e:
+                    logger.warning(f"Transcrição segmentada falhou, enviando o arquivo inteiro: {e}")
+                    transcript = None
+            
+            if transcript is None:
+                # Arquivo inteiro: enviar a versão para voz (mono 16 kHz), bem menor que o original
+                with upload_audio_path(file_path, scratch_dir) as (upload_path, transcode_seconds):
+                    try:
+                        # Só a chamada ao backend (envio, fila e processamento)
+                        with span("transcript_api") as api_span:
+                            transcript = backend.transcribe(upload_path, options)
+                    except TranscriptionError as e:
+                        logger.error(f"Erro na transcrição: {e}")
+                        return None
+                    logger.info(f"Transcrição concluída em {api_span.duration:.2f} segundos")
+                    _log_upload_savings(backend, file_path, upload_path, transcode_seconds)
+            
+            store_transcript(audio_hash, options, transcript)
         
         # Processar identificação de speakers
-        enhanced_transcript, speaker_names = process_speakers_identification(transcript)
+        with span("speaker_naming"):
+            enhanced_transcript, speaker_names = process_speakers_identification(transcript)
         logger.info(f"Identificação de speakers concluída: {speaker_names}")
         
         return enhanced_transcript
         
     except Exception as e:
-        logger.error(f"Erro na transcrição com AssemblyAI: {e}")
+        logger.error(f"Erro na transcrição com {getattr(backend, 'name', 'backend')}: {e}")
         return None
 
+# Nome anterior, mantido para compatibilidade
+transcribe_with_assemblyai = transcribe_with_backend
+
 def format_assemblyai_transcript(transcript):
     """
     Formata a saída da API AssemblyAI para o formato esperado pelo sistema
     com correção robusta de identificação de speakers
     """
-    from services.speaker_identification import fix_transcript_speakers
-    
     if not transcript or not hasattr(transcript, 'utterances'):
         return {
             'text': "Erro: Transcrição falhou ou não contém dados de speakers.",
             'speakers_count': 0,
-            'speakers': []
+            'speakers': [],
+            'utterances': []
         }
     
-    # Processar cada utterance para criar o formato esperado
-    formatted_lines = []
-    speakers = set()
+    # Corrigir todas as falas em um único lote
+    with span("corrections"):
+        corrected_texts = correct_texts([utterance.text for utterance in transcript.utterances])
     
-    for utterance in transcript.utterances:
-        speaker = utterance.speaker
-        speakers.add(speaker)
-        text = correct_text(utterance.text) 
-        formatted_lines.append(f"{speaker}: {text}")
-    
-    # Juntar em texto formatado
-    formatted_text = "\n\n".join(formatted_lines)
+    # Falas estruturadas: o texto plano só é gerado no final
+    utterances = [
+        Utterance(utterance.speaker, text, int(utterance.start or 0), int(utterance.end or 0))
+        for utterance, text in zip(transcript.utterances, corrected_texts)
+    ]
     
     # Aplicar correção avançada de identificação de speakers
-    fixed_text = fix_transcript_speakers(formatted_text)
+    with span("speaker_fix"):
+        fix_utterance_speakers(utterances)
     
-    # Recalcular speakers após correção
-    corrected_speakers = set()
-    for line in fixed_text.split('\n\n'):
-        if ':' in line:
-            speaker = line.split(':', 1)[0].strip()
-            corrected_speakers.add(speaker)
+    speakers = unique_speakers(utterances)
     
     return {
-        'text': fixed_text,
-        'speakers_count': len(corrected_speakers),
-        'speakers': list(corrected_speakers)
+        'text': render_transcript(utterances),
+        'speakers_count': len(speakers),
+        'speakers': speakers,
+        'utterances': utterances
     }
 
-def transcribe_audio_file(file_path, split=True, segment_length=30, transcription_options=None):
+def transcribe_audio_file(file_path, split=True, segment_length=SEGMENT_LENGTH, transcription_options=None,
+                          scratch_dir=None, audio_hash=None, backend=None):
     """
     Versão otimizada da função para processamento de áudio
     """
@@ -150,14 +256,17 @@ def transcribe_audio_file(file_path, split=True, segment_length=30, transcriptio
                 config_options['audio_end_at'] = transcription_options['audio_end_at']
         
         # Usar diretamente a API, pulando validações extras quando possível
-        transcript = transcribe_with_assemblyai(file_path, config_options)
+        transcript = transcribe_with_backend(file_path, config_options, split=split,
+                                             segment_length=segment_length, scratch_dir=scratch_dir,
+                                             audio_hash=audio_hash, backend=backend)
         
         if not transcript:
             logger.error("A transcrição falhou.")
             return {
                 'text': "Erro na transcrição do áudio.",
                 'speakers_count': 0,
-                'speakers': []
+                'speakers': [],
+                'utterances': []
             }
         
         # Medir e logar o tempo da transcrição
@@ -178,7 +287,8 @@ def transcribe_audio_file(file_path, split=True, segment_length=30, transcriptio
         return {
             'text': f"Erro no processamento de áudio: {str(e)}",
             'speakers_count': 0,
-            'speakers': []
+            'speakers': [],
+            'utterances': []
         }
 
 def process_transcription_text(text):
@@ -0,0 +1,103 @@
+import os
+import json
+import zlib
+import hashlib
+import logging
+from models.database import (get_cached_transcript, save_cached_transcript,
+                             evict_cached_transcripts)
+from services.transcript_stitching import StitchedTranscript, StitchedUtterance, StitchedWord
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Configuração do cache de transcrições
+CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE_ENABLED", "1") != "0"
+CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "500"))
+CACHE_MAX_AGE_DAYS = int(os.getenv("TRANSCRIPT_CACHE_MAX_AGE_DAYS", "180"))
+
+# Incrementar quando a configuração da AssemblyAI ou o formato serializado mudar
+CACHE_VERSION = 1
+
+def save_upload_with_hash(file_storage, file_path, chunk_size=1024 * 1024):
+    """
+    Grava o arquivo enviado em blocos, calculando o SHA-256 durante a gravação
+    (sem reler o arquivo). Retorna o hash em hexadecimal
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        while True:
+            chunk = file_storage.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def options_cache_key(options):
+    """
+    Gera a chave das opções de transcrição que alteram o resultado da API
+    """
+    relevant = {key: value for key, value in (options or {}).items() if key != 'webhook_url' and value}
+    return json.dumps({'version': CACHE_VERSION, 'options': relevant}, sort_keys=True)
+
+def _serialize_transcript(transcript):
+    utterances = []
+    for utterance in transcript.utterances or []:
+        utterances.append({
+            'speaker': utterance.speaker,
+            'text': utterance.text,
+            'start': utterance.start,
+            'end': utterance.end,
+            'confidence': getattr(utterance, 'confidence', None),
+            'words': [[w.text, w.start, w.end, getattr(w, 'confidence', None)]
+                      for w in (getattr(utterance, 'words', None) or [])]
+        })
+    return zlib.compress(json.dumps({'utterances': utterances}).encode('utf-8'))
+
+def _deserialize_transcript(data, audio_duration):
+    payload = json.loads(zlib.decompress(data).decode('utf-8'))
+    utterances = [
+        StitchedUtterance(
+            u['speaker'], u['text'], u['start'], u['end'], u.get('confidence'),
+            [StitchedWord(text, start, end, confidence, u['speaker'])
+             for text, start, end, confidence in u.get('words', [])]
+        )
+        for u in payload['utterances']
+    ]
+    return StitchedTranscript(utterances, audio_duration)
+
+def lookup_transcript(audio_hash, options=None):
+    """
+    Retorna a transcrição bruta armazenada para o áudio e as opções, ou None
+    """
+    if not CACHE_ENABLED or not audio_hash:
+        return None
+
+    cached = get_cached_transcript(audio_hash, options_cache_key(options))
+    if not cached:
+        logger.info(f"Cache de transcrição: falha para {audio_hash[:12]}")
+        return None
+
+    logger.info(f"Cache de transcrição: acerto para {audio_hash[:12]}, chamada à API evitada")
+    return _deserialize_transcript(cached['transcript'], cached['audio_duration'])
+
+def store_transcript(audio_hash, options, transcript):
+    """
+    Armazena a transcrição bruta (antes da identificação de speakers e das correções)
+    e aplica a política de remoção (idade máxima e LRU por número de entradas)
+    """
+    if not CACHE_ENABLED or not audio_hash:
+        return False
+
+    try:
+        data = _serialize_transcript(transcript)
+    except Exception as e:
+        logger.warning(f"Não foi possível serializar a transcrição para o cache: {e}")
+        return False
+
+    stored = save_cached_transcript(audio_hash, options_cache_key(options), data,
+                                    getattr(transcript, 'audio_duration', None))
+    removed = evict_cached_transcripts(CACHE_MAX_ENTRIES, CACHE_MAX_AGE_DAYS)
+    if removed:
+        logger.info(f"Cache de transcrição: {removed} entrada(s) removida(s)")
+    return stored
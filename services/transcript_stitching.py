@@ -0,0 +1,150 @@
+import logging
+from collections import defaultdict
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+class StitchedWord:
+    """
+    Palavra de um segmento com o tempo já corrigido pelo deslocamento do segmento
+    """
+    def __init__(self, text, start, end, confidence=None, speaker=None):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.confidence = confidence
+        self.speaker = speaker
+
+class StitchedUtterance:
+    """
+    Fala de um segmento com tempos absolutos (ms) e o rótulo global do speaker
+    """
+    def __init__(self, speaker, text, start, end, confidence=None, words=None):
+        self.speaker = speaker
+        self.text = text
+        self.start = start
+        self.end = end
+        self.confidence = confidence
+        self.words = words or []
+
+class StitchedTranscript:
+    """
+    Transcrição montada a partir de vários segmentos, com a mesma interface
+    usada pela identificação de speakers (utterances, text, audio_url, json_response)
+    """
+    def __init__(self, utterances, audio_duration=None):
+        self.utterances = utterances
+        self.text = " ".join(u.text for u in utterances)
+        self.audio_url = None
+        self.json_response = None
+        self.audio_duration = audio_duration
+
+def _speaker_label(index):
+    """
+    Gera rótulos no formato da AssemblyAI: A, B, ..., Z, AA, AB, ...
+    """
+    label = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        label = chr(ord('A') + remainder) + label
+    return label
+
+def _overlap_ms(a_start, a_end, b_start, b_end):
+    return max(0, min(a_end, b_end) - max(a_start, b_start))
+
+def _map_speakers(previous, current, region_start, region_end, known_labels, speaking_time):
+    """
+    Associa os rótulos locais de um segmento aos rótulos globais, usando o tempo
+    de fala coincidente na região sobreposta com o segmento anterior
+    """
+    scores = defaultdict(int)
+    previous_in_region = [u for u in previous if u.end > region_start and u.start < region_end]
+
+    for utterance in current:
+        if utterance.end <= region_start or utterance.start >= region_end:
+            continue
+        for other in previous_in_region:
+            overlap = _overlap_ms(
+                max(utterance.start, region_start), min(utterance.end, region_end),
+                max(other.start, region_start), min(other.end, region_end)
+            )
+            if overlap > 0:
+                scores[(utterance.speaker, other.speaker)] += overlap
+
+    mapping = {}
+    used = set()
+    for (local, global_label), _ in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+        if local not in mapping and global_label not in used:
+            mapping[local] = global_label
+            used.add(global_label)
+
+    # Speakers que não falaram na região sobreposta: associar aos speakers globais
+    # ainda livres, do mais ativo para o menos ativo; só então criar um rótulo novo
+    free_labels = sorted((label for label in known_labels if label not in used),
+                         key=lambda label: speaking_time[label], reverse=True)
+    for utterance in current:
+        local = utterance.speaker
+        if local in mapping:
+            continue
+        if free_labels:
+            mapping[local] = free_labels.pop(0)
+        else:
+            mapping[local] = _speaker_label(len(known_labels))
+            known_labels.append(mapping[local])
+        used.add(mapping[local])
+
+    return mapping
+
+def _shift_utterance(utterance, offset_ms):
+    words = [
+        StitchedWord(w.text, w.start + offset_ms, w.end + offset_ms,
+                     getattr(w, 'confidence', None), getattr(w, 'speaker', None))
+        for w in (getattr(utterance, 'words', None) or [])
+    ]
+    return StitchedUtterance(
+        utterance.speaker, utterance.text,
+        utterance.start + offset_ms, utterance.end + offset_ms,
+        getattr(utterance, 'confidence', None), words
+    )
+
+def stitch_transcripts(parts, audio_duration=None):
+    """
+    Junta as transcrições dos segmentos em uma única lista de utterances.
+
+    parts é uma lista ordenada de tuplas (transcript, window_start, cut_start) em segundos:
+    o segmento foi extraído a partir de window_start, mas só as falas a partir de
+    cut_start pertencem a ele; o trecho anterior é a sobreposição com o segmento
+    anterior, usada apenas para reconciliar os rótulos de speakers
+    """
+    stitched = []
+    known_labels = []
+    speaking_time = defaultdict(int)
+
+    for index, (transcript, window_start, cut_start) in enumerate(parts):
+        offset_ms = int(round(window_start * 1000))
+        cut_ms = int(round(cut_start * 1000))
+        current = [_shift_utterance(u, offset_ms) for u in (transcript.utterances or [])]
+
+        if index == 0:
+            mapping = {}
+            for utterance in current:
+                if utterance.speaker not in mapping:
+                    mapping[utterance.speaker] = _speaker_label(len(known_labels))
+                    known_labels.append(mapping[utterance.speaker])
+        else:
+            mapping = _map_speakers(stitched, current, offset_ms, cut_ms, known_labels, speaking_time)
+
+        for utterance in current:
+            # Falas da região sobreposta já estão no segmento anterior
+            if index > 0 and (utterance.start + utterance.end) / 2 < cut_ms:
+                continue
+            utterance.speaker = mapping[utterance.speaker]
+            for word in utterance.words:
+                word.speaker = utterance.speaker
+            speaking_time[utterance.speaker] += utterance.end - utterance.start
+            stitched.append(utterance)
+
+    logger.info(f"{len(parts)} segmentos unidos em {len(stitched)} utterances, "
+                f"{len(known_labels)} speakers")
+    return StitchedTranscript(stitched, audio_duration)
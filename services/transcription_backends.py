@@ -0,0 +1,290 @@
+import os
+import time
+import random
+import logging
+import threading
+import subprocess
+from dotenv import load_dotenv
+from pydub import AudioSegment
+from services.audio_processing import probe_audio
+from services.transcript_stitching import StitchedTranscript, StitchedUtterance, StitchedWord
+from utils.metrics import BACKEND_SECONDS, BACKEND_REQUESTS
+
+# Carregar variáveis de ambiente do arquivo .env (antes de ler a configuração abaixo)
+load_dotenv()
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Backend usado pela transcrição: "assemblyai" (API real) ou "fake" (local, para testes e benchmarks)
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "assemblyai").lower()
+
+# Backend local: latência fixa por chamada, latência por minuto de áudio, variação
+# (fração da latência, para mais ou para menos), taxa de falhas e semente
+FAKE_TRANSCRIPTION_LATENCY = float(os.getenv("FAKE_TRANSCRIPTION_LATENCY", "2.0"))
+FAKE_TRANSCRIPTION_LATENCY_PER_MINUTE = float(os.getenv("FAKE_TRANSCRIPTION_LATENCY_PER_MINUTE", "1.5"))
+FAKE_TRANSCRIPTION_JITTER = float(os.getenv("FAKE_TRANSCRIPTION_JITTER", "0.2"))
+FAKE_TRANSCRIPTION_FAILURE_RATE = float(os.getenv("FAKE_TRANSCRIPTION_FAILURE_RATE", "0"))
+FAKE_TRANSCRIPTION_SPEAKERS = int(os.getenv("FAKE_TRANSCRIPTION_SPEAKERS", "2"))
+FAKE_TRANSCRIPTION_SEED = os.getenv("FAKE_TRANSCRIPTION_SEED")
+
+class TranscriptionError(Exception):
+    """
+    Falha do serviço de transcrição (erro da API, chave ausente, etc.)
+    """
+
+class TranscriptionBackend:
+    """
+    Interface dos serviços de transcrição. transcribe recebe o caminho do áudio e as
+    opções (audio_start_from, audio_end_at, word_boost, webhook_url) e retorna a
+    transcrição bruta com utterances (speaker, text, start, end em ms, confidence, words),
+    text e audio_duration, ou lança TranscriptionError.
+    upload_rate é a vazão de envio observada (bytes/s), quando o backend envia o arquivo
+    """
+    name = "base"
+    upload_rate = None
+
+    def transcribe(self, file_path, options=None):
+        raise NotImplementedError
+
+class AssemblyAIBackend(TranscriptionBackend):
+    """
+    API da AssemblyAI. A chave é lida no primeiro uso, e não na importação
+    """
+    name = "assemblyai"
+
+    def __init__(self, api_key=None):
+        self._api_key = api_key
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def _configure(self):
+        if self._configured:
+            return
+        with self._lock:
+            if self._configured:
+                return
+            import assemblyai as aai
+            api_key = self._api_key or os.getenv("ASSEMBLYAI_API_KEY")
+            if not api_key:
+                logger.error("ASSEMBLYAI_API_KEY não encontrada no ambiente. Verifique o arquivo .env")
+                raise TranscriptionError("ASSEMBLYAI_API_KEY não configurada")
+            aai.settings.api_key = api_key
+            self._configured = True
+
+    def build_config(self, options=None):
+        """
+        Monta a configuração de transcrição da AssemblyAI a partir das opções
+        """
+        import assemblyai as aai
+
+        # Configurar as opções de transcrição
+        config = aai.TranscriptionConfig(
+            speaker_labels=True,         # Ativar identificação de speakers
+            # language_code="pt",          # Definir idioma como português
+            punctuate=True,              # Adicionar pontuação automática
+            format_text=True,            # Formatar o texto automaticamente
+            # speech_recognizer removido pois não existe mais na API atual
+            language_detection=True      # Usar detecção automática de idioma
+        )
+
+        # Aplicar opções avançadas se fornecidas
+        if options:
+            if 'audio_start_from' in options and options['audio_start_from'] > 0:
+                config.audio_start_from = options['audio_start_from']
+                logger.info(f"Iniciando transcrição a partir de {options['audio_start_from']} segundos")
+
+            if 'audio_end_at' in options and options['audio_end_at'] > 0:
+                config.audio_end_at = options['audio_end_at']
+                logger.info(f"Terminando transcrição em {options['audio_end_at']} segundos")
+
+            if 'word_boost' in options and options['word_boost']:
+                config.word_boost = options['word_boost']
+                logger.info(f"Palavras enfatizadas: {options['word_boost']}")
+
+            if 'webhook_url' in options and options['webhook_url']:
+                config.webhook_url = options['webhook_url']
+                logger.info(f"Webhook configurado: {options['webhook_url']}")
+
+        return config
+
+    def _update_upload_rate(self, file_path, seconds):
+        # Média móvel da vazão de envio, usada para estimar o tempo economizado pela conversão
+        if seconds <= 0 or not os.path.isfile(file_path):
+            return
+        rate = os.path.getsize(file_path) / seconds
+        self.upload_rate = rate if self.upload_rate is None else 0.7 * self.upload_rate + 0.3 * rate
+        logger.info(f"Áudio enviado em {seconds:.2f} segundos ({rate / 1024 / 1024:.2f} MB/s)")
+
+    def transcribe(self, file_path, options=None):
+        """
+        Envia o áudio e acompanha o job até o fim (como Transcriber.transcribe), separando
+        o tempo de envio, de fila (queued) e de processamento (processing) nas métricas
+        """
+        self._configure()
+        import assemblyai as aai
+
+        start = time.perf_counter()
+        transcript = aai.Transcriber().submit(file_path, config=self.build_config(options))
+        submitted = time.perf_counter()
+        BACKEND_SECONDS.observe(submitted - start, backend=self.name, phase="upload")
+        self._update_upload_rate(file_path, submitted - start)
+
+        processing_since = None
+        while transcript.status in (aai.TranscriptStatus.queued, aai.TranscriptStatus.processing):
+            if processing_since is None and transcript.status == aai.TranscriptStatus.processing:
+                processing_since = time.perf_counter()
+            time.sleep(aai.settings.polling_interval)
+            transcript = aai.Transcript.get_by_id(transcript.id)
+        finished = time.perf_counter()
+
+        # Sem ter visto "processing", o job saiu da fila entre duas consultas: conta como fila
+        processing_since = processing_since or finished
+        BACKEND_SECONDS.observe(processing_since - submitted, backend=self.name, phase="queue")
+        BACKEND_SECONDS.observe(finished - processing_since, backend=self.name, phase="processing")
+        BACKEND_REQUESTS.inc(backend=self.name, status=str(transcript.status.value))
+
+        if transcript.status == aai.TranscriptStatus.error:
+            raise TranscriptionError(transcript.error)
+        return transcript
+
+# Vocabulário do backend local: frases com cara de depoimento, para que correções,
+# identificação de speakers e exportações trabalhem com texto realista
+_FAKE_NAMES = ["Carlos", "Mariana", "João", "Fernanda", "Ricardo", "Patrícia"]
+_FAKE_WORDS = (
+    "então eu trabalhei na empresa durante quase dez anos no setor de produção e depois "
+    "fui transferido para a área administrativa onde fiquei responsável pelo controle "
+    "de estoque a gente recebia as ordens do gerente e repassava para a equipe não "
+    "me lembro exatamente da data mas foi no começo do ano o senhor pode explicar "
+    "como funcionava o registro de ponto naquela época sim claro quem assinava os "
+    "documentos era o supervisor do turno e havia reuniões toda semana"
+).split()
+
+class FakeTranscriptionBackend(TranscriptionBackend):
+    """
+    Backend local que imita a AssemblyAI: aguarda uma latência configurável (fixa +
+    proporcional à duração, com variação aleatória), falha com a taxa configurada e
+    devolve falas e palavras com tempos coerentes com a duração do áudio.
+    O conteúdo depende só do arquivo, então o mesmo áudio gera a mesma transcrição
+    """
+    name = "fake"
+
+    def __init__(self, latency=FAKE_TRANSCRIPTION_LATENCY, latency_per_minute=FAKE_TRANSCRIPTION_LATENCY_PER_MINUTE,
+                 jitter=FAKE_TRANSCRIPTION_JITTER, failure_rate=FAKE_TRANSCRIPTION_FAILURE_RATE,
+                 speakers=FAKE_TRANSCRIPTION_SPEAKERS, seed=FAKE_TRANSCRIPTION_SEED):
+        self.latency = latency
+        self.latency_per_minute = latency_per_minute
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.speakers = max(1, speakers)
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.calls = 0
+
+    def _draw(self):
+        with self._random_lock:
+            self.calls += 1
+            return self._random.random(), self._random.uniform(-1, 1)
+
+    @staticmethod
+    def _duration(file_path):
+        try:
+            return probe_audio(file_path, use_cache=False)['duration_seconds']
+        except Exception:
+            # Sem ffprobe (ex.: segmentos FLAC): decodificar e ler o tempo final do ffmpeg
+            result = subprocess.run([AudioSegment.converter, "-hide_banner", "-i", file_path, "-f", "null", "-"],
+                                    capture_output=True, text=True)
+            times = [line.rsplit("time=", 1)[1].split()[0] for line in result.stderr.splitlines() if "time=" in line]
+            if not times:
+                raise TranscriptionError(f"Não foi possível ler a duração de {file_path}")
+            hours, minutes, seconds = times[-1].split(":")
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    def transcribe(self, file_path, options=None):
+        duration = self._duration(file_path)
+        options = options or {}
+        start_s = options.get('audio_start_from') or 0
+        end_s = min(options.get('audio_end_at') or duration, duration)
+
+        failure_draw, jitter_draw = self._draw()
+        delay = (self.latency + self.latency_per_minute * (end_s - start_s) / 60) * (1 + self.jitter * jitter_draw)
+        time.sleep(max(0.0, delay))
+        BACKEND_SECONDS.observe(max(0.0, delay), backend=self.name, phase="processing")
+
+        if failure_draw < self.failure_rate:
+            BACKEND_REQUESTS.inc(backend=self.name, status="error")
+            raise TranscriptionError("Falha simulada pelo backend local")
+        BACKEND_REQUESTS.inc(backend=self.name, status="completed")
+
+        # Conteúdo estável para o mesmo arquivo (e as mesmas opções)
+        rng = random.Random(f"{os.path.getsize(file_path)}:{duration}:{start_s}:{end_s}")
+        labels = [chr(ord('A') + index) for index in range(self.speakers)]
+        names = rng.sample(_FAKE_NAMES, min(len(_FAKE_NAMES), self.speakers))
+
+        utterances = []
+        cursor_ms = int(start_s * 1000)
+        end_ms = int(end_s * 1000)
+        speaker_index = 0
+        introduced = set()
+        while cursor_ms < end_ms - 500:
+            utterance_end = min(end_ms, cursor_ms + rng.randint(4000, 15000))
+            speaker = labels[speaker_index % len(labels)]
+
+            # Cerca de 2,5 palavras por segundo, com pequenas pausas
+            count = max(1, int((utterance_end - cursor_ms) / 400))
+            step = (utterance_end - cursor_ms) / count
+            texts = [rng.choice(_FAKE_WORDS) for _ in range(count)]
+            # Cada speaker se apresenta na primeira fala, como nos depoimentos reais
+            if speaker not in introduced and len(introduced) < len(names):
+                texts[:4] = ["meu", "nome", "é", f"{names[len(introduced)]}."][:count]
+                introduced.add(speaker)
+            texts[0] = texts[0].capitalize()
+            if not texts[-1].endswith("."):
+                texts[-1] += "."
+
+            words = [
+                StitchedWord(text, int(cursor_ms + i * step), int(cursor_ms + (i + 1) * step - 40),
+                             round(rng.uniform(0.75, 0.99), 3), speaker)
+                for i, text in enumerate(texts)
+            ]
+            utterances.append(StitchedUtterance(speaker, " ".join(texts), cursor_ms, utterance_end,
+                                                round(sum(w.confidence for w in words) / len(words), 3), words))
+
+            cursor_ms = utterance_end + rng.randint(100, 800)
+            speaker_index += 1 if rng.random() < 0.8 else 0
+
+        return StitchedTranscript(utterances, audio_duration=end_s - start_s)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def create_backend(name=TRANSCRIPTION_BACKEND):
+    """
+    Cria o backend pelo nome
+    """
+    if name == "assemblyai":
+        return AssemblyAIBackend()
+    if name == "fake":
+        return FakeTranscriptionBackend()
+    raise ValueError(f"Backend de transcrição desconhecido: {name}")
+
+def get_backend():
+    """
+    Backend de transcrição em uso (TRANSCRIPTION_BACKEND, criado no primeiro uso)
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                logger.info(f"Backend de transcrição: {_backend.name}")
+    return _backend
+
+def set_backend(backend):
+    """
+    Substitui o backend em uso (ex.: benchmarks com o backend local). Retorna o anterior
+    """
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
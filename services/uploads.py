@@ -0,0 +1,179 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from werkzeug.exceptions import ClientDisconnected
+from models.database import (create_upload, get_upload, update_upload_received, delete_upload,
+                             get_stale_uploads)
+from services.audio_processing import probe_audio
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo de um arquivo enviado em partes (padrão: 10 GB)
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(10 * 1024 ** 3)))
+
+# Envios incompletos sem atividade por mais que isso são descartados
+UPLOAD_EXPIRE_HOURS = float(os.getenv("UPLOAD_EXPIRE_HOURS", "24"))
+
+# Bytes recebidos antes de tentar ler o cabeçalho do áudio. Só o arquivo completo pode ser recusado
+UPLOAD_PROBE_BYTES = int(os.getenv("UPLOAD_PROBE_BYTES", str(1024 * 1024)))
+
+# Bloco lido do corpo da requisição por vez
+UPLOAD_READ_SIZE = 1024 * 1024
+
+class UploadConflictError(Exception):
+    """
+    Offset do PATCH diferente do já gravado, envio concluído ou outro PATCH em andamento
+    """
+
+# SHA-256 parcial de cada envio em andamento: upload_id -> (bytes cobertos, hash).
+# Depois de um reinício o hash é refeito a partir do prefixo já gravado
+_hashers = {}
+_locks = {}
+_state_lock = threading.Lock()
+
+def _upload_lock(upload_id):
+    with _state_lock:
+        return _locks.setdefault(upload_id, threading.Lock())
+
+def _forget(upload_id):
+    with _state_lock:
+        _hashers.pop(upload_id, None)
+        _locks.pop(upload_id, None)
+
+def _hasher_at(upload_id, file_path, offset):
+    """
+    Hash do prefixo [0, offset) do arquivo
+    """
+    with _state_lock:
+        state = _hashers.get(upload_id)
+    if state and state[0] == offset:
+        return state[1]
+
+    logger.info(f"Refazendo o hash do envio {upload_id} a partir de {offset} bytes já gravados")
+    digest = hashlib.sha256()
+    remaining = offset
+    with open(file_path, 'rb') as f:
+        while remaining > 0:
+            data = f.read(min(UPLOAD_READ_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+    return digest
+
+def create_resumable_upload(upload_id, filename, file_path, total_size, metadata):
+    """
+    Registra um envio em partes e cria o arquivo vazio na pasta temporária do job
+    """
+    if total_size <= 0:
+        raise ValueError("Tamanho do arquivo inválido")
+    if total_size > UPLOAD_MAX_SIZE:
+        raise ValueError(f"O arquivo excede o tamanho máximo de {UPLOAD_MAX_SIZE // (1024 * 1024)} MB")
+
+    cleanup_stale_uploads()
+
+    open(file_path, 'wb').close()
+    if not create_upload(upload_id, filename, file_path, total_size, metadata):
+        os.remove(file_path)
+        raise RuntimeError("Erro ao registrar o envio")
+
+    with _state_lock:
+        _hashers[upload_id] = (0, hashlib.sha256())
+    logger.info(f"Envio {upload_id} criado: {filename} ({total_size} bytes)")
+    return get_upload(upload_id)
+
+def write_upload_chunk(upload, offset, stream):
+    """
+    Grava um bloco do corpo da requisição a partir de offset, atualizando o hash
+    enquanto os bytes chegam. Se a conexão cair, o que já foi gravado é mantido e o
+    cliente retoma do novo offset. Retorna o offset após a gravação
+    """
+    upload_id = upload['id']
+    lock = _upload_lock(upload_id)
+    if not lock.acquire(blocking=False):
+        raise UploadConflictError("Outro bloco deste envio está sendo gravado")
+
+    try:
+        # Reler o estado com a trava, já que outro PATCH pode ter acabado de gravar
+        upload = get_upload(upload_id)
+        if not upload:
+            raise UploadConflictError("Envio não encontrado")
+        if upload['status'] != 'uploading':
+            raise UploadConflictError("Envio já concluído")
+        if offset != upload['received']:
+            raise UploadConflictError(f"Offset esperado: {upload['received']}")
+
+        received = upload['received']
+        total_size = upload['total_size']
+        digest = _hasher_at(upload_id, upload['file_path'], received)
+
+        try:
+            with open(upload['file_path'], 'r+b') as f:
+                f.seek(received)
+                # Descarta qualquer resto de um bloco anterior interrompido
+                f.truncate()
+                while received < total_size:
+                    data = stream.read(min(UPLOAD_READ_SIZE, total_size - received))
+                    if not data:
+                        break
+                    f.write(data)
+                    digest.update(data)
+                    received += len(data)
+        except ClientDisconnected:
+            logger.warning(f"Conexão interrompida no envio {upload_id} em {received} bytes")
+        finally:
+            with _state_lock:
+                _hashers[upload_id] = (received, digest)
+            update_upload_received(upload_id, received)
+
+        # Ler o cabeçalho assim que houver bytes suficientes, sem esperar o fim do envio.
+        # Com o arquivo parcial, uma falha só quer dizer "ainda não conhecido" (num MP4/M4A
+        # o moov costuma ficar no fim): quem recusa o arquivo é finish_upload, com todos os bytes
+        if upload['received'] < UPLOAD_PROBE_BYTES <= received < total_size:
+            try:
+                probe_audio(upload['file_path'], use_cache=False)
+                logger.info(f"Cabeçalho do envio {upload_id} lido com {received} bytes")
+            except Exception as e:
+                logger.info(f"Cabeçalho do envio {upload_id} ainda não legível com {received} bytes: {e}")
+
+        return received
+    finally:
+        lock.release()
+
+def finish_upload(upload):
+    """
+    Conclui um envio com todos os bytes recebidos: retorna o SHA-256 (já calculado
+    durante o envio) e as informações do áudio lidas do cabeçalho
+    """
+    digest = _hasher_at(upload['id'], upload['file_path'], upload['total_size'])
+    try:
+        audio_info = probe_audio(upload['file_path'], use_cache=False)
+    except Exception as e:
+        raise ValueError(f"Arquivo de áudio inválido ou corrompido: {e}")
+    _forget(upload['id'])
+    return digest.hexdigest(), audio_info
+
+def discard_upload(upload):
+    """
+    Remove o arquivo parcial e o registro de um envio
+    """
+    try:
+        os.remove(upload['file_path'])
+    except OSError:
+        pass
+    delete_upload(upload['id'])
+    _forget(upload['id'])
+
+def cleanup_stale_uploads():
+    """
+    Descarta os envios incompletos abandonados há mais de UPLOAD_EXPIRE_HOURS
+    """
+    stale = get_stale_uploads(int(time.time() - UPLOAD_EXPIRE_HOURS * 3600))
+    for upload in stale:
+        discard_upload(upload)
+    if stale:
+        logger.info(f"{len(stale)} envios abandonados removidos")
+    return len(stale)
@@ -0,0 +1,144 @@
+import os
+import time
+import struct
+import logging
+import subprocess
+import numpy as np
+from pydub import AudioSegment
+from utils.metrics import span
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Arquivo de picos gravado na pasta da transcrição
+PEAKS_FILENAME = "waveform.peaks"
+
+# Taxa do PCM decodificado para os picos (não precisa ser a do áudio original)
+PEAKS_SAMPLE_RATE = int(os.getenv("PEAKS_SAMPLE_RATE", "8000"))
+
+# Amostras por pico no nível mais detalhado; cada nível seguinte é PEAKS_ZOOM_FACTOR vezes mais grosso
+PEAKS_SAMPLES_PER_PEAK = int(os.getenv("PEAKS_SAMPLES_PER_PEAK", "128"))
+PEAKS_ZOOM_FACTOR = 4
+PEAKS_LEVELS = 5
+
+# Amostras lidas do ffmpeg por vez (memória limitada, independente da duração)
+PEAKS_CHUNK_SAMPLES = 1024 * 1024
+
+# Formato do arquivo (little-endian):
+#   cabeçalho: "PEAK", versão (u16), número de níveis (u16), taxa de amostragem (u32)
+#   para cada nível: amostras por pico (u32), número de picos (u32)
+#   dados: para cada nível, pares (mínimo, máximo) em int8
+PEAKS_MAGIC = b"PEAK"
+PEAKS_VERSION = 1
+_HEADER = struct.Struct("<4sHHI")
+_LEVEL = struct.Struct("<II")
+
+def _block_min_max(samples, samples_per_peak):
+    count = -(-len(samples) // samples_per_peak)
+    padded = np.pad(samples, (0, count * samples_per_peak - len(samples)), mode='edge')
+    blocks = padded.reshape(count, samples_per_peak)
+    return blocks.min(axis=1), blocks.max(axis=1)
+
+def _reduce_level(mins, maxs, factor):
+    count = -(-len(mins) // factor)
+    pad = count * factor - len(mins)
+    mins = np.pad(mins, (0, pad), mode='edge').reshape(count, factor).min(axis=1)
+    maxs = np.pad(maxs, (0, pad), mode='edge').reshape(count, factor).max(axis=1)
+    return mins, maxs
+
+def compute_peaks(source_path):
+    """
+    Calcula os picos (mínimo e máximo) em vários níveis de zoom em uma única passada:
+    o ffmpeg decodifica o áudio para PCM mono em streaming e o NumPy reduz cada bloco.
+    Os níveis mais grossos são obtidos do mais detalhado, sem nova leitura.
+    Retorna uma lista de (amostras por pico, mínimos int8, máximos int8)
+    """
+    command = [
+        AudioSegment.converter, "-hide_banner", "-loglevel", "error",
+        "-i", source_path, "-vn", "-ac", "1", "-ar", str(PEAKS_SAMPLE_RATE),
+        "-f", "s16le", "-acodec", "pcm_s16le", "-"
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    mins, maxs = [], []
+    pending = np.empty(0, dtype=np.int16)
+    leftover = b""
+    chunk_bytes = PEAKS_CHUNK_SAMPLES * 2
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            # Um byte solto de uma leitura parcial fica para a próxima
+            data = leftover + data
+            usable = len(data) - len(data) % 2
+            leftover = data[usable:]
+            samples = np.frombuffer(data[:usable], dtype='<i2')
+            if len(pending):
+                samples = np.concatenate([pending, samples])
+            # Blocos completos agora; o resto espera pelas próximas amostras
+            whole = len(samples) - len(samples) % PEAKS_SAMPLES_PER_PEAK
+            if whole:
+                block_mins, block_maxs = _block_min_max(samples[:whole], PEAKS_SAMPLES_PER_PEAK)
+                mins.append(block_mins)
+                maxs.append(block_maxs)
+            pending = samples[whole:].copy()
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        return_code = process.wait()
+
+    if return_code != 0:
+        raise RuntimeError(f"ffmpeg falhou ao decodificar o áudio: {stderr.decode('utf-8', 'replace').strip()}")
+
+    if len(pending):
+        block_mins, block_maxs = _block_min_max(pending, PEAKS_SAMPLES_PER_PEAK)
+        mins.append(block_mins)
+        maxs.append(block_maxs)
+    if not mins:
+        raise ValueError("Áudio sem amostras")
+
+    # int16 -> int8 (metade dos bytes; suficiente para desenhar)
+    level_mins = (np.concatenate(mins) >> 8).astype(np.int8)
+    level_maxs = (np.concatenate(maxs) >> 8).astype(np.int8)
+
+    levels = [(PEAKS_SAMPLES_PER_PEAK, level_mins, level_maxs)]
+    for level in range(1, PEAKS_LEVELS):
+        level_mins, level_maxs = _reduce_level(level_mins, level_maxs, PEAKS_ZOOM_FACTOR)
+        levels.append((PEAKS_SAMPLES_PER_PEAK * PEAKS_ZOOM_FACTOR ** level, level_mins, level_maxs))
+    return levels
+
+def write_peaks_file(levels, output_path):
+    """
+    Grava os picos no formato binário descrito acima (escrita atômica)
+    """
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(levels), PEAKS_SAMPLE_RATE))
+        for samples_per_peak, level_mins, _ in levels:
+            f.write(_LEVEL.pack(samples_per_peak, len(level_mins)))
+        for _, level_mins, level_maxs in levels:
+            pairs = np.empty(len(level_mins) * 2, dtype=np.int8)
+            pairs[0::2] = level_mins
+            pairs[1::2] = level_maxs
+            f.write(pairs.tobytes())
+    os.replace(temp_path, output_path)
+    return output_path
+
+def build_peaks_file(source_path, target_folder):
+    """
+    Calcula e grava o arquivo de picos na pasta da transcrição.
+    Retorna o nome do arquivo ou None em caso de erro
+    """
+    start_time = time.time()
+    try:
+        with span("peaks_compute"):
+            levels = compute_peaks(source_path)
+        write_peaks_file(levels, os.path.join(target_folder, PEAKS_FILENAME))
+        logger.info(f"Picos da forma de onda calculados em {time.time() - start_time:.2f} segundos "
+                    f"({len(levels[0][1])} picos no nível mais detalhado)")
+        return PEAKS_FILENAME
+    except Exception as e:
+        logger.error(f"Erro ao calcular os picos da forma de onda: {e}")
+        return None
@@ -38,60 +38,140 @@ CORRECTIONS = {
     "nao": "não"
 }
 
+# Regras de formatação, compiladas uma única vez
+_MISSING_SPACE_AFTER_PUNCTUATION = re.compile(r'([.!?])([A-ZÁÉÍÓÚÀÈÌÒÙÂÊÎÔÛÃÕÑÇ])')
+_SENTENCE_DELIMITER = re.compile(r'([.!?]\s+)')
+_MULTIPLE_SPACES = re.compile(r' {2,}')
+_SPACE_BEFORE_PUNCTUATION = re.compile(r' ([,.!?;:])')
+_MISSING_SPACE_AFTER_COMMA = re.compile(r'([,.])([^ \n])')
+
+# Matcher único do dicionário, recompilado apenas quando CORRECTIONS muda
+_matcher = None
+_lookup = {}
+_compiled_size = -1
+
+def _trie_pattern(words):
+    """
+    Monta uma expressão regular em forma de trie a partir das palavras
+    (prefixos comuns compartilhados), evitando testar cada alternativa do zero
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+    
+    def build(node):
+        alternatives = []
+        optional = False
+        for char in sorted(node):
+            if char == '':
+                optional = True
+                continue
+            alternatives.append(re.escape(char) + build(node[char]))
+        
+        if not alternatives:
+            return ''
+        
+        pattern = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        if optional:
+            # Greedy: tenta primeiro a palavra mais longa
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+    
+    return build(trie)
+
+def _compile_corrections():
+    """
+    Compila o dicionário CORRECTIONS em um único regex (sem distinção de maiúsculas)
+    """
+    global _matcher, _lookup, _compiled_size
+    
+    _lookup = {error.lower(): correction for error, correction in CORRECTIONS.items()}
+    if _lookup:
+        _matcher = re.compile(r'\b' + _trie_pattern(_lookup) + r'\b', re.IGNORECASE)
+    else:
+        _matcher = None
+    _compiled_size = len(CORRECTIONS)
+    logger.debug(f"Dicionário de correções compilado com {len(_lookup)} entradas")
+
+def _get_matcher():
+    # Recompilar se add_corrections invalidou o matcher ou se o dicionário mudou de tamanho
+    if _compiled_size != len(CORRECTIONS):
+        _compile_corrections()
+    return _matcher
+
+def _correct(text, matcher, lookup):
+    corrected = text
+    
+    # Aplicar correções do dicionário em uma única passada
+    if matcher is not None:
+        corrected = matcher.sub(lambda match: lookup.get(match.group(0).lower(), match.group(0)), corrected)
+    
+    # Correções adicionais baseadas em regras
+    
+    # Corrigir espaçamento após pontuação
+    corrected = _MISSING_SPACE_AFTER_PUNCTUATION.sub(r'\1 \2', corrected)
+    
+    # Corrigir capitalização no início das frases (frases nas posições pares)
+    sentences = _SENTENCE_DELIMITER.split(corrected)
+    for i in range(0, len(sentences), 2):
+        sentence = sentences[i]
+        if sentence and not sentence[0].isupper() and len(sentence) > 1:
+            sentences[i] = sentence[0].upper() + sentence[1:]
+    result = "".join(sentences)
+    
+    # Corrigir espaços múltiplos
+    result = _MULTIPLE_SPACES.sub(' ', result)
+    
+    # Corrigir espaços antes de pontuação
+    result = _SPACE_BEFORE_PUNCTUATION.sub(r'\1', result)
+    
+    # Garantir espaços após vírgulas e pontos
+    result = _MISSING_SPACE_AFTER_COMMA.sub(r'\1 \2', result)
+    
+    return result
+
 def correct_text(text):
     """
     Aplica correções ortográficas ao texto transcrito
     """
     try:
-        corrected = text
-        
-        # Aplicar correções do dicionário
-        for error, correction in CORRECTIONS.items():
-            corrected = re.sub(r'\b' + error + r'\b', correction, corrected, flags=re.IGNORECASE)
-        
-        # Correções adicionais baseadas em regras
-        
-        # Corrigir espaçamento após pontuação
-        corrected = re.sub(r'([.!?])([A-ZÁÉÍÓÚÀÈÌÒÙÂÊÎÔÛÃÕÑÇ])', r'\1 \2', corrected)
-        
-        # Corrigir capitalização no início das frases
-        sentences = re.split(r'([.!?]\s+)', corrected)
-        result = ""
-        for i in range(0, len(sentences), 2):
-            sentence = sentences[i]
-            if i < len(sentences) - 1:
-                delimiter = sentences[i+1]
-            else:
-                delimiter = ""
-            
-            if sentence and not sentence[0].isupper() and len(sentence) > 1:
-                sentence = sentence[0].upper() + sentence[1:]
-            
-            result += sentence + delimiter
-        
-        # Corrigir espaços múltiplos
-        result = re.sub(r' +', ' ', result)
-        
-        # Corrigir espaços antes de pontuação
-        result = re.sub(r' ([,.!?;:])', r'\1', result)
-        
-        # Garantir espaços após vírgulas e pontos
-        result = re.sub(r'([,.])([^ \n])', r'\1 \2', result)
-        
+        result = _correct(text, _get_matcher(), _lookup)
         logger.debug("Texto corrigido com sucesso")
         return result
     except Exception as e:
         logger.error(f"Erro na correção do texto: {e}")
         return text  # Em caso de erro, retorna o texto original
 
+def correct_texts(texts):
+    """
+    Aplica as correções a um lote de textos (ex.: todas as utterances de uma transcrição),
+    obtendo o matcher compilado uma única vez para o lote
+    """
+    matcher = _get_matcher()
+    lookup = _lookup
+    corrected = []
+    for text in texts:
+        try:
+            corrected.append(_correct(text, matcher, lookup))
+        except Exception as e:
+            logger.error(f"Erro na correção do texto: {e}")
+            corrected.append(text)
+    return corrected
+
 def add_corrections(new_corrections):
     """
     Adiciona novas correções ao dicionário
     """
+    global _compiled_size
     try:
         CORRECTIONS.update(new_corrections)
+        # Invalidar o matcher compilado
+        _compiled_size = -1
         logger.info(f"Adicionadas {len(new_corrections)} novas correções")
         return True
     except Exception as e:
         logger.error(f"Erro ao adicionar correções: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -1,8 +1,12 @@
 import os
+import json
 import logging
-import shutil
+import hashlib
+import threading
 import subprocess
 import tempfile
+from io import BytesIO
+from markupsafe import Markup, escape
 from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
@@ -12,40 +16,166 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from datetime import datetime
+from models.utterance import Utterance
+from models.database import SNIPPET_START, SNIPPET_END
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
 
-def create_docx(dialogue, output_path, project_name, description, meta_info):
+# Template usado nas exportações DOCX
+DOCX_TEMPLATE_PATH = "depoimento_template.docx"
+
+# Incrementar quando o layout gerado por create_docx mudar
+DOCX_EXPORT_VERSION = 1
+
+_template_lock = threading.Lock()
+_template_cache = {}
+
+def _clean_docx_template(data):
     """
-    Cria um arquivo DOCX formatado com o diálogo, usando o template fornecido
-    e adicionando as informações solicitadas na página inicial
+    Remove as falas de exemplo do template e retorna o documento serializado
     """
-    try:
-        # Usar o template na raiz do projeto
-        template_path = "depoimento_template.docx"
-        
-        # Verificação do template
-        if not os.path.exists(template_path):
-            logger.error(f"Template DOCX não encontrado em: {template_path}")
-            raise FileNotFoundError(f"Template DOCX não encontrado em: {template_path}")
-            
-        logger.info(f"Template encontrado em: {template_path}")
+    doc = Document(BytesIO(data))
+    
+    # Limpar falas de exemplo do template
+    paragraphs_to_remove = []
+    for i, paragraph in enumerate(doc.paragraphs):
+        if i < len(doc.paragraphs) and ("[Speaker" in paragraph.text or "Speaker" in paragraph.text):
+            paragraphs_to_remove.append(paragraph)
+    
+    for paragraph in paragraphs_to_remove:
+        try:
+            p = paragraph._element
+            p.getparent().remove(p)
+        except Exception as e:
+            logger.warning(f"Erro ao remover parágrafo: {e}")
+    
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def load_docx_template(template_path=DOCX_TEMPLATE_PATH):
+    """
+    Retorna (versão, bytes) do template DOCX já limpo. O template é lido e preparado
+    uma única vez por processo e recarregado apenas se o arquivo mudar
+    """
+    # Verificação do template
+    if not os.path.exists(template_path):
+        logger.error(f"Template DOCX não encontrado em: {template_path}")
+        raise FileNotFoundError(f"Template DOCX não encontrado em: {template_path}")
+    
+    stat = os.stat(template_path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cached = _template_cache.get(template_path)
+    if cached and cached[0] == signature:
+        return cached[1], cached[2]
+    
+    with _template_lock:
+        cached = _template_cache.get(template_path)
+        if cached and cached[0] == signature:
+            return cached[1], cached[2]
         
         # Verificar se o arquivo não está corrompido
-        if os.path.getsize(template_path) == 0:
+        if stat.st_size == 0:
             logger.error(f"Template DOCX está vazio ou corrompido: {template_path}")
             raise ValueError("Template DOCX está vazio ou corrompido")
-            
+        
         # Verificar permissões de leitura
         if not os.access(template_path, os.R_OK):
             logger.error(f"Sem permissão para ler o template em: {template_path}")
             raise PermissionError(f"Sem permissão para ler o template em: {template_path}")
-            
-        # Garantir que o texto esteja em UTF-8
+        
+        with open(template_path, 'rb') as f:
+            data = f.read()
+        version = hashlib.sha256(data).hexdigest()[:16]
+        cleaned = _clean_docx_template(data)
+        
+        _template_cache[template_path] = (signature, version, cleaned)
+        logger.info(f"Template DOCX carregado: {template_path} (versão {version})")
+        return version, cleaned
+
+def docx_export_key(dialogue, project_name, description, meta_info):
+    """
+    Hash do conteúdo de uma exportação DOCX: falas, metadados e versão do template
+    """
+    try:
+        template_version = load_docx_template()[0]
+    except Exception:
+        template_version = None
+    
+    if isinstance(dialogue, str):
+        dialogue = dialogue.split('\n\n')
+    
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'export_version': DOCX_EXPORT_VERSION,
+        'template': template_version,
+        'project': project_name,
+        'description': description,
+        'meta': meta_info or {}
+    }, sort_keys=True, default=str).encode('utf-8'))
+    for block in dialogue:
+        line = block.as_line() if isinstance(block, Utterance) else str(block)
+        digest.update(line.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def export_docx(dialogue, folder_path, project_name, description, meta_info):
+    """
+    Retorna o DOCX da transcrição, gerando-o apenas se as falas, os metadados ou o
+    template tiverem mudado desde a última exportação
+    """
+    key = docx_export_key(dialogue, project_name, description, meta_info)
+    output_path = os.path.join(folder_path, f"transcricao_{key[:16]}.docx")
+    
+    if os.path.exists(output_path):
+        logger.info(f"DOCX em cache: {output_path}")
+        return output_path
+    
+    # Gerar em um arquivo temporário e publicar com rename atômico
+    temp_path = f"{output_path}.{threading.get_ident()}.tmp"
+    if not create_docx(dialogue, temp_path, project_name, description, meta_info):
+        return None
+    os.replace(temp_path, output_path)
+    
+    # Remover exportações anteriores desta transcrição
+    for name in os.listdir(folder_path):
+        if name.endswith('.docx') and name.startswith('transcricao') and name != os.path.basename(output_path):
+            try:
+                os.remove(os.path.join(folder_path, name))
+            except OSError as e:
+                logger.warning(f"Não foi possível remover a exportação antiga {name}: {e}")
+    
+    return output_path
+
+def export_meta_info(transcription):
+    """
+    Metadados da capa do DOCX a partir do registro salvo da transcrição
+    """
+    return {
+        'created_at': format_timestamp(transcription.get('created_at', '')),
+        'project': transcription['project'],
+        'filename': transcription['filename'],
+        'audio_duration': format_duration(transcription.get('audio_duration', 0)),
+        'speakers_count': transcription.get('speakers_count', 0)
+    }
+
+def create_docx(dialogue, output_path, project_name, description, meta_info):
+    """
+    Cria um arquivo DOCX formatado com o diálogo, usando o template fornecido
+    e adicionando as informações solicitadas na página inicial.
+    dialogue pode ser uma lista de Utterance, uma lista de linhas ou o texto completo
+    """
+    try:
+        # Template pré-carregado e já sem as falas de exemplo
+        _, template_bytes = load_docx_template()
+        
+        # Garantir que o texto esteja em UTF-8 (falas estruturadas já estão prontas)
         if isinstance(dialogue, list):
-            dialogue = [text.encode('utf-8').decode('utf-8') if isinstance(text, str) else str(text) for text in dialogue]
+            dialogue = [text if isinstance(text, Utterance) else
+                        text.encode('utf-8').decode('utf-8') if isinstance(text, str) else str(text)
+                        for text in dialogue]
         elif isinstance(dialogue, str):
             dialogue = dialogue.encode('utf-8').decode('utf-8')
         
@@ -53,20 +183,13 @@ def create_docx(dialogue, output_path, project_name, description, meta_info):
         if isinstance(dialogue, str):
             dialogue = dialogue.split('\n\n')
         
-        # Usar o template como base
-        use_template = os.path.exists(template_path)
-        
-        if use_template:
-            try:
-                # Criar uma cópia do template
-                shutil.copy2(template_path, output_path)
-                doc = Document(output_path)
-            except Exception as e:
-                logger.warning(f"Erro ao usar template: {e}. Criando documento do zero.")
-                use_template = False
-                doc = Document()
-        else:
-            # Se o template não existir, criar documento do zero
+        # Usar o template como base, clonado em memória (sem copiar o arquivo)
+        use_template = True
+        try:
+            doc = Document(BytesIO(template_bytes))
+        except Exception as e:
+            logger.warning(f"Erro ao usar template: {e}. Criando documento do zero.")
+            use_template = False
             doc = Document()
         
         # Obter a data atual para o cabeçalho
@@ -77,19 +200,6 @@ def create_docx(dialogue, output_path, project_name, description, meta_info):
         
         if use_template:
             try:
-                # Limpar falas de exemplo do template
-                paragraphs_to_remove = []
-                for i, paragraph in enumerate(doc.paragraphs):
-                    if i < len(doc.paragraphs) and ("[Speaker" in paragraph.text or "Speaker" in paragraph.text):
-                        paragraphs_to_remove.append(paragraph)
-                
-                for paragraph in paragraphs_to_remove:
-                    try:
-                        p = paragraph._element
-                        p.getparent().remove(p)
-                    except Exception as e:
-                        logger.warning(f"Erro ao remover parágrafo: {e}")
-                
                 # Inserir os metadados no início do documento (após o título)
                 # Método mais robusto que não depende de encontrar parágrafo específico
                 idx = 0
@@ -179,6 +289,14 @@ def create_docx(dialogue, output_path, project_name, description, meta_info):
         
         # Adicionar cada bloco de diálogo (comum a ambos os métodos)
         for block in dialogue:
+            if isinstance(block, Utterance):
+                p = doc.add_paragraph()
+                speaker_run = p.add_run(f"{block.speaker}:")
+                speaker_run.bold = True
+                speaker_run.underline = True
+                p.add_run(f" {block.text.strip()}")
+                continue
+            
             if not block.strip():
                 continue
                 
@@ -211,7 +329,7 @@ def create_docx(dialogue, output_path, project_name, description, meta_info):
             doc.add_heading("Depoimento", 1)
             if isinstance(dialogue, list):
                 for block in dialogue:
-                    doc.add_paragraph(block)
+                    doc.add_paragraph(block.as_line() if isinstance(block, Utterance) else block)
             elif isinstance(dialogue, str):
                 for block in dialogue.split('\n\n'):
                     doc.add_paragraph(block)
@@ -223,6 +341,13 @@ def create_docx(dialogue, output_path, project_name, description, meta_info):
             logger.error(f"Falha no fallback para criar DOCX: {fallback_error}")
             return None
 
+def highlight_snippet(snippet):
+    """
+    Converte um trecho da busca em HTML seguro, destacando os termos encontrados com <mark>
+    """
+    escaped = str(escape(snippet or ""))
+    return Markup(escaped.replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>"))
+
 def create_txt(text, output_file):
     """
     Cria um arquivo de texto simples
@@ -265,6 +390,9 @@ def format_file_size(size_bytes):
     Formata o tamanho do arquivo para exibição
     """
     try:
+        # Garantir que size_bytes seja um número
+        size_bytes = float(size_bytes) if size_bytes is not None else 0
+        
         # Converter bytes para formato legível
         for unit in ['B', 'KB', 'MB', 'GB']:
             if size_bytes < 1024.0:
@@ -282,6 +410,11 @@ def format_timestamp(timestamp):
         if not timestamp:
             return "Data desconhecida"
         
+        # Epoch (segundos), formato gravado no banco
+        if isinstance(timestamp, (int, float)):
+            from datetime import datetime
+            return datetime.fromtimestamp(timestamp).strftime("%d/%m/%Y %H:%M")
+        
         # Se for uma string de data do SQLite
         if isinstance(timestamp, str):
             from datetime import datetime
@@ -299,12 +432,29 @@ def format_timestamp(timestamp):
     except Exception:
         return "Data desconhecida"
     
+def date_filter_epoch(date_value, end_of_day=False):
+    """
+    Converte uma data do filtro (AAAA-MM-DD, hora local) no epoch do início do dia
+    ou do último segundo do dia; retorna None se estiver vazia ou inválida
+    """
+    if not date_value:
+        return None
+    from datetime import datetime, timedelta
+    try:
+        day = datetime.strptime(date_value, "%Y-%m-%d")
+    except ValueError:
+        return None
+    if end_of_day:
+        return int((day + timedelta(days=1)).timestamp()) - 1
+    return int(day.timestamp())
+
 def format_duration(seconds):
     """
     Formata duração em segundos para exibição (hh:mm:ss)
     """
     try:
-        seconds = int(seconds)
+        # Garantir que seconds seja um número inteiro
+        seconds = int(float(seconds)) if seconds is not None else 0
         
         if seconds < 60:
             return f"{seconds} seg"
@@ -0,0 +1,212 @@
+import time
+import bisect
+import logging
+import threading
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Limites dos histogramas de duração (segundos): de milissegundos (etapas locais)
+# a horas (transcrição de áudios longos)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Fator de tempo real: segundos de processamento por segundo de áudio
+REALTIME_FACTOR_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Labels de {self.name} devem ser {self.labelnames}, recebido {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """
+    Contador monotônico (ex.: jobs concluídos, erros por etapa)
+    """
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(_Metric):
+    """
+    Valor instantâneo (ex.: jobs na fila)
+    """
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    render = Counter.render
+
+class Histogram(_Metric):
+    """
+    Distribuição de valores em faixas cumulativas, com soma e contagem
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(float(total))}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    """
+    Conjunto de métricas expostas em /metrics
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica já registrada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """
+        Todas as métricas no formato de texto do Prometheus (versão 0.0.4)
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "transcription_stage_seconds", "Duração de cada etapa do processamento", ["stage"]))
+STAGE_TOTAL = REGISTRY.register(Counter(
+    "transcription_stage_total", "Execuções de cada etapa, por resultado", ["stage", "status"]))
+JOBS_TOTAL = REGISTRY.register(Counter(
+    "transcription_jobs_total", "Jobs de transcrição finalizados, por resultado", ["status"]))
+JOB_SECONDS = REGISTRY.register(Histogram(
+    "transcription_job_seconds", "Duração total dos jobs de transcrição"))
+JOBS_QUEUED = REGISTRY.register(Gauge(
+    "transcription_jobs_queued", "Jobs aguardando um worker"))
+AUDIO_SECONDS_TOTAL = REGISTRY.register(Counter(
+    "transcription_audio_seconds_total", "Segundos de áudio transcritos"))
+REALTIME_FACTOR = REGISTRY.register(Histogram(
+    "transcription_realtime_factor", "Segundos de processamento por segundo de áudio (job inteiro)",
+    buckets=REALTIME_FACTOR_BUCKETS))
+BACKEND_SECONDS = REGISTRY.register(Histogram(
+    "transcription_backend_seconds",
+    "Latência do serviço de transcrição por fase (upload, fila e processamento na AssemblyAI)",
+    ["backend", "phase"]))
+BACKEND_REQUESTS = REGISTRY.register(Counter(
+    "transcription_backend_requests_total", "Pedidos ao serviço de transcrição, por resultado",
+    ["backend", "status"]))
+UPLOAD_BYTES_SAVED = REGISTRY.register(Counter(
+    "transcription_upload_bytes_saved_total", "Bytes a menos enviados ao serviço de transcrição pela conversão para voz"))
+
+class span:
+    """
+    Mede uma etapa: `with span("probe"):` registra a duração no histograma
+    transcription_stage_seconds e conta a execução (ok ou error) em
+    transcription_stage_total. A duração fica em .duration ao sair do bloco
+    """
+    __slots__ = ('stage', 'start', 'duration')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(self.duration, stage=self.stage)
+        STAGE_TOTAL.inc(stage=self.stage, status="error" if exc_type else "ok")
+        return False
+
+def observe_job(status, seconds):
+    """
+    Registra o fim de um job: resultado e duração total
+    """
+    JOBS_TOTAL.inc(status=status)
+    JOB_SECONDS.observe(seconds)
+
+def observe_realtime_factor(processing_seconds, audio_seconds):
+    """
+    Registra os segundos de áudio transcritos e o fator de tempo real do job
+    """
+    if audio_seconds and audio_seconds > 0:
+        AUDIO_SECONDS_TOTAL.inc(audio_seconds)
+        REALTIME_FACTOR.observe(processing_seconds / audio_seconds)
+
+def render_metrics():
+    """
+    Texto do endpoint /metrics
+    """
+    return REGISTRY.render()
@@ -0,0 +1,173 @@
+import io
+import os
+import re
+import hmac
+import time
+import pstats
+import random
+import logging
+import cProfile
+from flask import g, request, session
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Segredo do administrador: com ele no cabeçalho X-Profile-Token, a requisição é perfilada.
+# Nunca na URL (iria para logs, histórico e Referer). Sem segredo configurado, só a amostragem funciona
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+# Fração das requisições perfiladas por amostragem (0 = desligado, 0.01 = 1%)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# Pasta dos perfis (.prof, formato pstats) e quantos manter (os mais lentos ficam)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+
+# Prefixos nunca perfilados (arquivos estáticos, métricas e a própria página de perfis)
+PROFILE_SKIP_PREFIXES = ("/static/", "/metrics", "/profiles")
+
+# Nome do arquivo: método.caminho.duração.instante.prof (como o ProfilerMiddleware do Werkzeug)
+_PROFILE_NAME = re.compile(r"^(?P<method>[A-Z]+)\.(?P<path>.*)\.(?P<elapsed>\d+)ms\.(?P<time>\d+)\.prof$")
+
+def check_profile_token(token):
+    """
+    Compara o segredo informado com PROFILE_TOKEN em tempo constante
+    """
+    return bool(PROFILE_TOKEN) and hmac.compare_digest((token or "").encode(), PROFILE_TOKEN.encode())
+
+def is_admin_request():
+    """
+    A requisição traz o segredo do administrador no cabeçalho X-Profile-Token
+    """
+    return check_profile_token(request.headers.get("X-Profile-Token"))
+
+def is_profile_admin():
+    """
+    Acesso à página de perfis: cabeçalho ou sessão aberta com o segredo (login_profile_admin)
+    """
+    return bool(PROFILE_TOKEN) and (is_admin_request() or session.get('profile_admin') is True)
+
+def login_profile_admin(token):
+    """
+    Abre a sessão de administrador da página de perfis, se o segredo estiver correto
+    """
+    if not check_profile_token(token):
+        return False
+    session['profile_admin'] = True
+    return True
+
+def _should_profile():
+    if request.path.startswith(PROFILE_SKIP_PREFIXES):
+        return False
+    if is_admin_request():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def _profile_filename(method, path, elapsed_ms, timestamp):
+    safe_path = re.sub(r"[^A-Za-z0-9_-]+", ".", path.strip("/")) or "root"
+    return f"{method}.{safe_path[:120]}.{elapsed_ms:.0f}ms.{timestamp:.0f}.prof"
+
+def start_request_profile():
+    """
+    before_request: liga o cProfile para esta requisição, se pedido ou sorteado
+    """
+    if not _should_profile():
+        return
+    profiler = cProfile.Profile()
+    g.profiler = profiler
+    g.profile_start = time.perf_counter()
+    profiler.enable()
+
+def finish_request_profile(response):
+    """
+    after_request: desliga o profiler, grava o perfil e informa o arquivo no cabeçalho
+    X-Profile-File
+    """
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    elapsed_ms = (time.perf_counter() - g.pop('profile_start')) * 1000
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        filename = _profile_filename(request.method, request.path, elapsed_ms, time.time() * 1000)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+        response.headers['X-Profile-File'] = filename
+        logger.info(f"Perfil de {request.method} {request.path} gravado ({elapsed_ms:.0f} ms): {filename}")
+        prune_profiles()
+    except Exception as e:
+        logger.error(f"Erro ao gravar o perfil da requisição: {e}")
+    return response
+
+def discard_request_profile(exception=None):
+    """
+    teardown_request: desliga o profiler se a requisição terminou com erro não tratado
+    """
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+def list_profiles(limit=None):
+    """
+    Perfis gravados, do mais lento para o mais rápido
+    """
+    profiles = []
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+
+    for name in names:
+        match = _PROFILE_NAME.match(name)
+        if not match:
+            continue
+        profiles.append({
+            'filename': name,
+            'method': match.group('method'),
+            # O nome guarda o caminho com "/" trocado por "." (aproximado)
+            'path': "/" if match.group('path') == "root" else "/" + match.group('path').replace(".", "/"),
+            'elapsed_ms': int(match.group('elapsed')),
+            'captured_at': int(match.group('time')) / 1000,
+        })
+    profiles.sort(key=lambda profile: profile['elapsed_ms'], reverse=True)
+    return profiles[:limit] if limit else profiles
+
+def prune_profiles():
+    """
+    Mantém só os PROFILE_KEEP perfis mais lentos
+    """
+    for profile in list_profiles()[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, profile['filename']))
+        except OSError:
+            pass
+
+def profile_path(filename):
+    """
+    Caminho de um perfil gravado, ou None se o nome não for de um perfil existente
+    """
+    if not _PROFILE_NAME.match(filename) or os.path.basename(filename) != filename:
+        return None
+    path = os.path.join(PROFILE_DIR, filename)
+    return path if os.path.exists(path) else None
+
+def profile_summary(filename, limit=40, sort_by="cumulative"):
+    """
+    Resumo em texto (pstats) das funções mais caras do perfil
+    """
+    path = profile_path(filename)
+    if path is None:
+        return None
+    stream = io.StringIO()
+    stats = pstats.Stats(path, stream=stream)
+    stats.strip_dirs().sort_stats(sort_by).print_stats(limit)
+    return stream.getvalue()
+
+def init_profiling(app):
+    """
+    Registra os hooks de profiling na aplicação
+    """
+    app.before_request(start_request_profile)
+    app.after_request(finish_request_profile)
+    app.teardown_request(discard_request_profile)